@@ -1,24 +1,37 @@
 import os
+import threading
 # from langchain_google_genai import ChatGoogleGenerativeAI 
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import SystemMessage, HumanMessage
 from typing import Annotated, List
-from .tools import check_medicine_stock, place_order, get_patient_history, check_low_stock_alerts, SessionLocal, search_knowledge_base, check_drug_interaction
+from .tools import check_medicine_stock, place_order, place_cart_order, get_patient_history, check_low_stock_alerts, SessionLocal, search_knowledge_base, check_drug_interaction
 from .models import OrderHistory, Medicine
-from datetime import datetime
+from .refills import due_refills, ensure_last_purchases
+from datetime import date
 
-from langchain_ollama import ChatOllama
+# The model client and graph are built on first use (or by the startup warmup, see warmup.py):
+# importing langgraph/langchain_ollama and opening the checkpointer is most of the API's import time.
+_llm = None
+_graph = None
+_lock = threading.Lock()
 
-# Initialize LLM
-# Using local Ollama model (llama3)
-llm = ChatOllama(
-    model="llama3.1",
-    temperature=0,
-)
+def get_llm():
+    """Shared chat model client (local Ollama llama3.1)."""
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                from langchain_ollama import ChatOllama
+                from .llm_metrics import LLMMetricsCallback
+                from .scheduler import scheduled
+                # Calls wait for an admission slot (see scheduler.py)
+                _llm = scheduled(ChatOllama)(
+                    model="llama3.1",
+                    temperature=0,
+                    callbacks=[LLMMetricsCallback("llama3.1")],
+                )
+    return _llm
 
 # Define Tools
-tools = [check_medicine_stock, place_order, get_patient_history, check_low_stock_alerts, search_knowledge_base, check_drug_interaction]
+tools = [check_medicine_stock, place_order, place_cart_order, get_patient_history, check_low_stock_alerts, search_knowledge_base, check_drug_interaction]
 
 # System Prompt
 SYSTEM_PROMPT = """You are an Expert Pharmacist Agent for 'AntiGravity Pharmacy'.
@@ -30,6 +43,8 @@ RULES & SAFETY:
 3. IF stock is low or empty, apologize and suggest alternatives or say it's out of stock.
 4. When placing an order, use `place_order`. You need the patient_id (ask the user for their name/ID if not known) and quantity.
 5. Be professional, empathetic, and concise.
+6. To check interactions, call `check_drug_interaction` ONCE with the full list of medicines involved (e.g. the whole basket), not pair by pair.
+7. When the user orders more than one medicine, call `place_cart_order` ONCE with all items instead of `place_order` per item.
 
 COMMUNICATION STYLE:
 - **Direct Answers**: Do NOT say "Based on the tool search" or "The tool says". Just give the answer naturally.
@@ -46,44 +61,43 @@ CHAIN OF THOUGHT:
 - "Placing order..." -> Call tool.
 """
 
-# Create the graph
-memory = MemorySaver()
-pharmacy_graph = create_react_agent(
-    llm, 
-    tools, 
-    prompt=SYSTEM_PROMPT,
-    checkpointer=memory
-)
+def get_pharmacy_graph():
+    """The ReAct agent graph, compiled once per process."""
+    global _graph
+    if _graph is None:
+        llm = get_llm()
+        with _lock:
+            if _graph is None:
+                from langgraph.prebuilt import create_react_agent
+                from .checkpointer import get_checkpointer
+                from .context import PharmacyState, build_context_hook
+                # Conversation state lives in a shared SQLite file by default (see checkpointer.py),
+                # so follow-up turns can land on any uvicorn worker.
+                _graph = create_react_agent(
+                    llm,
+                    tools,
+                    prompt=SYSTEM_PROMPT,
+                    checkpointer=get_checkpointer(),
+                    # Sends only the recent turns + a rolling summary to the model (see context.py)
+                    state_schema=PharmacyState,
+                    pre_model_hook=build_context_hook(SYSTEM_PROMPT),
+                )
+    return _graph
 
 def run_predictive_check():
     """
-    Scans order history to find patients who might need a refill.
-    Logic: If (Quantity / Dosage_per_day) days have passed + margin.
-    For this mock, we'll just check if the last purchase was > 25 days ago and stock > 0.
+    Finds patients who might need a refill.
+    Logic: the supply of the last purchase (Quantity / doses per day) runs out within a few days of today.
+    Reads the incrementally maintained last_purchases aggregate (see refills.py) instead of the full history.
     """
     db = SessionLocal()
-    # simplifed logic: find last purchase for each user/med
-    # In a real app we'd query simpler.
-    orders = db.query(OrderHistory).all()
-    
-    alerts = []
-    today = datetime.now()
-    
-    # helper to track last purchase
-    user_last_purchase = {} # key: "user|med", value: date
-    
-    for order in orders:
-        key = f"{order.patient_id}|{order.medicine}"
-        p_date = datetime.strptime(order.date_purchased, "%Y-%m-%d")
-        if key not in user_last_purchase or p_date > user_last_purchase[key]:
-            user_last_purchase[key] = p_date
-            
-    # Check for refill needs (assuming 30 day supply roughly)
-    for key, last_date in user_last_purchase.items():
-        days_diff = (today - last_date).days
-        if 25 <= days_diff <= 35:
-            user, med = key.split("|")
-            alerts.append(f"Patient {user} purchased {med} {days_diff} days ago. Refill might be needed.")
-            
-    db.close()
-    return alerts
+    try:
+        ensure_last_purchases(db)
+        today = date.today()
+        alerts = []
+        for p in due_refills(db, today):
+            days_diff = (today - p.last_purchased).days
+            alerts.append(f"Patient {p.patient_id} purchased {p.medicine} {days_diff} days ago. Refill might be needed (supply runs out {p.refill_due.isoformat()}).")
+        return alerts
+    finally:
+        db.close()
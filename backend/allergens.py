@@ -0,0 +1,178 @@
+import re
+from sqlalchemy import event, inspect
+from .models import Medicine, Patient, PatientAllergy, MedicineAllergen
+from .interactions import CLASS_MEMBERS
+
+# Allergy screening through normalized relations.
+# patient_allergies holds each patient's allergy terms; medicine_allergens holds, per SKU, its ingredient
+# and every drug class that ingredient belongs to (Amoxicillin -> amoxicillin, penicillin, beta-lactam).
+# A safety check is then one indexed join of the two tables, for one medicine or a whole basket.
+# Both tables are kept in sync with patients/medicines through ORM events; bulk imports call rebuild_allergen_index.
+
+# Ingredient -> allergy / cross-reactivity classes
+INGREDIENT_CLASSES = {
+    "amoxicillin": {"penicillin", "beta-lactam"},
+    "ampicillin": {"penicillin", "beta-lactam"},
+    "penicillin": {"penicillin", "beta-lactam"},
+    "dicloxacillin": {"penicillin", "beta-lactam"},
+    "piperacillin": {"penicillin", "beta-lactam"},
+    "cephalexin": {"cephalosporin", "beta-lactam"},
+    "cefuroxime": {"cephalosporin", "beta-lactam"},
+    "ceftriaxone": {"cephalosporin", "beta-lactam"},
+    "azithromycin": {"macrolide"},
+    "clarithromycin": {"macrolide"},
+    "erythromycin": {"macrolide"},
+    "ciprofloxacin": {"fluoroquinolone"},
+    "levofloxacin": {"fluoroquinolone"},
+    "doxycycline": {"tetracycline"},
+    "tetracycline": {"tetracycline"},
+    "sulfamethoxazole": {"sulfonamide"},
+    "sulfasalazine": {"sulfonamide"},
+    "aspirin": {"nsaid", "salicylate"},
+    "diclofenac": {"nsaid"},
+    "meloxicam": {"nsaid"},
+    "celecoxib": {"nsaid", "sulfonamide"},
+    "codeine": {"opioid"},
+    "tramadol": {"opioid"},
+    "morphine": {"opioid"},
+    "oxycodone": {"opioid"},
+    "paracetamol": {"acetaminophen"},
+}
+
+# Allergy spellings -> canonical term
+ALLERGEN_SYNONYMS = {
+    "sulfa": "sulfonamide",
+    "sulfa drug": "sulfonamide",
+    "sulpha": "sulfonamide",
+    "sulfonamide antibiotic": "sulfonamide",
+    "penicillin antibiotic": "penicillin",
+    "beta lactam": "beta-lactam",
+    "nsaids": "nsaid",
+    "anti-inflammatory": "nsaid",
+    "acetaminophen": "acetaminophen",
+    "tylenol": "acetaminophen",
+    "opiate": "opioid",
+}
+
+_NONE = {"", "none", "nil", "n/a", "na", "no known allergies", "nka", "nkda", "unknown"}
+_STRENGTH = re.compile(r"\d")
+_SPLIT = re.compile(r"[,;/]| and ")
+
+
+def normalize_allergen(text: str) -> str:
+    words = [w for w in re.sub(r"[^a-z0-9\- ]", " ", (text or "").lower()).split() if not _STRENGTH.search(w)]
+    if words and len(words[-1]) > 3 and words[-1].endswith("s") and not words[-1].endswith("ss"):
+        words[-1] = words[-1][:-1]
+    term = " ".join(words)
+    return ALLERGEN_SYNONYMS.get(term, term)
+
+
+def parse_allergies(allergies: str) -> set:
+    """'Penicillin, Sulfa Drugs, Peanuts' -> {'penicillin', 'sulfonamide', 'peanut'}."""
+    terms = {normalize_allergen(part) for part in _SPLIT.split(allergies or "")}
+    return {t for t in terms if t not in _NONE}
+
+
+def _classes_for(ingredient: str) -> set:
+    classes = set(INGREDIENT_CLASSES.get(ingredient, ()))
+    classes.update(cls for cls, members in CLASS_MEMBERS.items() if ingredient in members)
+    return classes
+
+
+def medicine_allergens(name: str) -> dict:
+    """allergen term -> ingredient for a SKU name ('Amoxicillin 500mg' -> {'amoxicillin': .., 'penicillin': ..})."""
+    term = normalize_allergen(name)
+    words = term.split()
+    if not words:
+        return {}
+    # Full name, leading word ("Insulin Glargine" -> insulin) and any known ingredient in a combination product
+    ingredients = {term, words[0]}
+    ingredients.update(w for w in words if _classes_for(w))
+    terms = {}
+    for ingredient in sorted(ingredients):
+        terms.setdefault(ingredient, ingredient)
+        for cls in _classes_for(ingredient):
+            terms.setdefault(cls, ingredient)
+    return terms
+
+
+def _medicine_rows(medicine_id: int, name: str) -> list:
+    return [{"medicine_id": medicine_id, "allergen": a, "ingredient": i} for a, i in medicine_allergens(name).items()]
+
+
+def _patient_rows(patient_id: int, allergies: str) -> list:
+    return [{"patient_id": patient_id, "allergen": a} for a in sorted(parse_allergies(allergies))]
+
+
+def _sync(connection, table, key_column, key, rows):
+    connection.execute(table.delete().where(key_column == key))
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def _changed(target, attr: str) -> bool:
+    return inspect(target).attrs[attr].history.has_changes()
+
+
+@event.listens_for(Medicine, "after_insert")
+@event.listens_for(Medicine, "after_update")
+def _sync_medicine(mapper, connection, target):
+    # Stock updates are frequent; only a new or renamed SKU changes its allergen terms
+    if _changed(target, "name"):
+        _sync(connection, MedicineAllergen.__table__, MedicineAllergen.__table__.c.medicine_id, target.id,
+              _medicine_rows(target.id, target.name))
+
+
+@event.listens_for(Patient, "after_insert")
+@event.listens_for(Patient, "after_update")
+def _sync_patient(mapper, connection, target):
+    if _changed(target, "allergies"):
+        _sync(connection, PatientAllergy.__table__, PatientAllergy.__table__.c.patient_id, target.id,
+              _patient_rows(target.id, target.allergies))
+
+
+@event.listens_for(Medicine, "after_delete")
+def _drop_medicine(mapper, connection, target):
+    _sync(connection, MedicineAllergen.__table__, MedicineAllergen.__table__.c.medicine_id, target.id, [])
+
+
+@event.listens_for(Patient, "after_delete")
+def _drop_patient(mapper, connection, target):
+    _sync(connection, PatientAllergy.__table__, PatientAllergy.__table__.c.patient_id, target.id, [])
+
+
+def rebuild_allergen_index(db) -> int:
+    """Recomputes both relations from scratch (after bulk imports). Returns the number of medicine rows."""
+    db.query(MedicineAllergen).delete(synchronize_session=False)
+    db.query(PatientAllergy).delete(synchronize_session=False)
+    medicine_rows = [r for med_id, name in db.query(Medicine.id, Medicine.name) for r in _medicine_rows(med_id, name)]
+    patient_rows = [r for pid, allergies in db.query(Patient.id, Patient.allergies) for r in _patient_rows(pid, allergies)]
+    if medicine_rows:
+        db.execute(MedicineAllergen.__table__.insert(), medicine_rows)
+    if patient_rows:
+        db.execute(PatientAllergy.__table__.insert(), patient_rows)
+    db.commit()
+    return len(medicine_rows)
+
+
+def ensure_allergen_index(db):
+    """Backfills the index if it is empty but medicines exist (e.g. first start after upgrading)."""
+    if db.query(MedicineAllergen.id).first() is None and db.query(Medicine.id).first() is not None:
+        rebuild_allergen_index(db)
+
+
+def allergy_conflicts(db, patient_id: int, medicine_ids) -> list:
+    """
+    Screens medicines against a patient's allergies with a single indexed join.
+    Returns [(medicine_id, allergen, ingredient)]; empty means safe.
+    """
+    medicine_ids = list(medicine_ids)
+    if not medicine_ids:
+        return []
+    return (
+        db.query(MedicineAllergen.medicine_id, MedicineAllergen.allergen, MedicineAllergen.ingredient)
+        .join(PatientAllergy, PatientAllergy.allergen == MedicineAllergen.allergen)
+        .filter(PatientAllergy.patient_id == patient_id, MedicineAllergen.medicine_id.in_(medicine_ids))
+        .order_by(MedicineAllergen.medicine_id, MedicineAllergen.allergen)
+        .all()
+    )
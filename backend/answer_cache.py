@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Semantic cache for general knowledge answers ("side effects of ibuprofen", "can I take aspirin with warfarin").
+# Questions are matched on embedding similarity, so rephrasings reuse the same answer, but only between
+# questions naming the same drugs ("aspirin with warfarin" never answers "ibuprofen with warfarin").
+# Only non-personal, non-transactional questions are looked up, and an answer is only stored when the
+# agent used nothing but knowledge tools for it (no stock, order or patient lookups).
+# Entries are dropped when the knowledge base is re-ingested, in this process or by the ingest CLI.
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# How long the knowledge base version is trusted before data_versions is read again
+KB_VERSION_TTL_SECONDS = float(os.getenv("KB_VERSION_TTL_SECONDS", "5"))
+
+_kb_cached = None  # (version, monotonic read time)
+
+# Tools whose output doesn't depend on inventory or on who is asking
+KNOWLEDGE_TOOLS = {"search_knowledge_base", "check_drug_interaction"}
+
+_KNOWLEDGE = re.compile(
+    r"side effect|interact|contraindicat|take .+ with|mix .+ with|combine|together|safe|dos(e|age)|"
+    r"what is|what are|what does|how does|used for|overdose|pregnan|alcohol|warning|precaution"
+)
+# Anything about the asker, a patient, an order or the shop's inventory is never cached
+_PERSONAL = re.compile(
+    r"\b(my|me|mine|i'm|i am|i've|i have|we|our|us)\b|allerg|patient|history|\border|\bbuy|bought|purchase|"
+    r"stock|price|cost|available|refill|deliver|prescription|\buser\s?\d+\b|\bid\b"
+)
+# Follow-ups like "what about its side effects?" depend on the conversation
+_CONTEXTUAL = re.compile(r"\b(it|its|it's|that|this|those|these|they|them|same|above|else)\b")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().replace("’", "'").split()).rstrip("?!. ")
+
+
+def is_cacheable_question(message: str) -> bool:
+    text = _normalize(message or "")
+    return bool(text) and bool(_KNOWLEDGE.search(text)) and not _PERSONAL.search(text) and not _CONTEXTUAL.search(text)
+
+
+def uses_only_knowledge_tools(tool_names) -> bool:
+    return all(name in KNOWLEDGE_TOOLS for name in tool_names)
+
+
+def _drug_terms(question: str) -> frozenset:
+    from .interactions import get_interaction_index
+    return get_interaction_index().mentions(question)
+
+
+def _kb_version():
+    """
+    Knowledge base version, bumped by every ingestion that changes the vector store (including the ingest CLI).
+    Kept in memory for KB_VERSION_TTL_SECONDS so lookups don't query data_versions; ingestion in this
+    process expires it at once (expire_kb_version), the CLI is picked up once the TTL runs out.
+    """
+    global _kb_cached
+    cached = _kb_cached
+    if cached is not None and time.monotonic() - cached[1] < KB_VERSION_TTL_SECONDS:
+        return cached[0]
+    from .database import SessionLocal
+    from .ingest_kb import KB_VERSION_NAMESPACE
+    from .read_cache import get_versions
+    db = SessionLocal()
+    try:
+        version = get_versions(db, (KB_VERSION_NAMESPACE,))[0]
+    except Exception:
+        version = None
+    finally:
+        db.close()
+    _kb_cached = (version, time.monotonic())
+    return version
+
+
+def expire_kb_version():
+    global _kb_cached
+    _kb_cached = None
+
+
+class SemanticAnswerCache:
+    """LRU + TTL cache of (question embedding -> answer), looked up by cosine similarity."""
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL_SECONDS,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # key -> (unit vector, answer, created, drug terms)
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self._version = None  # read on first use (the database may not exist yet at import)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        from .rag import get_embeddings
+        vector = np.asarray(get_embeddings().embed_query(" ".join(question.split())), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._version = version
+
+    def _expire(self, now: float):
+        for key in [k for k, (_, _, created, _) in self._entries.items() if now - created > self.ttl]:
+            del self._entries[key]
+
+    def get(self, question: str):
+        """Returns (answer, similarity) for the closest cached question naming the same drugs, if above the threshold, else (None, score)."""
+        vector = self._embed(question)
+        terms = _drug_terms(question)
+        version = _kb_version()
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            self._expire(now)
+            keys = [k for k, entry in self._entries.items() if entry[3] == terms]
+            if not keys:
+                self.misses += 1
+                return None, 0.0
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None, score
+            self._entries.move_to_end(keys[best])
+            self.hits += 1
+            return self._entries[keys[best]][1], score
+
+    def put(self, question: str, answer: str):
+        if not answer:
+            return
+        vector = self._embed(question)
+        terms = _drug_terms(question)
+        version = _kb_version()
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_key] = (vector, answer, time.time(), terms)
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        version = _kb_version()
+        with self._lock:
+            self._entries.clear()
+            self._version = version
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = SemanticAnswerCache()
+
+
+def lookup(message: str):
+    """Cached answer for a general knowledge question, or None."""
+    if not ANSWER_CACHE_ENABLED or not is_cacheable_question(message):
+        return None
+    try:
+        answer, _ = answer_cache.get(message)
+        return answer
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None
+
+
+def store(message: str, answer: str, tool_names):
+    """Caches an agent answer if the question is general and only knowledge tools were used."""
+    if not ANSWER_CACHE_ENABLED or not is_cacheable_question(message) or not uses_only_knowledge_tools(tool_names):
+        return
+    try:
+        answer_cache.put(message, answer)
+    except Exception as e:
+        print(f"Answer cache store failed: {e}")
@@ -0,0 +1,282 @@
+import io
+import os
+import json
+import time
+import queue
+import uuid
+import zipfile
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, or_
+from .database import SessionLocal, engine
+from .models import PrescriptionJob, PrescriptionJobItem
+from .vision import analyze_prescription_image, parse_prescription_json
+from .scheduler import llm_request
+
+# Batch prescription processing.
+# Uploaded images are written to disk and tracked in prescription_jobs / prescription_job_items,
+# so a restart resumes unfinished items. A small pool of worker threads feeds them through
+# analyze_prescription_image (which is itself cached by content hash).
+# Every uvicorn worker runs its own pool over the same tables, so an item is only processed after a
+# conditional UPDATE claims it (pending -> running with a lease). Items whose lease ran out (their
+# worker died) are reclaimed by whichever process notices first.
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_LEASE_SECONDS = float(os.getenv("BATCH_LEASE_SECONDS", "900"))
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(os.path.dirname(__file__), "../data/prescription_jobs"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".heic")
+
+_queue = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _expand_upload(filename: str, contents: bytes):
+    """Yields (filename, bytes) for an image, or for every image inside a zip."""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(contents)) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if not info.is_dir() and name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith("."):
+                    yield name, zf.read(info)
+    else:
+        yield filename, contents
+
+
+def create_job(uploads) -> PrescriptionJob:
+    """
+    Stores the images of a batch and queues them. uploads: iterable of (filename, bytes).
+    Returns the job row.
+    """
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(BATCH_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    db = SessionLocal()
+    try:
+        job = PrescriptionJob(id=job_id, status="queued", created_at=datetime.utcnow())
+        items = []
+        for filename, contents in uploads:
+            for name, data in _expand_upload(filename or "upload", contents):
+                path = os.path.join(job_dir, f"{len(items):05d}_{name}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                items.append(PrescriptionJobItem(job_id=job_id, filename=name, image_path=path, status="pending"))
+        job.total = len(items)
+        if not items:
+            job.status = "completed"
+            job.finished_at = job.created_at
+        db.add(job)
+        db.add_all(items)
+        db.commit()
+        for item in items:
+            _queue.put(item.id)
+        db.refresh(job)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+def _claim(db, item_id: int):
+    """Marks the item running under a fresh lease if it is pending or its lease expired; returns the lease or None."""
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=BATCH_LEASE_SECONDS)
+    claimed = db.query(PrescriptionJobItem).filter(
+        PrescriptionJobItem.id == item_id,
+        or_(PrescriptionJobItem.status == "pending",
+            (PrescriptionJobItem.status == "running") & or_(PrescriptionJobItem.lease_until.is_(None),
+                                                           PrescriptionJobItem.lease_until < now)),
+    ).update({PrescriptionJobItem.status: "running", PrescriptionJobItem.lease_until: lease}, synchronize_session=False)
+    db.commit()
+    return lease if claimed == 1 else None
+
+
+def _process(item_id: int):
+    db = SessionLocal()
+    try:
+        # Another worker (thread or process) may have claimed it already
+        lease = _claim(db, item_id)
+        if lease is None:
+            return
+        item = db.query(PrescriptionJobItem).filter(PrescriptionJobItem.id == item_id).first()
+        db.query(PrescriptionJob).filter(PrescriptionJob.id == item.job_id, PrescriptionJob.started_at.is_(None)).update(
+            {PrescriptionJob.started_at: datetime.utcnow(), PrescriptionJob.status: "running"}, synchronize_session=False
+        )
+        db.commit()
+
+        try:
+            # Batch work yields the model to interactive requests and is never shed (see scheduler.py)
+            with open(item.image_path, "rb") as f, llm_request("batch", item.job_id):
+                data = parse_prescription_json(analyze_prescription_image(f.read()))
+            result, error = json.dumps(data), data.get("error")
+            # The model call itself failed (as opposed to returning unparseable text)
+            status = "failed" if "error" in data and "raw_text" not in data else "done"
+        except Exception as e:
+            result, error, status = None, str(e), "failed"
+        finished_at = datetime.utcnow()
+
+        # Only the holder of the current lease records the outcome, so the job counters are bumped once
+        recorded = db.query(PrescriptionJobItem).filter(
+            PrescriptionJobItem.id == item_id, PrescriptionJobItem.status == "running", PrescriptionJobItem.lease_until == lease
+        ).update({PrescriptionJobItem.status: status, PrescriptionJobItem.result: result, PrescriptionJobItem.error: error,
+                  PrescriptionJobItem.lease_until: None, PrescriptionJobItem.finished_at: finished_at},
+                 synchronize_session=False)
+        if recorded != 1:
+            db.rollback()
+            print(f"Batch item {item_id} was reclaimed after its lease expired; discarding this result.")
+            return
+        failed = status == "failed"
+        db.query(PrescriptionJob).filter(PrescriptionJob.id == item.job_id).update({
+            PrescriptionJob.done: PrescriptionJob.done + (0 if failed else 1),
+            PrescriptionJob.failed: PrescriptionJob.failed + (1 if failed else 0),
+        }, synchronize_session=False)
+        db.query(PrescriptionJob).filter(
+            PrescriptionJob.id == item.job_id,
+            PrescriptionJob.done + PrescriptionJob.failed >= PrescriptionJob.total,
+        ).update({PrescriptionJob.status: "completed", PrescriptionJob.finished_at: finished_at}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _worker():
+    while True:
+        item_id = _queue.get()
+        try:
+            _process(item_id)
+        except Exception as e:
+            print(f"Batch worker error on item {item_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def _unfinished(include_pending: bool) -> list:
+    """Ids of items whose lease has expired, plus (at startup) pending items."""
+    now = datetime.utcnow()
+    stale = (PrescriptionJobItem.status == "running") & or_(PrescriptionJobItem.lease_until.is_(None),
+                                                           PrescriptionJobItem.lease_until < now)
+    db = SessionLocal()
+    try:
+        condition = or_(PrescriptionJobItem.status == "pending", stale) if include_pending else stale
+        return [item_id for (item_id,) in db.query(PrescriptionJobItem.id).filter(condition).order_by(PrescriptionJobItem.id)]
+    finally:
+        db.close()
+
+
+def _reaper():
+    # Picks up items left running by a worker process that died after startup
+    while True:
+        time.sleep(BATCH_LEASE_SECONDS / 2)
+        try:
+            for item_id in _unfinished(include_pending=False):
+                _queue.put(item_id)
+        except Exception as e:
+            print(f"Batch reaper error: {e}")
+
+
+def _ensure_lease_column():
+    # Databases created before leases were added lack the column (create_all doesn't alter tables)
+    columns = {c["name"] for c in inspect(engine).get_columns(PrescriptionJobItem.__tablename__)}
+    if "lease_until" not in columns:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {PrescriptionJobItem.__tablename__} ADD COLUMN lease_until DATETIME")
+
+
+def start_batch_workers():
+    """Starts the worker threads and queues pending items and items whose lease expired."""
+    with _workers_lock:
+        if _workers:
+            return
+        _ensure_lease_column()
+        pending = _unfinished(include_pending=True)
+        for item_id in pending:
+            _queue.put(item_id)
+        if pending:
+            print(f"Resuming {len(pending)} unfinished prescription batch items.")
+        for i in range(BATCH_WORKERS):
+            t = threading.Thread(target=_worker, name=f"batch-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+        threading.Thread(target=_reaper, name="batch-reaper", daemon=True).start()
+
+
+def _throughput(job) -> float:
+    """Images per minute since the job started."""
+    if not job.started_at:
+        return 0.0
+    end = job.finished_at or datetime.utcnow()
+    minutes = max((end - job.started_at).total_seconds() / 60, 1e-6)
+    return round((job.done + job.failed) / minutes, 2)
+
+
+def item_to_dict(item) -> dict:
+    return {
+        "id": item.id,
+        "filename": item.filename,
+        "status": item.status,
+        "result": json.loads(item.result) if item.result else None,
+        "error": item.error,
+    }
+
+
+def job_to_dict(job, items=None) -> dict:
+    data = {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "done": job.done,
+        "failed": job.failed,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "images_per_minute": _throughput(job),
+    }
+    if items is not None:
+        data["items"] = [item_to_dict(i) for i in items]
+    return data
+
+
+def get_job(job_id: str, include_items: bool = True):
+    db = SessionLocal()
+    try:
+        job = db.query(PrescriptionJob).filter(PrescriptionJob.id == job_id).first()
+        if not job:
+            return None
+        items = None
+        if include_items:
+            items = db.query(PrescriptionJobItem).filter(PrescriptionJobItem.job_id == job_id).order_by(PrescriptionJobItem.id).all()
+        return job_to_dict(job, items)
+    finally:
+        db.close()
+
+
+def finished_items(job_id: str, exclude_ids=()) -> list:
+    """Finished items of a job, skipping ids already seen (items can finish out of order)."""
+    db = SessionLocal()
+    try:
+        items = db.query(PrescriptionJobItem).filter(
+            PrescriptionJobItem.job_id == job_id,
+            PrescriptionJobItem.status.in_(("done", "failed")),
+        ).order_by(PrescriptionJobItem.id).all()
+        return [item_to_dict(i) for i in items if i.id not in exclude_ids]
+    finally:
+        db.close()
+
+
+def batch_stats() -> dict:
+    """Queue depth and overall throughput across recent jobs."""
+    db = SessionLocal()
+    try:
+        jobs = db.query(PrescriptionJob).filter(PrescriptionJob.started_at.isnot(None)).order_by(
+            PrescriptionJob.created_at.desc()).limit(20).all()
+        processed = sum(j.done + j.failed for j in jobs)
+        minutes = sum(((j.finished_at or datetime.utcnow()) - j.started_at).total_seconds() for j in jobs) / 60
+        return {
+            "queue_depth": _queue.qsize(),
+            "workers": len(_workers),
+            "recent_jobs": len(jobs),
+            "images_per_minute": round(processed / minutes, 2) if minutes > 0 else 0.0,
+        }
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import ChangeEvent
+
+# Change feed for the admin dashboard.
+# Writers add ChangeEvent rows in the same transaction as the change itself (so the feed never shows
+# an order that was rolled back). Subscribers in this process are woken right after the commit;
+# writes from other workers are picked up by a short poll of the indexed id column.
+
+CHANGE_FEED_KEEP = int(os.getenv("CHANGE_FEED_KEEP", "10000"))
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1.0"))
+HEARTBEAT_SECONDS = 15
+PRUNE_EVERY = 1000
+BATCH_LIMIT = 500
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+
+
+def record_change(db, kind: str, payload: dict) -> ChangeEvent:
+    """Adds a change event to the current transaction; it is published when the transaction commits."""
+    change = ChangeEvent(kind=kind, payload=json.dumps(payload, default=str), created_at=datetime.utcnow())
+    db.add(change)
+    db.flush()
+    if change.id % PRUNE_EVERY == 0:
+        db.query(ChangeEvent).filter(ChangeEvent.id <= change.id - CHANGE_FEED_KEEP).delete(synchronize_session=False)
+    db.info["published_changes"] = True
+    return change
+
+
+@event.listens_for(Session, "after_commit")
+def _publish(session):
+    if session.info.pop("published_changes", False):
+        _wake_subscribers()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("published_changes", None)
+
+
+def _wake_subscribers():
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for loop, wakeup in subscribers:
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+def change_to_dict(change) -> dict:
+    return {"id": change.id, "type": change.kind, "data": json.loads(change.payload or "{}"), "at": change.created_at}
+
+
+def latest_change_id(db=None) -> int:
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        return db.query(ChangeEvent.id).order_by(ChangeEvent.id.desc()).limit(1).scalar() or 0
+    finally:
+        if own:
+            db.close()
+
+
+def changes_since(after_id: int, limit: int = BATCH_LIMIT) -> list:
+    db = SessionLocal()
+    try:
+        rows = db.query(ChangeEvent).filter(ChangeEvent.id > after_id).order_by(ChangeEvent.id).limit(limit).all()
+        return [change_to_dict(c) for c in rows]
+    finally:
+        db.close()
+
+
+async def follow_changes(after_id: int = None):
+    """
+    Async generator of change dicts committed after after_id (default: from now on).
+    Yields None as a heartbeat when nothing happened for HEARTBEAT_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    subscriber = (loop, wakeup)
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    try:
+        if after_id is None:
+            after_id = await asyncio.to_thread(latest_change_id)
+        idle = 0.0
+        while True:
+            wakeup.clear()
+            changes = await asyncio.to_thread(changes_since, after_id)
+            for change in changes:
+                after_id = change["id"]
+                yield change
+            if changes:
+                idle = 0.0
+                if len(changes) == BATCH_LIMIT:
+                    continue
+            elif idle >= HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield None
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=CHANGE_FEED_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                idle += CHANGE_FEED_POLL_SECONDS
+    finally:
+        with _subscribers_lock:
+            _subscribers.discard(subscriber)
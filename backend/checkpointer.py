@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Conversation state backends for the pharmacy graph.
+#   CHECKPOINTER_BACKEND=sqlite (default): durable, shared by every uvicorn worker on the host
+#   CHECKPOINTER_BACKEND=memory: per-process, for tests and one-off scripts
+# Idle threads are evicted after THREAD_TTL_SECONDS, and at most MAX_THREADS are kept (LRU).
+
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(os.path.dirname(__file__), "../data/checkpoints.sqlite"))
+THREAD_TTL_SECONDS = int(os.getenv("THREAD_TTL_SECONDS", str(7 * 24 * 3600)))
+MAX_THREADS = int(os.getenv("MAX_THREADS", "10000"))
+# Only the latest checkpoints are needed to resume a conversation; older ones are compacted away
+CHECKPOINTS_PER_THREAD = int(os.getenv("CHECKPOINTS_PER_THREAD", "2"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_SWEEP_INTERVAL", "300"))
+
+
+class EvictingSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver with thread activity tracking, TTL/LRU eviction and per-thread compaction.
+    Async methods run the sync ones in a worker thread, so the same instance serves
+    both /chat (invoke) and /chat/stream (astream).
+    """
+
+    def __init__(self, conn, ttl_seconds=THREAD_TTL_SECONDS, max_threads=MAX_THREADS,
+                 keep_checkpoints=CHECKPOINTS_PER_THREAD, sweep_interval=SWEEP_INTERVAL_SECONDS):
+        super().__init__(conn)
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.keep_checkpoints = keep_checkpoints
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_thread_activity_last_seen ON thread_activity (last_seen);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            self.sweep()
+        return result
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def sweep(self) -> dict:
+        """Evicts idle threads (TTL), the least recently used beyond max_threads, and compacts old checkpoints."""
+        self._last_sweep = time.monotonic()
+        with self.cursor(transaction=False) as cur:
+            expired = [r[0] for r in cur.execute(
+                "SELECT thread_id FROM thread_activity WHERE last_seen < ?", (time.time() - self.ttl_seconds,)
+            )]
+            overflow = [r[0] for r in cur.execute(
+                "SELECT thread_id FROM thread_activity ORDER BY last_seen DESC LIMIT -1 OFFSET ?", (self.max_threads,)
+            )]
+        evicted = set(expired) | set(overflow)
+        for thread_id in evicted:
+            self.delete_thread(thread_id)
+
+        with self.cursor() as cur:
+            # checkpoint ids are time-ordered, so rank by id to keep the newest per thread/namespace
+            stale = cur.execute(
+                """
+                SELECT thread_id, checkpoint_ns, checkpoint_id FROM (
+                    SELECT thread_id, checkpoint_ns, checkpoint_id,
+                           ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+                    FROM checkpoints
+                ) WHERE rn > ?
+                """,
+                (self.keep_checkpoints,),
+            ).fetchall()
+            cur.executemany(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale
+            )
+            cur.executemany(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale
+            )
+        return {"evicted_threads": len(evicted), "compacted_checkpoints": len(stale)}
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class EvictingMemorySaver(MemorySaver):
+    """In-process saver with the same TTL/LRU eviction (no compaction needed for tests)."""
+
+    def __init__(self, ttl_seconds=THREAD_TTL_SECONDS, max_threads=MAX_THREADS, sweep_interval=SWEEP_INTERVAL_SECONDS):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._last_seen = {}
+        self._activity_lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        with self._activity_lock:
+            self._last_seen.pop(thread_id, None)
+            self._last_seen[thread_id] = time.time()  # dict order doubles as LRU order
+            due = len(self._last_seen) > self.max_threads or time.monotonic() - self._last_sweep > self.sweep_interval
+        if due:
+            self.sweep()
+        return result
+
+    def sweep(self) -> dict:
+        self._last_sweep = time.monotonic()
+        cutoff = time.time() - self.ttl_seconds
+        with self._activity_lock:
+            evicted = [t for t, seen in self._last_seen.items() if seen < cutoff]
+            overflow = len(self._last_seen) - len(evicted) - self.max_threads
+            if overflow > 0:
+                expired = set(evicted)
+                evicted += [t for t in self._last_seen if t not in expired][:overflow]
+            for thread_id in evicted:
+                self._last_seen.pop(thread_id, None)
+        for thread_id in evicted:
+            self.delete_thread(thread_id)
+        return {"evicted_threads": len(evicted), "compacted_checkpoints": 0}
+
+
+def get_checkpointer(backend: str = CHECKPOINTER_BACKEND):
+    """Builds the configured checkpointer backend."""
+    if backend == "memory":
+        return EvictingMemorySaver()
+    if backend == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(CHECKPOINT_DB)), exist_ok=True)
+        conn = sqlite3.connect(CHECKPOINT_DB, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        saver = EvictingSqliteSaver(conn)
+        saver.setup()
+        return saver
+    raise ValueError(f"Unknown CHECKPOINTER_BACKEND '{backend}' (expected 'sqlite' or 'memory')")
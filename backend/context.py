@@ -0,0 +1,130 @@
+import os
+from typing_extensions import NotRequired
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+from langgraph.prebuilt.chat_agent_executor import AgentState
+
+# Context-window management for long chat threads.
+# The full history stays in the checkpointer; only the view sent to the model is trimmed:
+#   - the last CONTEXT_KEEP_TURNS turns are sent verbatim (tool outputs of past turns truncated)
+#   - older turns are folded into a rolling summary kept in the graph state
+#   - everything must fit CONTEXT_MAX_TOKENS (system prompt included)
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "4"))
+STALE_TOOL_OUTPUT_CHARS = int(os.getenv("STALE_TOOL_OUTPUT_CHARS", "300"))
+SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "2000"))
+# Rough estimate for llama-family tokenizers on English text
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+
+
+class PharmacyState(AgentState):
+    """Agent state plus the rolling summary of turns no longer sent verbatim."""
+    context_summary: NotRequired[str]
+    summarized_turns: NotRequired[int]
+
+
+def estimate_tokens(text) -> int:
+    if not isinstance(text, str):
+        text = str(text)
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def _message_tokens(msg) -> int:
+    tokens = estimate_tokens(msg.content) + 4  # role/format overhead
+    for call in getattr(msg, "tool_calls", None) or []:
+        tokens += estimate_tokens(call.get("name", "")) + estimate_tokens(call.get("args", ""))
+    return tokens
+
+
+def split_turns(messages) -> list:
+    """Groups messages into turns, each starting at a HumanMessage."""
+    turns = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def _shorten(text, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def _truncate_tool_outputs(turn, limit: int) -> list:
+    out = []
+    for msg in turn:
+        if isinstance(msg, ToolMessage) and len(str(msg.content)) > limit:
+            msg = msg.model_copy(update={"content": _shorten(msg.content, limit) + " [truncated]"})
+        out.append(msg)
+    return out
+
+
+def summarize_turn(turn) -> str:
+    """One-line extractive summary of a turn (no model call)."""
+    question = next((m.content for m in turn if isinstance(m, HumanMessage)), "")
+    tools = [c["name"] for m in turn if isinstance(m, AIMessage) for c in (m.tool_calls or [])]
+    answer = next((m.content for m in reversed(turn) if isinstance(m, AIMessage) and m.content), "")
+    line = f"- User: {_shorten(question, 150)}"
+    if tools:
+        line += f" | tools: {', '.join(dict.fromkeys(tools))}"
+    if answer:
+        line += f" | Assistant: {_shorten(answer, 200)}"
+    return line
+
+
+def _fold(summary: str, turns) -> str:
+    lines = [l for l in summary.splitlines() if l] + [summarize_turn(t) for t in turns]
+    # Keep the newest lines when the summary outgrows its budget
+    while lines and sum(len(l) + 1 for l in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_context_hook(system_prompt: str = "", max_tokens: int = None, keep_turns: int = None):
+    """Returns a pre_model_hook for create_react_agent."""
+    reserved = estimate_tokens(system_prompt)
+
+    def trim_context(state):
+        budget = (max_tokens or CONTEXT_MAX_TOKENS) - reserved
+        keep = max(1, keep_turns or CONTEXT_KEEP_TURNS)
+        turns = split_turns(state["messages"])
+        summary = state.get("context_summary", "") or ""
+        summarized = state.get("summarized_turns", 0) or 0
+        if summarized > len(turns):
+            summary, summarized = "", 0
+
+        # Fold everything older than the verbatim window into the summary
+        cut = max(summarized, len(turns) - keep)
+        if cut > summarized:
+            summary = _fold(summary, turns[summarized:cut])
+            summarized = cut
+
+        recent = turns[cut:]
+        recent = [_truncate_tool_outputs(t, STALE_TOOL_OUTPUT_CHARS) for t in recent[:-1]] + recent[-1:]
+
+        def cost():
+            head = estimate_tokens(summary) if summary else 0
+            return head + sum(_message_tokens(m) for t in recent for m in t)
+
+        # Over budget: fold more old turns, always keeping the current one
+        while len(recent) > 1 and cost() > budget:
+            summary = _fold(summary, recent[:1])
+            summarized += 1
+            recent = recent[1:]
+
+        # Still over: shrink the current turn's tool outputs as a last resort
+        if cost() > budget:
+            recent[-1] = _truncate_tool_outputs(recent[-1], STALE_TOOL_OUTPUT_CHARS)
+
+        llm_messages = []
+        if summary:
+            llm_messages.append(SystemMessage(content=f"Summary of earlier conversation:\n{summary}"))
+        llm_messages.extend(m for t in recent for m in t)
+        return {
+            "llm_input_messages": llm_messages,
+            "context_summary": summary,
+            "summarized_turns": summarized,
+        }
+
+    return trim_context
@@ -1,12 +1,64 @@
-from sqlalchemy import create_engine
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .metrics import instrument_engine
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/pharmacy.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/pharmacy.db")
+
+# How long a writer waits for the SQLite lock before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
 )
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    # WAL lets readers proceed while an order is being written
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+@contextmanager
+def sqlite_cache_size(connection, kb: int):
+    """Raises the page cache for one bulk write on a pooled connection, restoring it afterwards."""
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+    previous = connection.exec_driver_sql("PRAGMA cache_size").scalar()
+    connection.exec_driver_sql(f"PRAGMA cache_size=-{kb}")
+    try:
+        yield
+    finally:
+        connection.exec_driver_sql(f"PRAGMA cache_size={previous}")
+
+def is_lock_error(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and "locked" in str(exc).lower()
+
+def run_with_retry(db, fn, attempts: int = 5, backoff: float = 0.05):
+    """
+    Runs fn() (which should commit) and retries on SQLite lock contention.
+    The session is rolled back between attempts.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except OperationalError as e:
+            db.rollback()
+            if not is_lock_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt))
@@ -0,0 +1,267 @@
+import os
+import json
+import math
+import time
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+from sqlalchemy import func, case, or_
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal, sqlite_cache_size
+from .models import Medicine, OrderHistory, DailyDemand, DemandForecast, ForecastRun
+from .read_cache import bump_versions
+
+# Demand forecasting and reorder points.
+# A scheduled job rolls new OrderHistory rows (by id watermark) into per-medicine daily totals,
+# then recomputes every SKU's velocity (mean units/day), variability (std of daily units),
+# safety stock and reorder point over a trailing window in one vectorized pass (a SKU x day matrix
+# in NumPy). Results go to demand_forecasts; low-stock alerts compare live stock to the stored
+# reorder point instead of a fixed "stock < 20", so fast movers alert early and slow movers stay quiet.
+#
+#   reorder point = velocity * lead time + z(service level) * std * sqrt(lead time)
+#
+# Medicines with no sales in the window (including ones that sold out and so couldn't sell) use the fixed
+# LOW_STOCK_THRESHOLD instead, and anything at zero stock always alerts.
+#
+# The window ends today; an imported history older than the window forecasts no demand (every medicine
+# then uses the fixed threshold). pandas/NumPy are imported only by the job itself.
+
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "28"))
+FORECAST_LEAD_TIME_DAYS = float(os.getenv("FORECAST_LEAD_TIME_DAYS", "7"))
+FORECAST_SERVICE_LEVEL = float(os.getenv("FORECAST_SERVICE_LEVEL", "0.95"))
+FORECAST_INTERVAL_SECONDS = float(os.getenv("FORECAST_INTERVAL_SECONDS", "3600"))
+FORECAST_CHUNK_ROWS = 1_000_000
+ROLLUP_CACHE_KB = 65536
+# Fixed threshold for medicines the job hasn't forecast yet (e.g. before its first run) or that have no recent sales
+LOW_STOCK_THRESHOLD = 20
+
+_NON_ALNUM = r"[^a-z0-9]+"
+_run_lock = threading.Lock()
+_scheduler = None
+
+
+def _normalized(names):
+    """Vectorized name_resolver.normalize_name over a pandas Series."""
+    return names.str.lower().str.replace(_NON_ALNUM, " ", regex=True).str.strip()
+
+
+def _catalog(connection):
+    """Medicines as a DataFrame (id, name, stock) plus a normalized name -> id Series (ambiguous names dropped)."""
+    import pandas as pd
+    meds = pd.read_sql_query("SELECT id, name, stock FROM medicines ORDER BY id", connection.connection.driver_connection)
+    meds["stock"] = meds["stock"].fillna(0).astype("int64")
+    keys = _normalized(meds["name"].fillna(""))
+    ids = pd.Series(meds["id"].to_numpy(), index=keys)
+    return meds, ids[~ids.index.duplicated(keep=False)]
+
+
+def _rollup(db) -> dict:
+    """Adds OrderHistory rows past the watermark to daily_demand. Returns counts (orders 0 if nothing new)."""
+    import pandas as pd
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+    watermark = db.query(func.max(ForecastRun.to_order_id)).scalar() or 0
+    max_id = db.query(func.max(OrderHistory.id)).scalar() or 0
+    if max_id <= watermark:
+        return {"orders": 0, "unmatched": 0}
+
+    connection = db.connection()
+    _, ids = _catalog(connection)
+    # Aggregate each chunk to (medicine, dosage, day) right away so millions of rows never sit in memory.
+    # Read through the sqlite3 connection itself (same transaction): SQLAlchemy's Row wrapping
+    # would double the cost of fetching millions of rows.
+    partials = []
+    for chunk in pd.read_sql_query(
+            "SELECT medicine, dosage, quantity, date_purchased AS day FROM order_history WHERE id > ? AND id <= ?",
+            connection.connection.driver_connection, params=(watermark, max_id), chunksize=FORECAST_CHUNK_ROWS):
+        chunk[["medicine", "dosage"]] = chunk[["medicine", "dosage"]].fillna("")
+        chunk["quantity"] = chunk["quantity"].fillna(0)
+        partials.append(chunk.groupby(["medicine", "dosage", "day"], sort=False)["quantity"].agg(["sum", "count"]))
+    if not partials:
+        return {"orders": 0, "unmatched": 0}
+    daily = pd.concat(partials).groupby(level=[0, 1, 2], sort=False).sum().reset_index()
+    orders = int(daily["count"].sum())
+
+    # History stores "Paracetamol" + "500mg" where the catalog may say "Paracetamol 500mg": try both
+    pairs = daily[["medicine", "dosage"]].drop_duplicates()
+    by_name = _normalized(pairs["medicine"]).map(ids)
+    by_name_dosage = _normalized(pairs["medicine"] + " " + pairs["dosage"]).map(ids)
+    pairs["medicine_id"] = by_name.fillna(by_name_dosage)
+    daily = daily.merge(pairs, on=["medicine", "dosage"])
+    unmatched = int(daily.loc[daily["medicine_id"].isna(), "count"].sum())
+    # Sorted so the upsert walks the (medicine_id, day) index in order instead of seeking randomly
+    daily = daily.dropna(subset=["medicine_id"]).groupby(["medicine_id", "day"], sort=True)[["sum", "count"]].sum().reset_index()
+
+    rows = list(zip(daily["medicine_id"].astype("int64").tolist(), daily["day"].tolist(),
+                    daily["sum"].astype("int64").tolist(), daily["count"].astype("int64").tolist()))
+    if rows:
+        with sqlite_cache_size(connection, ROLLUP_CACHE_KB):
+            connection.exec_driver_sql(
+                "INSERT INTO daily_demand (medicine_id, day, quantity, orders) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (medicine_id, day) DO UPDATE SET quantity = quantity + excluded.quantity, orders = orders + excluded.orders",
+                rows)
+    db.add(ForecastRun(from_order_id=watermark, to_order_id=max_id, orders=orders, unmatched=unmatched,
+                       started_at=started_at, seconds=round(time.perf_counter() - start, 3)))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker rolled up the same orders first
+        db.rollback()
+        return {"orders": 0, "unmatched": 0}
+    return {"orders": orders, "unmatched": unmatched}
+
+
+def _compute(db) -> dict:
+    """Recomputes demand_forecasts for every medicine from the trailing window of daily_demand."""
+    import numpy as np
+    import pandas as pd
+    connection = db.connection()
+    meds, _ = _catalog(connection)
+    # The window always ends today, so a pause in sales (or a stalled rollup) shows up as falling demand
+    # instead of freezing the forecast on an old window; the latest day with sales is reported separately.
+    last_sale_day = db.query(func.max(DailyDemand.day)).scalar()
+    as_of = date.today()
+    first_day = as_of - timedelta(days=FORECAST_WINDOW_DAYS - 1)
+    demand = pd.read_sql_query(
+        "SELECT medicine_id, day, quantity FROM daily_demand WHERE day >= ? AND day <= ?",
+        connection.connection.driver_connection, params=(first_day.isoformat(), as_of.isoformat()))
+
+    # SKU x day matrix of units sold; days without sales stay 0
+    matrix = np.zeros((len(meds), FORECAST_WINDOW_DAYS))
+    sku_rows = pd.Index(meds["id"]).get_indexer(demand["medicine_id"])
+    day_codes, days = pd.factorize(demand["day"])
+    cols = (pd.to_datetime(days, format="%Y-%m-%d") - pd.Timestamp(first_day)).days.to_numpy()[day_codes]
+    known = sku_rows >= 0
+    matrix[sku_rows[known], cols[known]] = demand["quantity"].to_numpy()[known]
+
+    mean = matrix.mean(axis=1)
+    std = matrix.std(axis=1, ddof=1) if FORECAST_WINDOW_DAYS > 1 else np.zeros(len(meds))
+    z = NormalDist().inv_cdf(FORECAST_SERVICE_LEVEL)
+    safety = z * std * math.sqrt(FORECAST_LEAD_TIME_DAYS)
+    reorder = mean * FORECAST_LEAD_TIME_DAYS + safety
+    stock = meds["stock"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(mean > 0, stock / mean, np.nan)
+
+    computed_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    rows = list(zip(meds["id"].tolist(), mean.round(4).tolist(), std.round(4).tolist(), safety.round(2).tolist(),
+                    reorder.round(2).tolist(), stock.tolist(),
+                    [None if c != c else round(c, 2) for c in cover.tolist()],
+                    [as_of.isoformat()] * len(meds), [computed_at] * len(meds)))
+    connection.exec_driver_sql("DELETE FROM demand_forecasts")
+    connection.exec_driver_sql(
+        "INSERT INTO demand_forecasts (medicine_id, daily_mean, daily_std, safety_stock, reorder_point, stock, "
+        "days_of_cover, as_of, computed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    bump_versions(connection, "forecast")
+    db.commit()
+    return {"medicines": len(meds), "selling": int((mean > 0).sum()),
+            "below_reorder_point": int(((stock <= 0) | (stock < np.where(mean > 0, reorder, LOW_STOCK_THRESHOLD))).sum()),
+            "as_of": as_of.isoformat(), "last_sale_day": last_sale_day.isoformat() if last_sale_day else None}
+
+
+def run_forecast(full: bool = False) -> dict:
+    """
+    Rolls up new orders and recomputes all forecasts. full=True (or a replaced OrderHistory, detected by
+    ids going backwards) rebuilds daily_demand from the whole history; on millions of orders that holds the
+    write lock for several seconds, so it belongs in init_db or off-peak, not the hourly schedule.
+    """
+    with _run_lock:
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            watermark = db.query(func.max(ForecastRun.to_order_id)).scalar() or 0
+            if not full and watermark > (db.query(func.max(OrderHistory.id)).scalar() or 0):
+                print("Order history was replaced; rebuilding demand history.")
+                full = True
+            if full:
+                db.query(DailyDemand).delete(synchronize_session=False)
+                db.query(ForecastRun).delete(synchronize_session=False)
+                db.commit()
+            rollup = _rollup(db)
+            result = _compute(db)
+        finally:
+            db.close()
+        return {**rollup, **result, "full": full, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def _scheduled():
+    # Let warmup finish first so the first run doesn't compete with it
+    from .warmup import readiness
+    while any(s["status"] in ("pending", "running") for s in readiness.snapshot()["steps"].values()):
+        time.sleep(1)
+    while True:
+        try:
+            result = run_forecast()
+            print(f"Forecast: {result['orders']} new orders, {result['below_reorder_point']} of "
+                  f"{result['medicines']} medicines below their reorder point ({result['seconds']}s).")
+        except Exception as e:
+            print(f"Forecast run failed: {e}")
+        time.sleep(FORECAST_INTERVAL_SECONDS)
+
+
+def start_forecast_scheduler():
+    global _scheduler
+    if FORECAST_INTERVAL_SECONDS <= 0 or _scheduler:
+        return
+    _scheduler = threading.Thread(target=_scheduled, name="forecast", daemon=True)
+    _scheduler.start()
+
+
+def forecasts_available(db) -> bool:
+    return db.query(DemandForecast.medicine_id).first() is not None
+
+
+def _threshold():
+    # Medicines with no sales in the window have no demand signal (a sold-out medicine can't sell, so its
+    # mean drops to 0): they fall back to the fixed threshold rather than never alerting.
+    return case((DemandForecast.daily_mean > 0, DemandForecast.reorder_point), else_=LOW_STOCK_THRESHOLD)
+
+
+def reorder_alerts(db) -> list:
+    """Medicines that are out of stock or below their reorder point; out of stock first, then fewest days of cover."""
+    cover = (Medicine.stock / func.nullif(DemandForecast.daily_mean, 0)).label("days_of_cover")
+    threshold = _threshold().label("threshold")
+    rows = db.query(Medicine.id, Medicine.name, Medicine.stock, Medicine.unit, DemandForecast.daily_mean,
+                    DemandForecast.daily_std, threshold, cover).join(
+        DemandForecast, DemandForecast.medicine_id == Medicine.id
+    ).filter(or_(Medicine.stock <= 0, Medicine.stock < threshold)).order_by(
+        Medicine.stock > 0, cover.is_not(None), cover, Medicine.id).all()
+    return [{"id": r.id, "name": r.name, "stock": r.stock, "unit": r.unit, "daily_mean": round(r.daily_mean, 2),
+             "daily_std": round(r.daily_std, 2), "reorder_point": math.ceil(r.threshold),
+             "days_of_cover": None if r.days_of_cover is None else round(r.days_of_cover, 1)} for r in rows]
+
+
+def alert_threshold(db, medicine_id: int) -> float:
+    """Stock level below which a medicine is low: its reorder point, or LOW_STOCK_THRESHOLD without a demand signal."""
+    threshold = db.query(_threshold()).filter(DemandForecast.medicine_id == medicine_id).scalar()
+    return LOW_STOCK_THRESHOLD if threshold is None else max(threshold, 1)
+
+
+def forecast_stats() -> dict:
+    db = SessionLocal()
+    try:
+        last = db.query(ForecastRun).order_by(ForecastRun.id.desc()).first()
+        latest = db.query(func.max(DemandForecast.computed_at), func.max(DemandForecast.as_of),
+                          func.count(DemandForecast.medicine_id)).one()
+        last_sale_day = db.query(func.max(DailyDemand.day)).scalar()
+        return {
+            "medicines": latest[2],
+            "computed_at": latest[0],
+            "as_of": latest[1],
+            "last_sale_day": last_sale_day,
+            "below_reorder_point": len(reorder_alerts(db)) if latest[2] else None,
+            "last_rollup": {"to_order_id": last.to_order_id, "orders": last.orders, "unmatched": last.unmatched,
+                            "started_at": last.started_at, "seconds": last.seconds} if last else None,
+            "config": {"window_days": FORECAST_WINDOW_DAYS, "lead_time_days": FORECAST_LEAD_TIME_DAYS,
+                       "service_level": FORECAST_SERVICE_LEVEL, "interval_seconds": FORECAST_INTERVAL_SECONDS},
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up new orders and recompute demand forecasts and reorder points.")
+    parser.add_argument("--full", action="store_true", help="rebuild daily demand from the whole order history")
+    args = parser.parse_args()
+    print(json.dumps(run_forecast(full=args.full), indent=2))
@@ -0,0 +1,68 @@
+import os
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Optional
+
+# Stand-in warehouse endpoint for testing the outbox dispatcher (outbox.py) locally:
+#   uvicorn backend.fulfillment_stub:app --port 8100
+#   FULFILLMENT_WEBHOOK_URL=http://localhost:8100/fulfillment/events uvicorn backend.main:app --port 8000
+# It de-duplicates on the event id (the idempotency key) and can simulate latency, outages and
+# per-event rejections, either from the env below or at runtime through POST /fulfillment/mode.
+
+app = FastAPI(title="Fulfillment stub")
+
+mode = {
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "0")),
+    "failure_rate": float(os.getenv("STUB_FAILURE_RATE", "0")),  # share of requests answered with 503
+    "reject_rate": float(os.getenv("STUB_REJECT_RATE", "0")),  # share of events rejected as invalid
+}
+_received = {}  # idempotency key -> event
+stats = {"requests": 0, "failed_requests": 0, "duplicates": 0, "rejected": 0}
+
+
+class Mode(BaseModel):
+    latency_ms: Optional[float] = None
+    failure_rate: Optional[float] = None
+    reject_rate: Optional[float] = None
+
+
+@app.post("/fulfillment/events")
+async def receive_events(request: Request):
+    stats["requests"] += 1
+    if mode["latency_ms"]:
+        await asyncio.sleep(mode["latency_ms"] / 1000)
+    if random.random() < mode["failure_rate"]:
+        stats["failed_requests"] += 1
+        return JSONResponse(status_code=503, content={"detail": "warehouse unavailable"}, headers={"Retry-After": "1"})
+
+    body = await request.json()
+    accepted, duplicates, rejected = [], [], {}
+    for event in body.get("events", []):
+        key = event.get("id")
+        if not key or "payload" not in event:
+            rejected[key or "?"] = "missing id or payload"
+        elif key in _received:
+            duplicates.append(key)
+        elif random.random() < mode["reject_rate"]:
+            rejected[key] = "unknown SKU at warehouse"
+        else:
+            _received[key] = event
+            accepted.append(key)
+    stats["duplicates"] += len(duplicates)
+    stats["rejected"] += len(rejected)
+    return {"accepted": accepted, "duplicates": duplicates, "rejected": rejected}
+
+
+@app.get("/fulfillment/events")
+def list_events(limit: int = 100):
+    events = list(_received.values())
+    return {"received": len(events), **stats, "mode": mode, "events": events[-limit:]}
+
+
+@app.post("/fulfillment/mode")
+def set_mode(update: Mode):
+    mode.update({k: v for k, v in update.model_dump().items() if v is not None})
+    return mode
@@ -0,0 +1,204 @@
+"""
+Incremental knowledge-base ingestion.
+
+Splits monograph files on their markdown drug headers ("**Drug (Alias)**"), hashes each
+chunk and only embeds chunks that are new or changed; chunks that disappeared from a
+file are deleted. Safe to re-run at any time.
+
+CLI (offline bulk ingest, doesn't need the API running):
+    python -m backend.ingest_kb data/drug_interactions.txt monographs/ --workers 4
+"""
+import os
+import re
+import glob
+import time
+import hashlib
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# data_versions row bumped whenever chunks are written or deleted (the answer cache keys on it)
+KB_VERSION_NAMESPACE = "knowledge_base"
+EMBED_BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("KB_EMBED_WORKERS", "4"))
+KB_EXTENSIONS = (".txt", ".md")
+
+_SECTION_RE = re.compile(r"^#{1,6}\s+(.+?)\s*$")
+_DRUG_RE = re.compile(r"^\*\*(.+?)\*\*\s*$")
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def chunk_monograph(text: str, source: str) -> list:
+    """
+    One chunk per drug block. Each chunk is prefixed with its section heading for retrieval context.
+    Text before the first drug header (title/preamble) becomes its own chunk if non-empty.
+    Returns [{"id", "text", "metadata"}].
+    """
+    chunks = []
+    section = ""
+    drug = None
+    lines = []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if not body:
+            return
+        name = drug or "preamble"
+        content = f"{section}\n{body}".strip() if section and drug else body
+        chunk_id = f"{source}::{_slug(name)}"
+        # Disambiguate repeated headers within the same file
+        if any(c["id"] == chunk_id for c in chunks):
+            chunk_id = f"{chunk_id}-{len(chunks)}"
+        chunks.append({
+            "id": chunk_id,
+            "text": content,
+            "metadata": {
+                "source": source,
+                "drug": name,
+                "section": section,
+                "content_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            },
+        })
+
+    for line in text.splitlines():
+        heading = _SECTION_RE.match(line)
+        header = _DRUG_RE.match(line.strip())
+        if heading or header:
+            flush()
+            lines = []
+            if heading:
+                section = line.strip()
+                drug = None
+                continue
+            drug = header.group(1).strip()
+        lines.append(line)
+    flush()
+    return chunks
+
+
+def _existing_chunks(vector_store, source: str) -> dict:
+    """chunk id -> content hash for everything stored for a source (legacy chunks have no hash)."""
+    found = vector_store.get(where={"source": source}, include=["metadatas"])
+    return {i: (m or {}).get("content_hash") for i, m in zip(found["ids"], found["metadatas"])}
+
+
+def _upsert_batches(vector_store, chunks: list, batch_size: int, workers: int):
+    """Adds chunks through the public Chroma API (add_documents upserts by id), embedding batches in parallel."""
+    from langchain_core.documents import Document
+
+    def upsert(batch):
+        vector_store.add_documents([Document(page_content=c["text"], metadata=c["metadata"]) for c in batch],
+                                   ids=[c["id"] for c in batch])
+
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    if len(batches) <= 1 or workers <= 1:
+        for batch in batches:
+            upsert(batch)
+        return
+    # Each batch runs in a copy of the caller's context so the model scheduler sees its priority tag
+    contexts = [contextvars.copy_context() for _ in batches]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda args: args[0].run(upsert, args[1]), zip(contexts, batches)))
+
+
+def _bump_kb_version():
+    from .database import engine
+    from .models import DataVersion
+    from .read_cache import bump_versions
+    # The CLI can run against a database the API hasn't created tables in yet
+    DataVersion.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        bump_versions(conn, KB_VERSION_NAMESPACE)
+    from .answer_cache import expire_kb_version
+    expire_kb_version()
+
+
+def ingest_chunks(vector_store, chunks: list, source: str,
+                  batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS, dry_run: bool = False) -> dict:
+    """Upserts new/changed chunks for a source (embedded by the store's embedding function) and deletes stale ones. Returns counts."""
+    existing = _existing_chunks(vector_store, source)
+    wanted = {c["id"] for c in chunks}
+    changed = [c for c in chunks if existing.get(c["id"]) != c["metadata"]["content_hash"]]
+    stale = [i for i in existing if i not in wanted]
+
+    if not dry_run:
+        if stale:
+            vector_store.delete(ids=stale)
+        if changed:
+            _upsert_batches(vector_store, changed, batch_size, workers)
+        if stale or changed:
+            _bump_kb_version()
+    return {"chunks": len(chunks), "embedded": len(changed), "deleted": len(stale),
+            "unchanged": len(chunks) - len(changed)}
+
+
+def ingest_file(vector_store, path: str, source: str = None, **kwargs) -> dict:
+    source = source or os.path.basename(path)
+    with open(path, "r") as f:
+        text = f.read()
+    return ingest_chunks(vector_store, chunk_monograph(text, source), source, **kwargs)
+
+
+def collect_files(paths: list) -> list:
+    """Expands files and directories (recursively) into [(path, source)]."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True)):
+                if f.lower().endswith(KB_EXTENSIONS) and os.path.isfile(f):
+                    files.append((f, os.path.relpath(f, path)))
+        elif os.path.isfile(path):
+            files.append((path, os.path.basename(path)))
+        else:
+            print(f"Warning: {path} not found, skipping.")
+    return files
+
+
+def ingest_paths(paths: list, vector_store=None, prune_missing: bool = False, **kwargs) -> dict:
+    """Ingests every file under paths. With prune_missing, removes sources no longer present."""
+    from .rag import get_vector_store
+    vector_store = vector_store or get_vector_store()
+
+    totals = {"files": 0, "chunks": 0, "embedded": 0, "deleted": 0, "unchanged": 0}
+    files = collect_files(paths)
+    for path, source in files:
+        stats = ingest_file(vector_store, path, source, **kwargs)
+        totals["files"] += 1
+        for key in ("chunks", "embedded", "deleted", "unchanged"):
+            totals[key] += stats[key]
+
+    if prune_missing:
+        sources = {source for _, source in files}
+        stored = vector_store.get(include=["metadatas"])
+        orphans = [i for i, m in zip(stored["ids"], stored["metadatas"]) if (m or {}).get("source") not in sources]
+        if orphans and not kwargs.get("dry_run"):
+            vector_store.delete(ids=orphans)
+            _bump_kb_version()
+        totals["deleted"] += len(orphans)
+    return totals
+
+
+def main(argv=None):
+    from .rag import DATA_FILE
+    parser = argparse.ArgumentParser(description="Incrementally ingest monograph files into the vector store.")
+    parser.add_argument("paths", nargs="*", default=[DATA_FILE], help="files or directories (*.txt, *.md)")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="parallel embedding requests")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding request")
+    parser.add_argument("--prune-missing", action="store_true", help="delete chunks whose source file is gone")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without embedding")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    totals = ingest_paths(args.paths, prune_missing=args.prune_missing,
+                          batch_size=args.batch_size, workers=args.workers, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {totals['files']} files in {elapsed:.1f}s: {totals['chunks']} chunks, "
+          f"{totals['embedded']} embedded, {totals['unchanged']} unchanged, {totals['deleted']} deleted.")
+    return totals
+
+
+if __name__ == "__main__":
+    main()
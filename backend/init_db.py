@@ -1,88 +1,195 @@
 import pandas as pd
+import numpy as np
+import argparse
+import time
 import sys
 import os
 
 # Add current directory to path to allow imports
 sys.path.append(os.getcwd())
 
+from sqlalchemy.dialects.sqlite import insert
 from backend.database import engine, Base, SessionLocal
-from backend.models import Medicine, OrderHistory
+from backend.models import Medicine, OrderHistory, Patient
+from backend.refills import rebuild_last_purchases
+from backend.read_cache import bump_versions
+from backend.allergens import rebuild_allergen_index
+from backend.forecast import run_forecast
 
-def init_db():
+MEDICINE_CSV = "data/medicine_data.csv"
+HISTORY_CSV = "data/order_history.csv"
+CHUNK_SIZE = 50000
+
+# CSV header variants -> Medicine columns
+MEDICINE_COLUMNS = {
+    "name": "name", "medicine_name": "name",
+    "dosage": "dosage", "stock": "stock", "unit": "unit", "price": "price",
+    "prescription_required": "prescription_required",
+}
+HISTORY_COLUMNS = {
+    "patient_id": "patient_id", "medicine": "medicine", "dosage": "dosage",
+    "quantity": "quantity", "date": "date_purchased", "date_purchased": "date_purchased",
+}
+
+# (regex on lowercase name, category); first match wins
+CATEGORY_RULES = [
+    (r"cillin|mycin|flox", "Antibiotic"),
+    (r"profen|cam|aspirin", "Painkiller (NSAID)"),
+    (r"statin", "Cardiovascular"),
+]
+
+
+class Progress:
+    """Prints rows loaded and rows/sec per chunk."""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def update(self, n):
+        self.rows += n
+        elapsed = time.perf_counter() - self.start
+        print(f"  {self.label}: {self.rows:,} rows ({self.rows / max(elapsed, 1e-9):,.0f} rows/sec)", flush=True)
+
+    def rate(self):
+        return self.rows / max(time.perf_counter() - self.start, 1e-9)
+
+
+def _normalize_columns(df, mapping):
+    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    return df.rename(columns={c: mapping[c] for c in df.columns if c in mapping})
+
+
+def infer_categories(names: pd.Series) -> np.ndarray:
+    """Vectorized version of the name-suffix category heuristic."""
+    lower = names.str.lower()
+    conditions = [lower.str.contains(pattern, regex=True, na=False) for pattern, _ in CATEGORY_RULES]
+    return np.select(conditions, [category for _, category in CATEGORY_RULES], default="General")
+
+
+def _prepare_medicines(df) -> list:
+    df = _normalize_columns(df, MEDICINE_COLUMNS)
+    df = df[df["name"].notna()]
+    def column(name, default):
+        return df[name] if name in df else pd.Series(default, index=df.index)
+
+    out = pd.DataFrame({"name": df["name"].astype(str).str.strip()})
+    out["dosage"] = column("dosage", "N/A").fillna("N/A").astype(str)
+    out["stock"] = pd.to_numeric(column("stock", 0), errors="coerce").fillna(0).astype(int)
+    out["unit"] = column("unit", "units").fillna("units").astype(str)
+    out["price"] = pd.to_numeric(column("price", 0.0), errors="coerce").fillna(0.0).astype(float)
+    out["category"] = infer_categories(out["name"])
+    out["prescription_required"] = column("prescription_required", "No").astype(str).str.strip().eq("Yes")
+    # Last row wins if a chunk repeats a name
+    return out.drop_duplicates("name", keep="last").to_dict("records")
+
+
+def load_medicines(path=MEDICINE_CSV, chunk_size=CHUNK_SIZE):
+    """
+    Streams the medicine CSV in chunks and upserts on name.
+    Re-running with a refreshed CSV updates stock/price in place (idempotent).
+    """
+    progress = Progress("medicines")
+    stmt = insert(Medicine)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Medicine.name],
+        set_={c: stmt.excluded[c] for c in ("dosage", "stock", "unit", "price", "category", "prescription_required")},
+    )
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        rows = _prepare_medicines(chunk)
+        if rows:
+            with engine.begin() as conn:
+                conn.execute(stmt, rows)
+                bump_versions(conn, "inventory", "medicine_names")
+        progress.update(len(rows))
+    return progress
+
+
+def load_history(path=HISTORY_CSV, chunk_size=CHUNK_SIZE, mode="skip"):
+    """
+    Streams order history into the database with bulk inserts.
+    mode: 'skip' (only if the table is empty), 'replace' (reload from scratch, idempotent) or 'append'.
+    """
+    progress = Progress("history")
+    with engine.begin() as conn:
+        if mode == "replace":
+            conn.execute(OrderHistory.__table__.delete())
+        elif mode == "skip" and conn.execute(OrderHistory.__table__.select().limit(1)).first():
+            print("History already exists, skipping (use --history-mode replace to reload).")
+            return progress
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        df = _normalize_columns(chunk, HISTORY_COLUMNS)
+        out = pd.DataFrame({
+            "patient_id": df["patient_id"].astype(str),
+            "medicine": df["medicine"].astype(str),
+            "dosage": df["dosage"].astype(str),
+            "quantity": pd.to_numeric(df["quantity"], errors="coerce").fillna(0).astype(int),
+            "date_purchased": pd.to_datetime(df["date_purchased"], format="%Y-%m-%d").dt.date,
+        })
+        with engine.begin() as conn:
+            conn.execute(OrderHistory.__table__.insert(), out.to_dict("records"))
+        progress.update(len(out))
+    return progress
+
+
+def seed_patients():
+    # Load Patients (Mock Data)
+    session = SessionLocal()
+    try:
+        if session.query(Patient).count() == 0:
+            print("Seeding dummy patients...")
+            patients = [
+                Patient(name="John Doe", age=45, allergies="Penicillin, Peanuts", conditions="Hypertension"),
+                Patient(name="Jane Smith", age=30, allergies="Sulfa Drugs", conditions="Asthma"),
+                Patient(name="Bob Johnson", age=60, allergies="None", conditions="Diabetes"),
+            ]
+            session.add_all(patients)
+            session.commit()
+            print("Added 3 dummy patients.")
+    finally:
+        session.close()
+
+
+def init_db(medicine_csv=MEDICINE_CSV, history_csv=HISTORY_CSV, chunk_size=CHUNK_SIZE, history_mode="skip"):
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
-    session = SessionLocal()
-    
-    # Load Medicines
-    med_count = session.query(Medicine).count()
-    if med_count == 0:
-        print("Importing medicines from CSV...")
-        try:
-            df_med = pd.read_csv("data/medicine_data.csv")
-            for _, row in df_med.iterrows():
-                # Infer category (Simple heuristic for demo)
-                name_lower = row.get("name", row.get("Medicine Name", "")).lower()
-                category = "General"
-                if "cillin" in name_lower or "mycin" in name_lower or "flox" in name_lower:
-                    category = "Antibiotic"
-                elif "profen" in name_lower or "cam" in name_lower or "aspirin" in name_lower:
-                    category = "Painkiller (NSAID)"
-                elif "statin" in name_lower:
-                    category = "Cardiovascular"
-                
-                med = Medicine(
-                    name=row.get("name", row.get("Medicine Name")),
-                    dosage=row.get("dosage", "N/A"),
-                    stock=int(row.get("stock", 0)),
-                    unit=row.get("unit", "units"),
-                    price=float(row.get("price", 0.0)),
-                    category=category,
-                    prescription_required=(str(row.get("prescription_required", "No")) == "Yes")
-                )
-                session.add(med)
-            print(f"Added {len(df_med)} medicines.")
-        except Exception as e:
-            print(f"Error loading medicines: {e}")
+
+    if os.path.exists(medicine_csv):
+        print(f"Importing medicines from {medicine_csv}...")
+        load_medicines(medicine_csv, chunk_size)
     else:
-        print(f"Medicines already exist: {med_count}")
-    
-    # Load Patients (Mock Data)
-    from backend.models import Patient
-    pat_count = session.query(Patient).count()
-    if pat_count == 0:
-        print("Seeding dummy patients...")
-        patients = [
-            Patient(name="John Doe", age=45, allergies="Penicillin, Peanuts", conditions="Hypertension"),
-            Patient(name="Jane Smith", age=30, allergies="Sulfa Drugs", conditions="Asthma"),
-            Patient(name="Bob Johnson", age=60, allergies="None", conditions="Diabetes"),
-        ]
-        session.add_all(patients)
-        print("Added 3 dummy patients.")
-
-    # Load History
-    hist_count = session.query(OrderHistory).count()
-    if hist_count == 0:
-        print("Importing order history from CSV...")
-        try:
-            df_hist = pd.read_csv("data/order_history.csv")
-            for _, row in df_hist.iterrows():
-                hist = OrderHistory(
-                    patient_id=row["Patient ID"],
-                    medicine=row["Medicine"],
-                    dosage=row["Dosage"],
-                    quantity=int(row["Quantity"]),
-                    date_purchased=row["Date"]
-                )
-                session.add(hist)
-            print(f"Added {len(df_hist)} history records.")
-        except Exception as e:
-            print(f"Error loading history: {e}")
+        print(f"Medicine CSV not found: {medicine_csv}")
+
+    seed_patients()
+
+    if os.path.exists(history_csv):
+        print(f"Importing order history from {history_csv}...")
+        load_history(history_csv, chunk_size, history_mode)
     else:
-        print(f"History already exist: {hist_count}")
-            
-    session.commit()
+        print(f"History CSV not found: {history_csv}")
+
+    # Bulk inserts bypass ORM events, so rebuild derived indexes
+    from backend.name_resolver import medicine_index, patient_index
+    medicine_index.invalidate()
+    patient_index.invalidate()
+
+    print("Building last-purchase index for refill alerts...")
+    session = SessionLocal()
+    print(f"Indexed {rebuild_last_purchases(session)} patient/medicine pairs.")
+    print(f"Indexed {rebuild_allergen_index(session)} medicine allergen terms.")
     session.close()
+    result = run_forecast(full=True)
+    print(f"Forecast demand for {result['medicines']} medicines ({result['below_reorder_point']} below reorder point).")
     print("Database initialized successfully.")
 
+
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="Create tables and import CSV data.")
+    parser.add_argument("--medicines", default=MEDICINE_CSV, help="medicine CSV (upserted on name)")
+    parser.add_argument("--history", default=HISTORY_CSV, help="order history CSV")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--history-mode", choices=["skip", "replace", "append"], default="skip")
+    args = parser.parse_args()
+    init_db(args.medicines, args.history, args.chunk_size, args.history_mode)
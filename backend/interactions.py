@@ -0,0 +1,219 @@
+import os
+import re
+import threading
+from itertools import combinations
+
+# Pairwise drug-interaction index built from the knowledge base file.
+# Lets check_drug_interaction answer known pairs with dict lookups instead of vector search.
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), "../data/drug_interactions.txt")
+
+# Drug classes -> members we stock / that the knowledge base mentions.
+# Extended at ingest time from headers like "Ibuprofen (NSAID)" and bullets like "ACE Inhibitors (e.g., Lisinopril)".
+CLASS_MEMBERS = {
+    "nsaid": {"ibuprofen", "naproxen", "aspirin"},
+    "ace inhibitor": {"lisinopril"},
+    "statin": {"atorvastatin", "simvastatin"},
+    "ssri": {"sertraline", "escitalopram", "fluoxetine"},
+    "maoi": set(),
+    "benzodiazepine": set(),
+    "corticosteroid": {"prednisone"},
+    "beta-blocker": {"metoprolol"},
+    "diuretic": {"furosemide", "hydrochlorothiazide"},
+    "blood thinner": {"warfarin", "clopidogrel"},
+    "calcium channel blocker": {"amlodipine"},
+    "antacid": set(),
+}
+
+# Different spellings of the same class
+CLASS_SYNONYMS = {
+    "mao inhibitor": "maoi",
+    "beta blocker": "beta-blocker",
+    "anticoagulant": "blood thinner",
+}
+
+_HEADER_RE = re.compile(r"^\*\*(.+?)\*\*\s*$")
+_BULLET_RE = re.compile(r"^\s*-\s+(.+?):\s*(.+)$")
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+# Only strengths are dropped; other tokens with digits are part of the name ("CYP3A4 Inhibitors")
+_STRENGTH_RE = re.compile(r"\b\d+(\.\d+)?\s*(mg|mcg|g|ml|iu)\b|\b\d+(\.\d+)?\s*%")
+
+
+def normalize_term(text: str) -> str:
+    """Lowercases, drops strength tokens ('500mg') and de-pluralizes the last word."""
+    words = [w for w in re.split(r"\s+", _STRENGTH_RE.sub(" ", text.lower()).strip()) if w]
+    if words:
+        last = words[-1]
+        if len(last) > 3 and last.endswith("s") and not last.endswith("ss"):
+            words[-1] = last[:-1]
+    term = " ".join(words)
+    return CLASS_SYNONYMS.get(term, term)
+
+
+def _is_class(term: str) -> bool:
+    return term in CLASS_MEMBERS or any(w in term for w in ("inhibitor", "blocker", "statin"))
+
+
+class InteractionIndex:
+    """
+    Symmetric interaction index.
+    pairs: frozenset({term_a, term_b}) -> list of (source drug, description)
+    """
+
+    def __init__(self):
+        self.pairs = {}
+        self.aliases = {}   # alias -> canonical drug ('acetaminophen' -> 'paracetamol')
+        self.classes = {k: set(v) for k, v in CLASS_MEMBERS.items()}
+        self.known = set()  # every term the knowledge base mentions
+        self.display = {}   # canonical term -> display name
+
+    def _add_member(self, cls: str, member: str):
+        self.classes.setdefault(cls, set()).add(member)
+        self.known.add(cls)
+
+    def _add_pair(self, a: str, b: str, source: str, text: str):
+        if not a or not b or a == b:
+            return
+        entry = (source, text)
+        bucket = self.pairs.setdefault(frozenset((a, b)), [])
+        if entry not in bucket:
+            bucket.append(entry)
+        self.known.update((a, b))
+
+    def _parse_header(self, header: str) -> str:
+        # e.g. "Paracetamol (Acetaminophen)", "Sertraline (Zoloft) - SSRI", "Lisinopril (ACE Inhibitor)"
+        main, _, suffix = header.partition(" - ")
+        name = normalize_term(_PAREN_RE.sub("", main))
+        self.display[name] = _PAREN_RE.sub("", main).strip()
+        self.known.add(name)
+        extras = [p for p in _PAREN_RE.findall(main)] + ([suffix] if suffix else [])
+        for extra in extras:
+            term = normalize_term(extra)
+            if not term:
+                continue
+            if _is_class(term):
+                self._add_member(term, name)
+            else:
+                self.aliases[term] = name
+                self.known.add(term)
+        return name
+
+    def _parse_bullet(self, drug: str, subject: str, text: str):
+        # e.g. "Warfarin/Blood Thinners", "ACE Inhibitors (e.g., Lisinopril)", "NSAIDs (Ibuprofen/Naproxen)"
+        members = []
+        for paren in _PAREN_RE.findall(subject):
+            paren = re.sub(r"^\s*e\.g\.,?\s*", "", paren)
+            members.extend(normalize_term(m) for m in re.split(r"[/,]", paren))
+        subjects = [normalize_term(s) for s in _PAREN_RE.sub("", subject).split("/")]
+        for term in subjects:
+            for member in members:
+                if member:
+                    self._add_member(term, member)
+            self._add_pair(drug, term, self.display.get(drug, drug), text.strip())
+
+    def parse(self, text: str):
+        drug = None
+        in_interactions = False
+        for line in text.splitlines():
+            header = _HEADER_RE.match(line.strip())
+            if header:
+                drug = self._parse_header(header.group(1))
+                in_interactions = False
+                continue
+            if drug is None:
+                continue
+            stripped = line.strip()
+            if stripped.startswith("- **"):
+                in_interactions = stripped.startswith("- **Interactions**")
+                continue
+            if in_interactions:
+                bullet = _BULLET_RE.match(line)
+                if bullet:
+                    self._parse_bullet(drug, bullet.group(1), bullet.group(2))
+        self._member_of = {}
+        for cls, members in self.classes.items():
+            for member in members:
+                self._member_of.setdefault(member, set()).add(cls)
+        return self
+
+    def resolve(self, name: str) -> set:
+        """All index terms a medicine name can match: itself, its canonical name and its classes."""
+        term = normalize_term(name)
+        canonical = self.aliases.get(term, term)
+        keys = {term, canonical}
+        keys |= self._member_of.get(canonical, set())
+        return keys
+
+    def is_known(self, name: str) -> bool:
+        return any(k in self.known for k in self.resolve(name))
+
+    def mentions(self, text: str) -> frozenset:
+        """Canonical terms of every drug or class the knowledge base knows that a text names."""
+        words = re.findall(r"[a-z0-9-]+", (text or "").lower())
+        found = set()
+        for size in (1, 2, 3):  # class names run to three words ("calcium channel blocker")
+            for i in range(len(words) - size + 1):
+                term = normalize_term(" ".join(words[i:i + size]))
+                canonical = self.aliases.get(term, term)
+                if canonical in self.known:
+                    found.add(canonical)
+        return frozenset(found)
+
+    def lookup(self, medicine_one: str, medicine_two: str) -> list:
+        """Returns [(source, description)] for a pair; empty list if nothing is recorded."""
+        keys_one = self.resolve(medicine_one)
+        keys_two = self.resolve(medicine_two)
+        if (keys_one & keys_two) - set(self.classes):
+            return []  # same drug
+        found = []
+        for a in keys_one:
+            for b in keys_two:
+                for entry in self.pairs.get(frozenset((a, b)), ()):
+                    if entry not in found:
+                        found.append(entry)
+        return found
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def load_interaction_index(path: str = DATA_FILE) -> InteractionIndex:
+    """Parses the knowledge base into an InteractionIndex."""
+    with open(path, "r") as f:
+        return InteractionIndex().parse(f.read())
+
+
+def get_interaction_index() -> InteractionIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_interaction_index() if os.path.exists(DATA_FILE) else InteractionIndex().parse("")
+    return _index
+
+
+def reload_interaction_index():
+    """Rebuilds the index (call after editing drug_interactions.txt)."""
+    global _index
+    with _index_lock:
+        _index = None
+    return get_interaction_index()
+
+
+def screen_pairs(medicines: list):
+    """
+    Checks every pair in a basket.
+    Returns (hits, unknown_pairs): hits is [(med_a, med_b, [(source, text)])],
+    unknown_pairs are pairs where a medicine isn't covered by the index.
+    """
+    index = get_interaction_index()
+    hits, unknown = [], []
+    unique = list(dict.fromkeys(m.strip() for m in medicines if m and m.strip()))
+    for a, b in combinations(unique, 2):
+        found = index.lookup(a, b)
+        if found:
+            hits.append((a, b, found))
+        elif not (index.is_known(a) and index.is_known(b)):
+            unknown.append((a, b))
+    return hits, unknown
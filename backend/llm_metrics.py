@@ -0,0 +1,42 @@
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from .metrics import llm_seconds, llm_tokens, llm_tokens_total, attach_profile
+
+# LangChain callback feeding the LLM histograms in metrics.py. Kept out of metrics.py so that importing
+# metrics (done by database.py, and so by every endpoint and init_db) doesn't load LangChain.
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Times each chat model call and records its token usage. Pass via ChatOllama(callbacks=[...])."""
+
+    # Run in the calling thread even for async calls, so timings and profiler attachment are accurate
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        attach_profile()
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            llm_seconds.observe(time.perf_counter() - start, self.model, "ok")
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        if usage:
+            for kind, key in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+                llm_tokens.observe(usage.get(key, 0), self.model, kind)
+                llm_tokens_total.inc(usage.get(key, 0), self.model, kind)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            llm_seconds.observe(time.perf_counter() - start, self.model, "error")
@@ -1,14 +1,25 @@
-from fastapi import FastAPI, UploadFile, File, Form, Depends
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
+import io
+import csv
+import json
+import time
+import asyncio
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables
 
-from .agents import pharmacy_graph, run_predictive_check
-from langchain_core.messages import HumanMessage
+from .agents import get_llm, get_pharmacy_graph, run_predictive_check
+from .router import route, stats as router_stats
+from .answer_cache import answer_cache, lookup as cached_answer, store as store_answer
+from .metrics import render_metrics, http_request_seconds, agent_steps, agent_tool_calls, profiler
+from .scheduler import scheduler, llm_request, Overloaded
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage
 
 app = FastAPI(title="Agentic Pharmacy API")
 
@@ -21,21 +32,65 @@ app.add_middleware(
     allow_headers=["*", "ngrok-skip-browser-warning"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Request latency per route, plus stack sampling of slow requests when enabled (see metrics.py)."""
+    started = profiler.start(f"{request.method} {request.url.path}") if profiler.enabled else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        http_request_seconds.observe(elapsed, request.method, route.path if route else "unmatched", status)
+        if started:
+            profiler.finish(started, elapsed * 1000)
+
 class ChatRequest(BaseModel):
     message: str
     thread_id: str = "default_thread"
 
 @app.on_event("startup")
 def startup_revent():
-    from .rag import initialize_vector_store
-    print("Initializing RAG Knowledge Base...")
-    initialize_vector_store()
-    print("RAG Ready.")
+    from .database import engine, Base, SessionLocal
+    from .allergens import ensure_allergen_index
+    from .batch import start_batch_workers
+    from .warmup import start_warmup
+    from .outbox import start_outbox_dispatcher
+    from .forecast import start_forecast_scheduler
+    # Create any tables added since the database was initialized
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        ensure_allergen_index(db)
+    finally:
+        db.close()
+    start_batch_workers()
+    start_outbox_dispatcher()
+    start_forecast_scheduler()
+    # Agent, indexes, knowledge base sync and model priming load in the background so the port opens
+    # immediately; /ready reports when they are done (bulk ingestion should use: python -m backend.ingest_kb)
+    start_warmup()
 
 @app.get("/")
 def read_root():
     return {"message": "Agentic Pharmacy API is running"}
 
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: warmup has finished and the agent and indexes are loaded (503 until then)."""
+    from .warmup import readiness
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
 @app.post("/chat")
 def chat_endpoint(req: ChatRequest):
     """
@@ -48,59 +103,338 @@ def chat_endpoint(req: ChatRequest):
     # For LangGraph, tracing is often automatic if LANGFUSE_PUBLIC_KEY keys are set.
 
     config = {"configurable": {"thread_id": req.thread_id}}
-    
-    from google.api_core.exceptions import ResourceExhausted
-    from fastapi import HTTPException
+
+    # Simple lookups are answered without the LLM (see router.py)
+    intent, answer = route(req.message)
+    if answer:
+        _remember_fast_path(config, req.message, answer)
+        return {"response": answer, "route": intent}
+
+    # General knowledge questions asked before (by anyone) reuse the earlier answer
+    with llm_request("interactive", req.thread_id):
+        answer = cached_answer(req.message)
+    if answer:
+        _remember_fast_path(config, req.message, answer)
+        return {"response": answer, "route": "cache"}
 
     try:
         # Invoke the agent
         # We pass the input as a dictionary with "messages"
-        response = pharmacy_graph.invoke(
-            {"messages": [HumanMessage(content=req.message)]},
-            config=config
-        )
+        start = time.perf_counter()
+        # Model calls queue behind the admission scheduler, round-robin per conversation
+        with llm_request("interactive", req.thread_id):
+            response = get_pharmacy_graph().invoke(
+                {"messages": [HumanMessage(content=req.message)]},
+                config=config
+            )
+        router_stats.record_agent(time.perf_counter() - start)
+        _record_agent_turn("chat", response["messages"])
         
         # Get the last message from AI
         ai_msg = response["messages"][-1]
+        with llm_request("interactive", req.thread_id):
+            store_answer(req.message, ai_msg.content, _turn_tool_names(response["messages"]))
         return {"response": ai_msg.content}
-    except ResourceExhausted:
-         raise HTTPException(status_code=429, detail="AI Rate limit exceeded. Please try again in a moment.")
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
          print(f"Error during agent invocation: {e}")
          raise HTTPException(status_code=500, detail=str(e))
 
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+def _turn_tool_names(messages) -> list:
+    """Names of the tools called since the last user message."""
+    names = []
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, AIMessage):
+            names.extend(call["name"] for call in msg.tool_calls)
+    return names
+
+def _record_agent_turn(endpoint: str, messages):
+    """ReAct iterations (model calls) and tool calls in the latest turn."""
+    steps = calls = 0
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, AIMessage):
+            steps += 1
+            calls += len(msg.tool_calls)
+    agent_steps.observe(steps, endpoint)
+    agent_tool_calls.observe(calls, endpoint)
+
+def _remember_fast_path(config, message: str, answer: str):
+    """Appends a fast-path exchange to the thread so follow-up turns ("order 2 of those") have context."""
+    try:
+        get_pharmacy_graph().update_state(config, {"messages": [HumanMessage(content=message), AIMessage(content=answer)]}, as_node="agent")
+    except Exception as e:
+        print(f"Could not record fast-path turn: {e}")
+
+@app.get("/router/stats")
+def get_router_stats():
+    """Fast-path router hit rate and estimated latency saved versus the agent."""
+    return router_stats.snapshot()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus exposition of tool, LLM, retrieval, DB and request histograms (this worker only)."""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/llm/scheduler")
+def get_llm_scheduler_stats():
+    """Model admission control: limits, in-flight calls, queue depth per priority, shed count."""
+    return scheduler.stats()
+
+@app.get("/answer-cache/stats")
+def get_answer_cache_stats():
+    """Semantic answer cache size, hit rate and invalidations."""
+    return answer_cache.stats()
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Runs the agent asynchronously and emits events as they happen:
+    'token' (LLM output), 'tool_call', 'tool_result', then 'done' with the final answer (or 'error').
+    """
+    config = {"configurable": {"thread_id": req.thread_id}}
+
+    # Fast-path and cached answers don't need the model
+    intent, answer = await asyncio.to_thread(route, req.message)
+    if not answer:
+        with llm_request("interactive", req.thread_id):
+            answer = await asyncio.to_thread(cached_answer, req.message)
+        intent = "cache" if answer else None
+    if not answer:
+        # Reject before the stream starts if the chat queue is already full (a 200 can't be taken back).
+        # In a worker thread: on a cold start get_llm() builds the model client.
+        def preflight():
+            with llm_request("interactive", req.thread_id):
+                scheduler.check_admission(get_llm().model)
+        try:
+            await asyncio.to_thread(preflight)
+        except Overloaded as e:
+            raise _overloaded(e)
+
+    async def event_stream():
+        if answer:
+            await asyncio.to_thread(_remember_fast_path, config, req.message, answer)
+            yield _sse({"type": "token", "content": answer})
+            yield _sse({"type": "done", "response": answer, "route": intent})
+            return
+
+        final = ""
+        tool_names = []
+        steps = 0
+        start = time.perf_counter()
+        try:
+            with llm_request("interactive", req.thread_id):
+                async for mode, chunk in get_pharmacy_graph().astream(
+                    {"messages": [HumanMessage(content=req.message)]},
+                    config=config,
+                    stream_mode=["messages", "updates"],
+                ):
+                    if mode == "messages":
+                        msg, metadata = chunk
+                        # Only stream the agent's own tokens (not tool or helper model output)
+                        if isinstance(msg, AIMessageChunk) and msg.content and metadata.get("langgraph_node") == "agent":
+                            yield _sse({"type": "token", "content": msg.content})
+                        continue
+
+                    for node, update in chunk.items():
+                        for msg in (update or {}).get("messages", []):
+                            if isinstance(msg, ToolMessage):
+                                yield _sse({"type": "tool_result", "name": msg.name, "content": msg.content})
+                            elif isinstance(msg, AIMessage) and msg.tool_calls:
+                                steps += 1
+                                for call in msg.tool_calls:
+                                    tool_names.append(call["name"])
+                                    yield _sse({"type": "tool_call", "name": call["name"], "args": call["args"]})
+                            elif isinstance(msg, AIMessage):
+                                steps += 1
+                                final = msg.content
+            router_stats.record_agent(time.perf_counter() - start)
+            agent_steps.observe(steps, "chat_stream")
+            agent_tool_calls.observe(len(tool_names), "chat_stream")
+            with llm_request("interactive", req.thread_id):
+                await asyncio.to_thread(store_answer, req.message, final, tool_names)
+            yield _sse({"type": "done", "response": final})
+        except Overloaded as e:
+            yield _sse({"type": "error", "detail": str(e), "status": e.status, "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error during streamed agent invocation: {e}")
+            yield _sse({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class CartLine(BaseModel):
+    medicine_name: str
+    quantity: int
+
+class CartOrderRequest(BaseModel):
+    patient_id: str
+    items: List[CartLine]
+    confirm_interactions: bool = False
+
+@app.post("/orders")
+def create_order(req: CartOrderRequest):
+    """
+    Places a multi-item order in a single transaction (all lines or none).
+    Rejections return 409 (stock/safety) or 422 (unknown/ambiguous items) with the reason and message.
+    """
+    from .tools import submit_cart
+
+    result = submit_cart(req.patient_id, [line.model_dump() for line in req.items], req.confirm_interactions)
+    if result["status"] != "placed":
+        status = 422 if result["reason"] in ("invalid", "unresolved") else 409
+        raise HTTPException(status_code=status, detail={"reason": result["reason"], "message": result["message"]})
+    return result
+
+@app.post("/stock/movements")
+async def post_stock_movements(request: Request, format: Optional[str] = None, batch_id: Optional[str] = None,
+                               reference: Optional[str] = None):
+    """
+    Bulk receipts, adjustments and returns streamed in the request body as CSV (text/csv) or NDJSON
+    (application/x-ndjson). batch_id makes the upload idempotent (409 if it was applied before or is being applied; a failed batch resumes).
+    """
+    from .stock_movements import apply_movements, detect_format, DuplicateBatchError
+
+    fmt = format or detect_format(content_type=request.headers.get("content-type", ""))
+    # Spooled to disk past 8MB so large files don't sit in memory while they are applied
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    body = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    try:
+        return await asyncio.to_thread(apply_movements, body, fmt, batch_id, reference)
+    except DuplicateBatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read movements: {str(e)}")
+    finally:
+        body.close()
+
+@app.get("/outbox/stats")
+def get_outbox_stats():
+    """Warehouse event outbox: pending/delivered/dead counts and the age of the oldest undelivered event."""
+    from .outbox import outbox_stats
+    return outbox_stats()
+
+@app.get("/outbox/dead")
+def get_outbox_dead_letters(limit: int = 100):
+    """Events that exhausted their retries or were rejected by the receiver."""
+    from .outbox import dead_letters
+    return {"events": dead_letters(limit)}
+
+class OutboxRetryRequest(BaseModel):
+    ids: Optional[List[int]] = None # all dead letters when omitted
+
+@app.post("/outbox/dead/retry")
+def retry_outbox_dead_letters(req: OutboxRetryRequest):
+    """Re-queues dead-lettered events with a fresh retry budget."""
+    from .outbox import retry_dead
+    return {"requeued": retry_dead(req.ids)}
+
 @app.get("/alerts")
 def get_alerts():
     """
-    Trigger predictive check and return alerts.
+    Refill alerts from the predictive check, plus medicines below their forecast reorder point
+    (precomputed by forecast.py; "reorder" has the numbers behind each stock alert).
     """
+    from .tools import LOW_STOCK_ALERT_LIMIT, format_reorder_alert
+    from .forecast import reorder_alerts
+    from .read_cache import read_cache
+
     alerts = run_predictive_check()
-    return {"alerts": alerts}
+    reorder, _ = read_cache.get_or_load(("reorder_alerts",), ("inventory", "forecast"),
+                                        lambda db: reorder_alerts(db)[:LOW_STOCK_ALERT_LIMIT])
+    return {"alerts": alerts + [format_reorder_alert(a) for a in reorder], "reorder": reorder}
+
+@app.get("/forecast/stats")
+def get_forecast_stats():
+    """Freshness of the demand forecasts and the last incremental roll-up."""
+    from .forecast import forecast_stats
+    return forecast_stats()
+
+@app.post("/forecast/run")
+async def post_forecast_run(full: bool = False):
+    """Runs the forecasting job now (e.g. after a large stock delivery) instead of waiting for the schedule."""
+    from .forecast import run_forecast
+    return await asyncio.to_thread(run_forecast, full)
+
+def _cached_json(request: Request, key, namespaces, loader) -> Response:
+    """
+    Serves a JSON body from the versioned read cache with an ETag.
+    A matching If-None-Match (e.g. the dashboard's 10s polling when nothing changed) gets a 304.
+    """
+    from .read_cache import read_cache, etag_for
+
+    body, versions = read_cache.get_or_load(key, namespaces, lambda db: json.dumps(loader(db), default=str))
+    etag = etag_for(namespaces, versions)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/inventory")
-def get_inventory():
+def get_inventory(request: Request):
     """
     Get current inventory snapshot for frontend admin.
     """
-    from .database import SessionLocal
     from .models import Medicine
-    
-    db = SessionLocal()
-    meds = db.query(Medicine).all()
-    data = [{"id": m.id, "name": m.name, "stock": m.stock, "unit": m.unit, "price": m.price, "category": m.category} for m in meds]
-    db.close()
-    return data
+
+    def load(db):
+        meds = db.query(Medicine).all()
+        return [{"id": m.id, "name": m.name, "stock": m.stock, "unit": m.unit, "price": m.price, "category": m.category} for m in meds]
+
+    return _cached_json(request, ("inventory",), ("inventory",), load)
+
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
 
 @app.get("/history")
-def get_history():
+def get_history(limit: Optional[int] = None, cursor: Optional[int] = None, since_id: Optional[int] = None):
     """
-    Get full order history for admin.
+    Order history for admin, one page at a time (newest first).
+    - limit: page size (default HISTORY_PAGE_SIZE, capped at HISTORY_MAX_PAGE_SIZE).
+    - cursor: pass the previous page's next_cursor to get older rows.
+    - since_id: delta mode, only rows newer than since_id (oldest first); pass latest_id next time.
+    Paged calls return {items, has_more, next_cursor, latest_id}. Without any of these parameters the
+    response keeps the original shape (the full history as a plain list) for existing clients.
     """
     from .database import SessionLocal
     from .models import OrderHistory
-    
+
+    paged = limit is not None or cursor is not None or since_id is not None
+    limit = max(1, min(limit or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
     db = SessionLocal()
-    history = db.query(OrderHistory).order_by(OrderHistory.id.desc()).all()
+    try:
+        query = db.query(OrderHistory)
+        if not paged:
+            history = query.order_by(OrderHistory.id.desc()).all()
+        elif since_id is not None:
+            history = query.filter(OrderHistory.id > since_id).order_by(OrderHistory.id.asc()).limit(limit + 1).all()
+        else:
+            if cursor is not None:
+                query = query.filter(OrderHistory.id < cursor)
+            history = query.order_by(OrderHistory.id.desc()).limit(limit + 1).all()
+    finally:
+        db.close()
+
+    has_more = paged and len(history) > limit
+    if paged:
+        history = history[:limit]
     data = [{
         "id": h.id, 
         "patient": h.patient_id, 
@@ -108,59 +442,135 @@ def get_history():
         "qty": h.quantity, 
         "date": h.date_purchased
     } for h in history]
-    db.close()
-    return data
+    if not paged:
+        return data
+    ids = [h.id for h in history]
+    return {
+        "items": data,
+        "has_more": has_more,
+        "next_cursor": ids[-1] if has_more and since_id is None else None,
+        "latest_id": max(ids, default=since_id),
+    }
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since_id: Optional[int] = None):
+    """
+    Server-Sent Events feed of committed changes: 'order', 'stock' and 'alert' events.
+    Starts from now unless since_id (or the Last-Event-ID header on reconnect) is given.
+    """
+    from .changes import follow_changes
+
+    last_event_id = request.headers.get("last-event-id")
+    if since_id is None and last_event_id and last_event_id.isdigit():
+        since_id = int(last_event_id)
+
+    async def event_stream():
+        yield ": connected\n\n"
+        async for change in follow_changes(since_id):
+            if await request.is_disconnected():
+                return
+            if change is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {change['id']}\n" + _sse(change)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/upload-prescription")
-async def upload_prescription(file: UploadFile = File(...)):
+async def upload_prescription(request: Request, file: UploadFile = File(...)):
     """
     Endpoint to analyze uploaded prescription images.
+    Inference runs on the vision worker pool, so the event loop stays free.
     """
-    from .vision import analyze_prescription_image
-    import json
+    from .vision import analyze_prescription_image_async, parse_prescription_json
     
     contents = await file.read()
     
     # Analyze
     try:
-        result_json_str = analyze_prescription_image(contents)
-        
-        # Robust JSON extraction using regex
-        import re
-        match = re.search(r'\{.*\}', result_json_str, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            try:
-                data = json.loads(json_str)
-            except json.JSONDecodeError:
-                data = {"raw_text": result_json_str, "error": "Found JSON-like block but failed to parse."}
-        else:
-             # Fallback if no JSON found
-             data = {"raw_text": result_json_str, "error": "No JSON object found in response."}
-             
-        return data
+        # Interactive uploads queue behind chat but ahead of batch jobs (see scheduler.py)
+        with llm_request("vision", request.client.host if request.client else "anonymous"):
+            result_json_str = await analyze_prescription_image_async(contents)
+        return parse_prescription_json(result_json_str)
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         return {"error": f"Failed to process image: {str(e)}", "raw_output": str(e)}
 
+@app.post("/prescriptions/batch")
+async def create_prescription_batch(files: List[UploadFile] = File(...)):
+    """
+    Queue many prescription images (or zip files of images) for background analysis.
+    Returns a job id; poll GET /prescriptions/batch/{job_id} or stream .../stream for results.
+    """
+    from .batch import create_job, job_to_dict
+
+    uploads = [(f.filename, await f.read()) for f in files]
+    try:
+        job = await asyncio.to_thread(create_job, uploads)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read upload: {str(e)}")
+    return job_to_dict(job)
+
+@app.get("/prescriptions/batch/stats")
+def get_prescription_batch_stats():
+    """Queue depth and recent throughput (images/minute) of the batch workers."""
+    from .batch import batch_stats
+    return batch_stats()
+
+@app.get("/prescriptions/batch/{job_id}")
+def get_prescription_batch(job_id: str, include_items: bool = True):
+    """Job progress plus per-item parsed results."""
+    from .batch import get_job
+    job = get_job(job_id, include_items)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/prescriptions/batch/{job_id}/stream")
+async def stream_prescription_batch(job_id: str):
+    """Server-Sent Events: one 'item' event per finished image, then 'done' with the job summary."""
+    from .batch import get_job, finished_items
+
+    if not await asyncio.to_thread(get_job, job_id, False):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        sent = set()
+        while True:
+            for item in await asyncio.to_thread(finished_items, job_id, sent):
+                sent.add(item["id"])
+                yield _sse({"type": "item", **item})
+            job = await asyncio.to_thread(get_job, job_id, False)
+            if job["status"] == "completed" and len(sent) >= job["done"] + job["failed"]:
+                yield _sse({"type": "done", **job})
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/patients")
-def get_patients():
+def get_patients(request: Request):
     """
     List all patients for admin view.
     """
-    from .database import SessionLocal
     from .models import Patient
-    
-    db = SessionLocal()
-    patients = db.query(Patient).all()
-    data = [{
-        "id": p.id,
-        "name": p.name,
-        "age": p.age,
-        "allergies": p.allergies,
-        "conditions": p.conditions
-    } for p in patients]
-    db.close()
-    return data
+
+    def load(db):
+        patients = db.query(Patient).all()
+        return [{
+            "id": p.id,
+            "name": p.name,
+            "age": p.age,
+            "allergies": p.allergies,
+            "conditions": p.conditions
+        } for p in patients]
+
+    return _cached_json(request, ("patients",), ("patients",), load)
 
 @app.get("/patient/current")
 def get_current_patient():
@@ -0,0 +1,330 @@
+import os
+import re
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter
+from functools import wraps
+
+# In-process instrumentation for the hot paths, exposed in Prometheus text format on /metrics.
+# Histograms cover every agent tool, LLM call (with token counts), embedding, retrieval and SQL statement,
+# plus ReAct steps per agent turn and HTTP request latency. Values are per worker process
+# (scrape each uvicorn worker, or run one worker per port).
+#
+# Optional slow-request profiler: with SLOW_REQUEST_PROFILE_MS > 0, a sampler thread records the stacks
+# of the threads working on each request; requests slower than the threshold are written to
+# PROFILE_DIR as folded stacks ("frame;frame;frame count"), ready for flamegraph.pl or speedscope.
+
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "../data/profiles"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+STEP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 25)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus semantics: _bucket, _sum, _count)."""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        """label values -> {"count", "sum"} (for JSON stats and tests)."""
+        with self._lock:
+            return {labels: {"count": sum(s[:-1]), "sum": s[-1]} for labels, s in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(s)) for labels, s in self._series.items())
+        for labels, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labelnames + ('le',), labels + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in values)
+        return lines
+
+
+class GaugeMetric:
+    """Current values computed at scrape time by fn() -> {label values: value}."""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        values = sorted(self.fn().items()) if self.fn else []
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in values)
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+http_request_seconds = register(Histogram(
+    "pharmacy_http_request_duration_seconds", "HTTP request latency (until response headers).",
+    ("method", "path", "status")))
+tool_seconds = register(Histogram(
+    "pharmacy_tool_duration_seconds", "Agent tool execution time.", ("tool", "status")))
+llm_seconds = register(Histogram(
+    "pharmacy_llm_call_duration_seconds", "Chat model call latency.", ("model", "status")))
+llm_tokens = register(Histogram(
+    "pharmacy_llm_tokens", "Tokens per chat model call.", ("model", "kind"), TOKEN_BUCKETS))
+llm_tokens_total = register(CounterMetric(
+    "pharmacy_llm_tokens_total", "Tokens processed by chat models.", ("model", "kind")))
+embedding_seconds = register(Histogram(
+    "pharmacy_embedding_duration_seconds", "Embedding model call latency (cache misses only).", ("kind",)))
+retrieval_seconds = register(Histogram(
+    "pharmacy_retrieval_duration_seconds", "Knowledge base retrieval latency (embedding + Chroma search).", ("status",)))
+db_query_seconds = register(Histogram(
+    "pharmacy_db_query_duration_seconds", "SQL statement execution time.", ("operation", "table")))
+agent_steps = register(Histogram(
+    "pharmacy_agent_steps", "Model calls (ReAct iterations) per agent turn.", ("endpoint",), STEP_BUCKETS))
+agent_tool_calls = register(Histogram(
+    "pharmacy_agent_tool_calls", "Tool calls per agent turn.", ("endpoint",), STEP_BUCKETS))
+llm_queue_wait_seconds = register(Histogram(
+    "pharmacy_llm_queue_wait_seconds", "Time a model call waited for an admission slot.", ("model", "priority")))
+llm_shed_total = register(CounterMetric(
+    "pharmacy_llm_shed_total", "Model calls rejected by admission control.", ("model", "priority", "reason")))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------- tools
+
+def timed_tool(fn):
+    """Records a tool's latency; keeps the signature and docstring the agent builds its schema from."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        attach_profile()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = fn(*args, **kwargs)
+            status = "error" if isinstance(result, str) and result.startswith("Error") else "ok"
+            return result
+        finally:
+            tool_seconds.observe(time.perf_counter() - start, fn.__name__, status)
+    return wrapper
+
+
+# ---------------------------------------------------------------- database
+
+_TABLE = re.compile(r"\b(?:from|into|update|table)\s+[\"`]?(\w+)", re.I)
+
+
+def _statement_labels(statement: str) -> tuple:
+    text = statement.lstrip()
+    operation = text.split(None, 1)[0].lower() if text else "other"
+    match = _TABLE.search(text)
+    return operation, match.group(1) if match else ""
+
+
+def instrument_engine(engine):
+    """Times every statement run on the engine (labelled by operation and main table)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        attach_profile()
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        db_query_seconds.observe(time.perf_counter() - start, *_statement_labels(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+# ---------------------------------------------------------------- slow-request profiler
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+# Thread ident -> the profile it is currently working for. Pool threads move between requests, so a
+# thread is only sampled for the request that attached it last, and is detached when that request ends.
+_attached = {}
+
+
+class RequestProfile:
+    def __init__(self, label: str):
+        self.label = label
+        self.threads = set()
+        self.stacks = Counter()
+
+
+def attach_profile():
+    """Marks the calling thread as working on the current request (no-op unless profiling)."""
+    profile = _current_profile.get()
+    if profile is not None:
+        ident = threading.get_ident()
+        _attached[ident] = profile
+        profile.threads.add(ident)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of threads attached to in-flight requests and dumps the slow ones."""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_PROFILE_MS, interval_ms: float = PROFILE_INTERVAL_MS,
+                 out_dir: str = PROFILE_DIR):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def start(self, label: str):
+        """Begins sampling for the current request; returns a token for finish()."""
+        profile = RequestProfile(label)
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        token = _current_profile.set(profile)
+        attach_profile()
+        return profile, token
+
+    def finish(self, started, elapsed_ms: float):
+        profile, token = started
+        _current_profile.reset(token)
+        with self._lock:
+            self._active.discard(profile)
+            for ident in profile.threads:
+                if _attached.get(ident) is profile:
+                    del _attached[ident]
+        if elapsed_ms >= self.threshold_ms and profile.stacks:
+            self._dump(profile, elapsed_ms)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for profile in active:
+                for ident in list(profile.threads):
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own and _attached.get(ident) is profile:
+                        profile.stacks[_fold(frame)] += 1
+
+    def _dump(self, profile, elapsed_ms: float):
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            slug = re.sub(r"[^\w.-]+", "_", profile.label).strip("_")
+            path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed_ms)}ms-{slug}.folded")
+            with open(path, "w") as f:
+                for stack, count in profile.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"Slow request ({elapsed_ms:.0f} ms): {profile.label} -> {path}")
+        except OSError as e:
+            print(f"Could not write request profile: {e}")
+
+
+profiler = SlowRequestProfiler()
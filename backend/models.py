@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float
+from sqlalchemy import Column, Integer, String, Boolean, Float, Date, DateTime, Text, UniqueConstraint, Index
 from .database import Base
 
 class Medicine(Base):
@@ -31,4 +31,156 @@ class OrderHistory(Base):
     medicine = Column(String)
     dosage = Column(String)
     quantity = Column(Integer)
-    date_purchased = Column(String)
+    date_purchased = Column(Date)
+
+class LastPurchase(Base):
+    """Latest purchase per (patient, medicine), maintained incrementally by place_order."""
+    __tablename__ = "last_purchases"
+    __table_args__ = (UniqueConstraint("patient_id", "medicine", name="uq_last_purchase_patient_medicine"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(String, nullable=False)
+    medicine = Column(String, nullable=False)
+    dosage = Column(String)
+    quantity = Column(Integer)
+    last_purchased = Column(Date, nullable=False)
+    refill_due = Column(Date, index=True) # last_purchased + days of supply
+
+class PrescriptionJob(Base):
+    """A batch of prescription images processed in the background."""
+    __tablename__ = "prescription_jobs"
+    
+    id = Column(String, primary_key=True) # uuid
+    status = Column(String, default="queued") # queued | running | completed
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class PrescriptionJobItem(Base):
+    __tablename__ = "prescription_job_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, index=True)
+    filename = Column(String)
+    image_path = Column(String)
+    status = Column(String, default="pending", index=True) # pending | running | done | failed
+    result = Column(Text) # parsed JSON
+    error = Column(String)
+    lease_until = Column(DateTime) # while running: when another worker may reclaim it
+    finished_at = Column(DateTime)
+
+class DataVersion(Base):
+    """Per-namespace version counter, bumped on every commit that changes the namespace's tables (see read_cache.py)."""
+    __tablename__ = "data_versions"
+    
+    name = Column(String, primary_key=True) # e.g. "inventory", "patients"
+    version = Column(Integer, nullable=False, default=0)
+
+class ChangeEvent(Base):
+    """Append-only feed of committed changes (orders, stock levels, alerts) for the admin dashboard."""
+    __tablename__ = "change_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # order | stock | stock_batch | alert
+    payload = Column(Text) # JSON
+    created_at = Column(DateTime)
+
+class StockMovement(Base):
+    """Ledger of bulk stock changes (receipts, adjustments, returns), one row per applied line (see stock_movements.py)."""
+    __tablename__ = "stock_movements"
+    
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(String, nullable=False, index=True)
+    line_no = Column(Integer) # line in the uploaded file
+    medicine_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False) # receipt | adjustment | return
+    quantity = Column(Integer, nullable=False) # signed stock delta
+    stock_after = Column(Integer)
+    reference = Column(String) # e.g. delivery note or RMA number
+    created_at = Column(DateTime)
+
+class StockBatch(Base):
+    """One row per stock movement batch id: claims the id and records how far a batch got (see stock_movements.py)."""
+    __tablename__ = "stock_batches"
+    
+    batch_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False) # applying | applied | failed
+    applied_through_line = Column(Integer, nullable=False, default=0) # lines up to here are committed
+    error = Column(String)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class OutboxEvent(Base):
+    """Events for external systems (warehouse fulfillment), written in the same commit as the change (see outbox.py)."""
+    __tablename__ = "outbox_events"
+    __table_args__ = (Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),)
+    
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False) # e.g. "order.placed"
+    idempotency_key = Column(String, nullable=False, unique=True)
+    payload = Column(Text) # JSON
+    status = Column(String, nullable=False, default="pending") # pending | delivered | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime) # also the claim lease while a delivery is in flight
+    last_error = Column(String)
+    created_at = Column(DateTime)
+    delivered_at = Column(DateTime)
+
+class DailyDemand(Base):
+    """Units sold per medicine per day, rolled up incrementally from OrderHistory (see forecast.py)."""
+    __tablename__ = "daily_demand"
+    __table_args__ = (UniqueConstraint("medicine_id", "day", name="uq_daily_demand_medicine_day"),)
+    
+    id = Column(Integer, primary_key=True)
+    medicine_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+class DemandForecast(Base):
+    """Per-medicine consumption statistics and reorder point, recomputed by the forecasting job."""
+    __tablename__ = "demand_forecasts"
+    
+    medicine_id = Column(Integer, primary_key=True)
+    daily_mean = Column(Float, nullable=False) # units/day over the window (velocity)
+    daily_std = Column(Float, nullable=False) # day-to-day variability
+    safety_stock = Column(Float, nullable=False)
+    reorder_point = Column(Float, nullable=False) # expected lead-time demand + safety stock
+    stock = Column(Integer) # at computation time
+    days_of_cover = Column(Float) # stock / daily_mean at computation time; NULL when nothing sells
+    as_of = Column(Date) # last day of the window
+    computed_at = Column(DateTime)
+
+class ForecastRun(Base):
+    """An incremental roll-up of OrderHistory ids (from_order_id, to_order_id]; the unique start stops two workers rolling up the same orders."""
+    __tablename__ = "forecast_runs"
+    
+    id = Column(Integer, primary_key=True)
+    from_order_id = Column(Integer, nullable=False, unique=True)
+    to_order_id = Column(Integer, nullable=False)
+    orders = Column(Integer) # history rows read
+    unmatched = Column(Integer) # rows whose medicine is not in the catalog
+    started_at = Column(DateTime)
+    seconds = Column(Float)
+
+class PatientAllergy(Base):
+    """Normalized allergy terms per patient, derived from Patient.allergies (see allergens.py)."""
+    __tablename__ = "patient_allergies"
+    __table_args__ = (Index("ix_patient_allergies_patient_allergen", "patient_id", "allergen", unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    patient_id = Column(Integer, nullable=False)
+    allergen = Column(String, nullable=False) # e.g. "penicillin", "sulfonamide", "peanut"
+
+class MedicineAllergen(Base):
+    """Precomputed medicine -> ingredient/drug class terms a patient can be allergic to."""
+    __tablename__ = "medicine_allergens"
+    __table_args__ = (Index("ix_medicine_allergens_medicine_allergen", "medicine_id", "allergen", unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    medicine_id = Column(Integer, nullable=False)
+    allergen = Column(String, nullable=False, index=True) # ingredient or class, e.g. "amoxicillin", "penicillin"
+    ingredient = Column(String) # the ingredient that carries it
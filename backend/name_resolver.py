@@ -0,0 +1,255 @@
+import re
+import threading
+from collections import Counter
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.dialects.sqlite import insert
+from .models import Medicine, Patient, DataVersion
+from .read_cache import get_versions
+
+# In-memory trigram indexes for fuzzy name lookup.
+# Replaces ILIKE '%x%' scans (which SQLite can't serve from the name index) with
+# ranked, typo-tolerant matching. Kept in sync through ORM insert/update/delete events, applied
+# when the writing transaction commits; writes by other processes are picked up through a version
+# counter in data_versions (see _ModelIndex).
+
+MIN_SCORE = 0.45
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_STRENGTH_GAP = re.compile(r"\b(\d+) (mg|mcg|g|ml|iu)\b")
+
+
+def normalize_name(text: str) -> str:
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {normalize_name(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted trigram index: id -> name, trigram -> ids."""
+
+    def __init__(self):
+        self.names = {}
+        self.grams = {}
+        self.postings = {}
+        self.lock = threading.RLock()
+
+    def add(self, item_id: int, name: str):
+        with self.lock:
+            self.remove(item_id)
+            grams = trigrams(name)
+            self.names[item_id] = normalize_name(name)
+            self.grams[item_id] = grams
+            for g in grams:
+                self.postings.setdefault(g, set()).add(item_id)
+
+    def remove(self, item_id: int):
+        with self.lock:
+            for g in self.grams.pop(item_id, ()):
+                ids = self.postings.get(g)
+                if ids:
+                    ids.discard(item_id)
+                    if not ids:
+                        del self.postings[g]
+            self.names.pop(item_id, None)
+
+    def search(self, query: str, limit: int = 5, min_score: float = MIN_SCORE) -> list:
+        """Returns [(id, score)] best first. Exact and prefix/substring matches rank above fuzzy ones."""
+        q_norm = normalize_name(query)
+        q_grams = trigrams(query)
+        if not q_norm:
+            return []
+        with self.lock:
+            shared = Counter()
+            for g in q_grams:
+                for item_id in self.postings.get(g, ()):
+                    shared[item_id] += 1
+
+            scored = []
+            for item_id, count in shared.items():
+                name = self.names[item_id]
+                dice = 2 * count / (len(q_grams) + len(self.grams[item_id]))
+                containment = count / len(q_grams)
+                score = 0.5 * dice + 0.5 * containment
+                if score < min_score:
+                    continue
+                if name == q_norm:
+                    score += 2
+                elif name.startswith(q_norm):
+                    score += 1
+                elif q_norm in name:
+                    score += 0.5
+                scored.append((item_id, score))
+
+        scored.sort(key=lambda x: (-x[1], self.names[x[0]]))
+        return scored[:limit]
+
+
+class _ModelIndex:
+    """
+    Lazily builds a TrigramIndex over one model's name column.
+    The index is tagged with the model's name version (data_versions row `namespace`, bumped by every
+    commit that adds, renames or deletes rows) and rebuilt when another process's write moves it on.
+    """
+
+    def __init__(self, model, namespace):
+        self.model = model
+        self.namespace = namespace
+        self.index = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, db) -> TrigramIndex:
+        version = get_versions(db, (self.namespace,))[0]
+        if self.index is None or self.version != version:
+            with self.lock:
+                if self.index is None or self.version != version:
+                    index = TrigramIndex()
+                    for item_id, name in db.query(self.model.id, self.model.name):
+                        index.add(item_id, name)
+                    self.index, self.version = index, version
+        return self.index
+
+    def invalidate(self):
+        """Forces a rebuild on next use (e.g. after bulk inserts that bypass ORM events)."""
+        with self.lock:
+            self.index = None
+
+    def apply(self, changes, version: int):
+        """Applies this process's committed [(id, name or None to remove)] that produced `version`."""
+        with self.lock:
+            index = self.index
+            if index is None:
+                return
+            if self.version != version - 1:
+                # Someone else wrote in between: rebuild rather than patch
+                self.index = None
+                return
+            for item_id, name in changes:
+                if name is None:
+                    index.remove(item_id)
+                else:
+                    index.add(item_id, name)
+            self.version = version
+
+
+medicine_index = _ModelIndex(Medicine, "medicine_names")
+patient_index = _ModelIndex(Patient, "patient_names")
+
+
+def _register(model, model_index):
+    # Changes are collected per session at flush time and only reach the index once the
+    # transaction commits (a rollback discards them).
+    def _collect(target, name):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault("name_index_changes", []).append((model_index, target.id, name))
+
+    @event.listens_for(model, "after_insert")
+    def _insert(mapper, connection, target):
+        _collect(target, target.name)
+
+    @event.listens_for(model, "after_update")
+    def _update(mapper, connection, target):
+        if inspect(target).attrs.name.history.has_changes():
+            _collect(target, target.name)
+
+    @event.listens_for(model, "after_delete")
+    def _delete(mapper, connection, target):
+        _collect(target, None)
+
+
+_register(Medicine, medicine_index)
+_register(Patient, patient_index)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_name_versions(session):
+    session.flush()
+    changes = session.info.get("name_index_changes")
+    if not changes:
+        return
+    versions = {}
+    for model_index in {c[0] for c in changes}:
+        stmt = insert(DataVersion).values(name=model_index.namespace, version=1).on_conflict_do_update(
+            index_elements=[DataVersion.name], set_={"version": DataVersion.version + 1}).returning(DataVersion.version)
+        versions[model_index] = session.execute(stmt).scalar_one()
+    session.info["name_index_versions"] = versions
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_name_changes(session):
+    changes = session.info.pop("name_index_changes", None)
+    versions = session.info.pop("name_index_versions", None)
+    if not changes or not versions:
+        return
+    for model_index, version in versions.items():
+        model_index.apply([(item_id, name) for m, item_id, name in changes if m is model_index], version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_name_changes(session):
+    session.info.pop("name_index_changes", None)
+    session.info.pop("name_index_versions", None)
+
+
+def _fetch_ranked(db, model, ranked):
+    if not ranked:
+        return []
+    rows = {r.id: r for r in db.query(model).filter(model.id.in_([i for i, _ in ranked])).all()}
+    return [(rows[i], score) for i, score in ranked if i in rows]
+
+
+def resolve_medicines(db, query: str, limit: int = 5) -> list:
+    """Returns [(Medicine, score)] ranked best first."""
+    return _fetch_ranked(db, Medicine, medicine_index.get(db).search(query, limit))
+
+
+def _strength_key(text: str) -> str:
+    # "500 mg" and "500mg" name the same strength
+    return _STRENGTH_GAP.sub(r"\1\2", normalize_name(text))
+
+
+def resolve_medicine(db, query: str):
+    """
+    Medicine an order line names, or (None, candidates) when it doesn't name exactly one.
+    Returns (medicine, candidates).
+    """
+    candidates = resolve_medicines(db, query)
+    # Orders are placed against the result, so typo tolerance stops here: "Prednisolone" must not
+    # become Prednisone, nor "Metformin 1000mg" Metformin 500mg. Only the one exact name resolves, or
+    # failing that the one name the query is a whole-word prefix of (so any strength given must match)
+    q_key = _strength_key(query)
+    if not q_key:
+        return None, candidates
+    for matches in ([m for m, _ in candidates if _strength_key(m.name) == q_key],
+                    [m for m, _ in candidates if _strength_key(m.name).startswith(q_key + " ")]):
+        if matches:
+            return (matches[0], candidates) if len(matches) == 1 else (None, candidates)
+    return None, candidates
+
+
+def resolve_patient(db, query: str):
+    """
+    Patient for a numeric id or name, or (None, candidates) when the name doesn't pick out exactly one.
+    Returns (patient, candidates).
+    """
+    query = (query or "").strip()
+    if query.isdigit():
+        patient = db.query(Patient).filter(Patient.id == int(query)).first()
+        return patient, [(patient, 2.0)] if patient else []
+    candidates = _fetch_ranked(db, Patient, patient_index.get(db).search(query))
+    # Orders and allergy screening run against the result, so never guess: a typo or partial name
+    # only resolves when it is the one exact match, or failing that the one name it is a prefix of
+    q_norm = normalize_name(query)
+    for matches in ([p for p, _ in candidates if normalize_name(p.name) == q_norm],
+                    [p for p, _ in candidates if normalize_name(p.name).startswith(q_norm)]):
+        if matches:
+            return (matches[0], candidates) if len(matches) == 1 else (None, candidates)
+    return None, candidates
+
+
+def describe_candidates(candidates) -> str:
+    return ", ".join(f"{p.name} (id {p.id})" for p, _ in candidates)
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from .database import SessionLocal, run_with_retry
+from .models import OutboxEvent
+from .metrics import register, Histogram, CounterMetric
+
+# Transactional outbox for external systems (warehouse fulfillment).
+# Writers add an OutboxEvent in the same transaction as the change, so an event exists exactly when
+# the order does and no HTTP call ever runs inside an order transaction. A dispatcher thread claims
+# due events in batches (a conditional UPDATE doubles as a lease, so several API workers can run one
+# each), POSTs them to FULFILLMENT_WEBHOOK_URL, and retries failures with exponential backoff and
+# jitter. Events that keep failing, or that the receiver rejects, are dead-lettered for an operator.
+#
+# Request body: {"events": [{"id": idempotency key, "topic", "attempt", "created_at", "payload"}]}.
+# Delivery is at-least-once: receivers must ignore ids they have already processed. A 2xx response
+# means every event was accepted, except ids listed in an optional {"rejected": {id: reason}}.
+
+FULFILLMENT_WEBHOOK_URL = os.getenv("FULFILLMENT_WEBHOOK_URL", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "1"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "300"))
+OUTBOX_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_TIMEOUT_SECONDS", "10"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_KEEP_DAYS = int(os.getenv("OUTBOX_KEEP_DAYS", "7"))
+PRUNE_INTERVAL_SECONDS = 3600
+
+outbox_delivery_seconds = register(Histogram(
+    "pharmacy_outbox_delivery_duration_seconds", "Outbox batch POST latency.", ("status",)))
+outbox_events_total = register(CounterMetric(
+    "pharmacy_outbox_events_total", "Outbox delivery outcomes per event.", ("outcome",)))
+
+_wakeup = threading.Event()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def enqueue(db, topic: str, payload: dict, key: str = None) -> OutboxEvent:
+    """Adds an event to the current transaction; the dispatcher is woken when the transaction commits."""
+    now = datetime.utcnow()
+    outbox_event = OutboxEvent(topic=topic, idempotency_key=key or uuid.uuid4().hex,
+                               payload=json.dumps(payload, default=str), status="pending", attempts=0,
+                               next_attempt_at=now, created_at=now)
+    db.add(outbox_event)
+    db.info["outbox_pending"] = True
+    return outbox_event
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop("outbox_pending", False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("outbox_pending", None)
+
+
+def backoff_seconds(attempts: int, retry_after: float = None) -> float:
+    """Exponential backoff with jitter, never sooner than the receiver's Retry-After."""
+    delay = min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0))
+    return max(retry_after or 0, random.uniform(delay / 2, delay))
+
+
+def _claim(db, limit: int) -> list:
+    """Leases up to limit due events to this dispatcher and counts the attempt; returns them oldest first."""
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=OUTBOX_TIMEOUT_SECONDS * 2 + 5)
+    due = db.query(OutboxEvent.id).filter(
+        OutboxEvent.status == "pending", OutboxEvent.next_attempt_at <= now
+    ).order_by(OutboxEvent.id).limit(limit).subquery()
+    # Re-checking the condition in the UPDATE means another worker's dispatcher can't claim the same rows
+    stmt = update(OutboxEvent).where(
+        OutboxEvent.id.in_(due.select()), OutboxEvent.status == "pending", OutboxEvent.next_attempt_at <= now
+    ).values(next_attempt_at=lease_until, attempts=OutboxEvent.attempts + 1).returning(
+        OutboxEvent.id, OutboxEvent.topic, OutboxEvent.idempotency_key, OutboxEvent.payload,
+        OutboxEvent.attempts, OutboxEvent.created_at)
+    rows = db.execute(stmt, execution_options={"synchronize_session": False}).all()
+    db.commit()
+    return sorted(rows, key=lambda r: r.id)
+
+
+def _post(http, events):
+    """Returns (rejected {key: reason}, error or None, retry_after seconds or None)."""
+    body = {"events": [{"id": e.idempotency_key, "topic": e.topic, "attempt": e.attempts,
+                        "created_at": e.created_at, "payload": json.loads(e.payload or "{}")} for e in events]}
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = http.post(FULFILLMENT_WEBHOOK_URL, data=json.dumps(body, default=str),
+                             headers={"Content-Type": "application/json"}, timeout=OUTBOX_TIMEOUT_SECONDS)
+        status = str(response.status_code)
+        if 200 <= response.status_code < 300:
+            try:
+                rejected = (response.json() or {}).get("rejected") or {}
+            except ValueError:
+                rejected = {}
+            return rejected, None, None
+        try:
+            retry_after = float(response.headers.get("Retry-After") or 0) or None
+        except ValueError:
+            retry_after = None  # HTTP-date form: fall back to our own backoff
+        return {}, f"HTTP {response.status_code}: {response.text[:200]}", retry_after
+    except Exception as e:
+        return {}, f"{type(e).__name__}: {e}", None
+    finally:
+        outbox_delivery_seconds.observe(time.perf_counter() - start, status)
+
+
+def _record(db, events, rejected: dict, error, retry_after):
+    now = datetime.utcnow()
+    delivered = []
+    for e in events:
+        if error is None and e.idempotency_key not in rejected:
+            delivered.append(e.id)
+            continue
+        if error is None:
+            outcome, values = "dead", {"status": "dead", "last_error": f"rejected: {rejected[e.idempotency_key]}"[:500]}
+        elif e.attempts >= OUTBOX_MAX_ATTEMPTS:
+            outcome, values = "dead", {"status": "dead", "last_error": error[:500]}
+        else:
+            outcome, values = "retry", {"last_error": error[:500],
+                                        "next_attempt_at": now + timedelta(seconds=backoff_seconds(e.attempts, retry_after))}
+        db.query(OutboxEvent).filter(OutboxEvent.id == e.id).update(values, synchronize_session=False)
+        outbox_events_total.inc(1, outcome)
+        if outcome == "dead":
+            print(f"Outbox event {e.idempotency_key} dead-lettered after {e.attempts} attempts: {values['last_error']}")
+    if delivered:
+        db.query(OutboxEvent).filter(OutboxEvent.id.in_(delivered)).update(
+            {OutboxEvent.status: "delivered", OutboxEvent.delivered_at: now, OutboxEvent.last_error: None},
+            synchronize_session=False)
+        outbox_events_total.inc(len(delivered), "delivered")
+    db.commit()
+
+
+def dispatch_once(http, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Claims, sends and records one batch; returns how many events it handled."""
+    db = SessionLocal()
+    try:
+        events = run_with_retry(db, lambda: _claim(db, limit))
+        if not events:
+            return 0
+        # The HTTP call runs with no transaction open
+        rejected, error, retry_after = _post(http, events)
+        run_with_retry(db, lambda: _record(db, events, rejected, error, retry_after))
+        return len(events)
+    finally:
+        db.close()
+
+
+def _seconds_until_due(default: float) -> float:
+    db = SessionLocal()
+    try:
+        next_at = db.query(func.min(OutboxEvent.next_attempt_at)).filter(OutboxEvent.status == "pending").scalar()
+    finally:
+        db.close()
+    if next_at is None:
+        return default
+    return min(default, max((next_at - datetime.utcnow()).total_seconds(), 0.05))
+
+
+def prune_delivered(keep_days: int = OUTBOX_KEEP_DAYS) -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=keep_days)
+        deleted = db.query(OutboxEvent).filter(
+            OutboxEvent.status == "delivered", OutboxEvent.delivered_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def _run():
+    import requests
+    http = requests.Session()
+    last_prune = 0.0
+    while True:
+        _wakeup.clear()
+        handled = 0
+        try:
+            handled = dispatch_once(http)
+            if time.time() - last_prune > PRUNE_INTERVAL_SECONDS:
+                last_prune = time.time()
+                prune_delivered()
+        except Exception as e:
+            print(f"Outbox dispatcher error: {e}")
+        if handled < OUTBOX_BATCH_SIZE:
+            # Caught up: sleep until an order commits or the next retry is due
+            try:
+                timeout = _seconds_until_due(OUTBOX_POLL_SECONDS)
+            except Exception:
+                timeout = OUTBOX_POLL_SECONDS
+            _wakeup.wait(timeout)
+
+
+def start_outbox_dispatcher():
+    """Starts the dispatcher thread; without FULFILLMENT_WEBHOOK_URL events are kept until one is configured."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher:
+            return
+        if not FULFILLMENT_WEBHOOK_URL:
+            print("FULFILLMENT_WEBHOOK_URL is not set; outbox events will be kept until it is.")
+            return
+        _dispatcher = threading.Thread(target=_run, name="outbox", daemon=True)
+        _dispatcher.start()
+
+
+def retry_dead(ids=None) -> int:
+    """Moves dead-lettered events (all, or the given ids) back to pending with a fresh attempt budget."""
+    db = SessionLocal()
+    try:
+        query = db.query(OutboxEvent).filter(OutboxEvent.status == "dead")
+        if ids:
+            query = query.filter(OutboxEvent.id.in_(ids))
+        count = query.update({OutboxEvent.status: "pending", OutboxEvent.attempts: 0,
+                              OutboxEvent.next_attempt_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    _wakeup.set()
+    return count
+
+
+def event_to_dict(e) -> dict:
+    return {"id": e.id, "key": e.idempotency_key, "topic": e.topic, "status": e.status, "attempts": e.attempts,
+            "next_attempt_at": e.next_attempt_at, "last_error": e.last_error, "created_at": e.created_at,
+            "delivered_at": e.delivered_at, "payload": json.loads(e.payload or "{}")}
+
+
+def dead_letters(limit: int = 100) -> list:
+    db = SessionLocal()
+    try:
+        events = db.query(OutboxEvent).filter(OutboxEvent.status == "dead").order_by(OutboxEvent.id.desc()).limit(limit).all()
+        return [event_to_dict(e) for e in events]
+    finally:
+        db.close()
+
+
+def outbox_stats() -> dict:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(OutboxEvent.status, func.count(OutboxEvent.id)).group_by(OutboxEvent.status).all())
+        oldest = db.query(func.min(OutboxEvent.created_at)).filter(OutboxEvent.status == "pending").scalar()
+    finally:
+        db.close()
+    return {
+        "endpoint": FULFILLMENT_WEBHOOK_URL or None,
+        "dispatcher_running": bool(_dispatcher and _dispatcher.is_alive()),
+        "pending": counts.get("pending", 0),
+        "delivered": counts.get("delivered", 0),
+        "dead": counts.get("dead", 0),
+        "oldest_pending_seconds": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None,
+    }
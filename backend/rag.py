@@ -1,57 +1,156 @@
 import os
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from langchain_core.documents import Document
+import time
+import threading
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from .metrics import embedding_seconds, retrieval_seconds
 
 # Persistence directory for the vector store
 DB_DIR = os.path.join(os.path.dirname(__file__), "../data/chroma_db")
 DATA_FILE = os.path.join(os.path.dirname(__file__), "../data/drug_interactions.txt")
 
+# Max number of query embeddings kept in memory
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "512"))
+RETRIEVER_K = 2
+
+# Process-wide singletons (created once, reused by every tool call)
+_lock = threading.Lock()
+_embeddings = None
+_vector_store = None
+_retriever = None
+
+
+def _cache_key(text: str) -> str:
+    # Lowercased for cache lookups only; the model always embeds the text as written
+    # (casing carries signal for drug names)
+    return " ".join(text.lower().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a bounded LRU cache for query embeddings.
+    Document embeddings are passed straight through (they are only computed at ingest time).
+    """
+
+    def __init__(self, base: Embeddings, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.base = base
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        with embedding_seconds.time("documents"):
+            return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = _cache_key(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        # Embed outside the lock so concurrent misses don't serialize on Ollama
+        with embedding_seconds.time("query"):
+            vector = self.base.embed_query(" ".join(text.split()))
+
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
 def get_embeddings():
-    # Using 'nomic-embed-text' if available, otherwise 'llama3.1'
-    # 'nomic-embed-text' is recommended for Ollama embeddings
-    return OllamaEmbeddings(model="nomic-embed-text")
+    """Returns the shared (cached) embedding model."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from langchain_ollama import OllamaEmbeddings
+                from .scheduler import scheduled
+                # Using 'nomic-embed-text' if available, otherwise 'llama3.1'
+                # 'nomic-embed-text' is recommended for Ollama embeddings
+                # Cache misses share Ollama with chat, so they go through admission control too (see scheduler.py)
+                _embeddings = CachedEmbeddings(scheduled(OllamaEmbeddings)(model="nomic-embed-text"))
+    return _embeddings
+
+
+def _set_vector_store(vector_store):
+    global _vector_store, _retriever
+    with _lock:
+        _vector_store = vector_store
+        _retriever = vector_store.as_retriever(search_kwargs={"k": RETRIEVER_K}) if vector_store else None
+
 
 def initialize_vector_store():
-    """Reads the text file and ingests it into ChromaDB if not already present."""
-    
-    # Check if DB exists already (simple check)
-    if os.path.exists(DB_DIR) and os.listdir(DB_DIR):
-        print("Vector store already exists. Loading...")
-        return Chroma(persist_directory=DB_DIR, embedding_function=get_embeddings())
-
-    print("Creating new vector store from data...")
+    """
+    Syncs the knowledge base file into ChromaDB.
+    Only new or changed drug sections are embedded (see ingest_kb.py), so this is cheap when nothing changed.
+    """
     if not os.path.exists(DATA_FILE):
         print(f"Warning: Data file not found at {DATA_FILE}")
         return None
 
-    with open(DATA_FILE, "r") as f:
-        text = f.read()
-
-    # Simple chunks by drug sections (splitting by double newline for this simple format)
-    # or just simple character splitting
-    sections = text.split("\n\n")
-    docs = [Document(page_content=s.strip(), metadata={"source": "drug_interactions.txt"}) for s in sections if s.strip()]
-
-    vector_store = Chroma.from_documents(
-        documents=docs,
-        embedding=get_embeddings(),
-        persist_directory=DB_DIR
-    )
+    from .ingest_kb import ingest_file
+    vector_store = get_vector_store()
+    stats = ingest_file(vector_store, DATA_FILE)
+    print(f"Knowledge base synced: {stats['embedded']} embedded, {stats['unchanged']} unchanged, {stats['deleted']} deleted.")
+    if stats["embedded"] or stats["deleted"]:
+        from .interactions import reload_interaction_index
+        from .answer_cache import answer_cache
+        reload_interaction_index()
+        answer_cache.clear()
     return vector_store
 
+def get_vector_store():
+    """Returns the process-wide Chroma store, opening the persist directory only once."""
+    global _vector_store, _retriever
+    if _vector_store is None:
+        embeddings = get_embeddings()
+        with _lock:
+            if _vector_store is None:
+                # chromadb is imported on first use; it dominates this module's import time
+                from langchain_chroma import Chroma
+                _vector_store = Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
+                _retriever = _vector_store.as_retriever(search_kwargs={"k": RETRIEVER_K})
+    return _vector_store
+
 def get_retriever():
-    vector_store = Chroma(persist_directory=DB_DIR, embedding_function=get_embeddings())
-    return vector_store.as_retriever(search_kwargs={"k": 2})
+    if _retriever is None:
+        get_vector_store()
+    return _retriever
+
+def reset_vector_store():
+    """Drops the cached store/retriever and query embeddings (e.g. after re-ingesting)."""
+    _set_vector_store(None)
+    if _embeddings is not None:
+        _embeddings.clear()
 
 def query_knowledge_base(query: str) -> str:
     """Entry point for the agent tool."""
+    start = time.perf_counter()
     try:
         retriever = get_retriever()
         docs = retriever.invoke(query)
+        retrieval_seconds.observe(time.perf_counter() - start, "ok")
         if not docs:
             return "No relevant information found in the knowledge base."
-        
+
         return "\n\n".join([d.page_content for d in docs])
     except Exception as e:
+        retrieval_seconds.observe(time.perf_counter() - start, "error")
         return f"Error querying knowledge base: {str(e)}"
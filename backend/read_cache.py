@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert
+from .database import SessionLocal
+from .models import DataVersion, Medicine, Patient
+
+# Versioned read cache for inventory/patient reads (tool results and admin endpoints).
+# Each namespace has a version row in data_versions that is bumped inside the same transaction
+# as any write to its tables, so every worker process sees the change on its next read.
+# A read costs one primary-key lookup of the versions instead of re-querying and re-formatting rows;
+# the version is also used as the HTTP ETag.
+
+READ_CACHE_SIZE = 1024
+
+# Model -> namespaces invalidated when its rows change
+NAMESPACES = {Medicine: ("inventory",), Patient: ("patients",)}
+
+
+def _touch(session, namespaces):
+    session.info.setdefault("touched_namespaces", set()).update(namespaces)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        _touch(session, NAMESPACES.get(type(obj), ()))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(orm_execute_state):
+    # query(...).update()/delete() (e.g. the conditional stock reservation in place_order)
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _touch(orm_execute_state.session, NAMESPACES.get(mapper.class_, ()))
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_on_commit(session):
+    # Pending ORM changes are otherwise flushed after this hook runs
+    session.flush()
+    touched = session.info.pop("touched_namespaces", None)
+    if touched:
+        session.execute(_bump_stmt(), [{"name": name, "version": 1} for name in sorted(touched)])
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("touched_namespaces", None)
+
+
+def _bump_stmt():
+    stmt = insert(DataVersion)
+    return stmt.on_conflict_do_update(index_elements=[DataVersion.name], set_={"version": DataVersion.version + 1})
+
+
+def bump_versions(connection, *namespaces):
+    """For writes that bypass the ORM session (bulk imports through engine.begin())."""
+    connection.execute(_bump_stmt(), [{"name": name, "version": 1} for name in namespaces])
+
+
+def get_versions(db, namespaces) -> tuple:
+    rows = dict(db.query(DataVersion.name, DataVersion.version).filter(DataVersion.name.in_(namespaces)).all())
+    return tuple(rows.get(name, 0) for name in namespaces)
+
+
+def etag_for(namespaces, versions) -> str:
+    return 'W/"' + "-".join(f"{n}.{v}" for n, v in zip(namespaces, versions)) + '"'
+
+
+class ReadCache:
+    """LRU of key -> (versions, value); an entry is only served while its namespace versions are current."""
+
+    def __init__(self, max_size: int = READ_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, namespaces, loader, db=None):
+        """
+        Returns (value, versions). loader(db) computes the value on a miss.
+        Pass db to reuse an open session; otherwise one is opened for the version check.
+        """
+        own = db is None
+        db = db or SessionLocal()
+        try:
+            versions = get_versions(db, namespaces)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] == versions:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], versions
+                self.misses += 1
+            value = loader(db)
+            with self._lock:
+                self._entries[key] = (versions, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return value, versions
+        finally:
+            if own:
+                db.close()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+read_cache = ReadCache()
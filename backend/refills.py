@@ -0,0 +1,156 @@
+import os
+import re
+from datetime import date, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from .models import OrderHistory, LastPurchase
+
+# Refill prediction.
+# Instead of scanning all of OrderHistory on every /alerts call, the latest purchase per
+# (patient, medicine) is kept in last_purchases together with the date the supply runs out.
+# place_order updates it in the same transaction as the history row; /alerts is a range
+# query on the indexed refill_due column.
+
+# Typical doses per day and the strength of one such dose (mg). A purchase's daily consumption is
+# derived from its own strength: 1000mg paracetamol at the usual 3 x 500mg/day lasts twice as long
+# per tablet. The doses-per-day figure alone is only a fallback for purchases without a parseable
+# strength (e.g. dosage "N/A" and no strength in the name).
+DAILY_DOSES = {
+    "paracetamol": (3, 500),
+    "ibuprofen": (3, 400),
+    "amoxicillin": (3, 500),
+    "metformin": (2, 500),
+    "gabapentin": (3, 300),
+    "ciprofloxacin": (2, 500),
+    "doxycycline": (2, 100),
+    "furosemide": (1, 40),
+    "tramadol": (2, 50),
+}
+DEFAULT_DOSES_PER_DAY = float(os.getenv("DEFAULT_DOSES_PER_DAY", "1"))
+# Fallback supply for units that aren't taken per dose (inhalers, pens)
+DEFAULT_SUPPLY_DAYS = int(os.getenv("DEFAULT_SUPPLY_DAYS", "30"))
+# Alert window around the day the supply runs out
+REFILL_LEAD_DAYS = int(os.getenv("REFILL_LEAD_DAYS", "5"))
+REFILL_GRACE_DAYS = int(os.getenv("REFILL_GRACE_DAYS", "5"))
+
+_STRENGTH_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(mcg|mg|g)\b", re.IGNORECASE)
+_MG_PER_UNIT = {"mcg": 0.001, "mg": 1.0, "g": 1000.0}
+
+
+def strength_mg(*texts) -> float:
+    """Per-unit strength in mg from the first text that has one ('500mg', 'Levothyroxine 50mcg'); None if absent."""
+    for text in texts:
+        match = _STRENGTH_RE.search(text or "")
+        if match:
+            mg = float(match.group(1)) * _MG_PER_UNIT[match.group(2).lower()]
+            if mg > 0:
+                return mg
+    return None
+
+
+def units_per_day(medicine: str, dosage: str = None) -> float:
+    """Units taken per day: the usual daily amount divided by the purchased strength when both are known."""
+    base = (medicine or "").split(" ")[0].lower()
+    usual = DAILY_DOSES.get(base)
+    if usual is None:
+        return DEFAULT_DOSES_PER_DAY
+    doses, dose_mg = usual
+    # The catalog puts the strength in the name ("Paracetamol 500mg") with dosage "N/A"; history splits them
+    purchased_mg = strength_mg(dosage, medicine)
+    if purchased_mg is None:
+        return doses
+    return doses * dose_mg / purchased_mg
+
+
+def supply_days(medicine: str, quantity, dosage: str = None) -> int:
+    """Days a purchase lasts: quantity over the daily consumption at the purchased strength."""
+    if not quantity or quantity <= 0:
+        return DEFAULT_SUPPLY_DAYS
+    return max(1, round(quantity / units_per_day(medicine, dosage)))
+
+
+def refill_due_date(medicine: str, quantity, purchased_on: date, dosage: str = None) -> date:
+    return purchased_on + timedelta(days=supply_days(medicine, quantity, dosage))
+
+
+def record_purchase(db, patient_id: str, medicine: str, dosage: str, quantity: int, purchased_on: date):
+    """
+    Upserts the latest purchase for (patient, medicine). Older purchases never overwrite newer ones.
+    Does not commit; call inside the order transaction.
+    """
+    stmt = insert(LastPurchase).values(
+        patient_id=patient_id,
+        medicine=medicine,
+        dosage=dosage,
+        quantity=quantity,
+        last_purchased=purchased_on,
+        refill_due=refill_due_date(medicine, quantity, purchased_on, dosage),
+    )
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LastPurchase.patient_id, LastPurchase.medicine],
+        set_={
+            "dosage": excluded.dosage,
+            "quantity": excluded.quantity,
+            "last_purchased": excluded.last_purchased,
+            "refill_due": excluded.refill_due,
+        },
+        where=excluded.last_purchased >= LastPurchase.last_purchased,
+    )
+    db.execute(stmt)
+
+
+def rebuild_last_purchases(db, batch_size: int = 10000) -> int:
+    """Recomputes last_purchases from the full OrderHistory (one-off backfill). Returns row count."""
+    db.query(LastPurchase).delete(synchronize_session=False)
+    latest = (
+        db.query(
+            OrderHistory.patient_id,
+            OrderHistory.medicine,
+            func.max(OrderHistory.date_purchased).label("last_purchased"),
+        )
+        .group_by(OrderHistory.patient_id, OrderHistory.medicine)
+        .subquery()
+    )
+    # Quantity/dosage come from the most recent order on that date
+    rows = (
+        db.query(OrderHistory.patient_id, OrderHistory.medicine, OrderHistory.dosage,
+                 OrderHistory.quantity, OrderHistory.date_purchased)
+        .join(latest, (OrderHistory.patient_id == latest.c.patient_id)
+              & (OrderHistory.medicine == latest.c.medicine)
+              & (OrderHistory.date_purchased == latest.c.last_purchased))
+        .order_by(OrderHistory.id)
+    )
+    records = {}
+    for patient_id, medicine, dosage, quantity, purchased_on in rows.yield_per(batch_size):
+        records[(patient_id, medicine)] = {
+            "patient_id": patient_id,
+            "medicine": medicine,
+            "dosage": dosage,
+            "quantity": quantity,
+            "last_purchased": purchased_on,
+            "refill_due": refill_due_date(medicine, quantity, purchased_on, dosage),
+        }
+    values = list(records.values())
+    for i in range(0, len(values), batch_size):
+        db.execute(insert(LastPurchase), values[i:i + batch_size])
+    db.commit()
+    return len(values)
+
+
+def ensure_last_purchases(db):
+    """Backfills the aggregate if it is empty but history exists (e.g. first start after upgrading)."""
+    if db.query(LastPurchase.id).first() is None and db.query(OrderHistory.id).first() is not None:
+        rebuild_last_purchases(db)
+
+
+def due_refills(db, today: date = None) -> list:
+    """Purchases whose supply runs out within the alert window around today."""
+    today = today or date.today()
+    return (
+        db.query(LastPurchase)
+        .filter(LastPurchase.refill_due.between(today - timedelta(days=REFILL_GRACE_DAYS),
+                                                today + timedelta(days=REFILL_LEAD_DAYS)))
+        .order_by(LastPurchase.refill_due)
+        .all()
+    )
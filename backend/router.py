@@ -0,0 +1,194 @@
+import os
+import re
+import time
+import threading
+from sqlalchemy import func
+from .database import SessionLocal
+from .models import OrderHistory
+from .name_resolver import resolve_medicines, resolve_patient
+from .tools import get_patient_history, check_low_stock_alerts
+
+# Deterministic fast path in front of the agent.
+# Simple, unambiguous requests ("do you have X", "any low stock", "what did John Doe buy")
+# are answered straight from the database with a templated reply, skipping the two or more
+# LLM calls a ReAct turn costs. Anything that doesn't match a rule confidently goes to the agent.
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ROUTER", "1") != "0"
+# Minimum name-resolver score for a stock answer (exact = 2+, prefix = 1+, one-letter typo ~0.6-0.8).
+# The reply always names the matched product, so a corrected typo is visible to the user.
+MIN_MATCH_SCORE = float(os.getenv("FAST_PATH_MIN_MATCH_SCORE", "0.6"))
+MAX_SLOT_WORDS = 4
+
+_FILLER = re.compile(r"^(?:(?:hi|hello|hey|please|pls|ok|okay)[\s,]+)+|[\s,]+(?:please|pls|thanks|thank you)$")
+_SLOT_STOPWORDS = {"anything", "something", "any", "for", "with", "and", "or", "that", "which", "if", "me", "i", "my", "we", "our", "you"}
+_SELF = {"i", "we", "me", "my", "us"}
+
+_MED = r"(?P<med>[a-z0-9][a-z0-9 .\-]*?)"
+_PATIENT = r"(?P<patient>[a-z0-9][a-z0-9 .\-']*?)"
+
+# (intent, pattern) - patterns match the whole normalized message
+RULES = [
+    ("stock", re.compile(rf"^(?:do|does) (?:you|u|the pharmacy|your pharmacy) (?:have|stock|carry|sell)(?: any)? {_MED}(?: in stock| available)?$")),
+    ("stock", re.compile(rf"^(?:is|are) (?:there )?(?:any )?{_MED} (?:in stock|available)$")),
+    ("stock", re.compile(rf"^(?:check )?(?:the )?(?:stock|availability) (?:of|for) {_MED}$")),
+    ("stock", re.compile(rf"^how (?:many|much) {_MED} (?:do you have|is left|are left|left|in stock)$")),
+    ("low_stock", re.compile(r"^(?:(?:any|show|list|check)(?: me)? )?(?:the )?(?:low[ -]stock|low inventory)(?: items| medicines| alerts| levels)?$")),
+    ("low_stock", re.compile(r"^(?:what|which)(?: medicines| items)? (?:is|are) (?:running )?low(?: on stock| in stock)?$")),
+    ("history", re.compile(rf"^what (?:did|has|have) {_PATIENT} (?:buy|bought|purchase|purchased|order|ordered)(?: before| recently| previously| so far)?$")),
+    ("history", re.compile(rf"^(?:show |get )?(?:the )?(?:order |purchase )?history (?:for|of) {_PATIENT}$")),
+    ("history", re.compile(rf"^{_PATIENT}'s (?:order |purchase )?history$")),
+]
+
+
+class RouterStats:
+    """Hit rate and an estimate of the latency saved (agent latency minus fast-path latency)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.misses = 0
+        self.fast_seconds = 0.0
+        self.agent_turns = 0
+        self.agent_seconds = 0.0
+
+    def record_hit(self, intent: str, seconds: float):
+        with self.lock:
+            self.hits[intent] = self.hits.get(intent, 0) + 1
+            self.fast_seconds += seconds
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def record_agent(self, seconds: float):
+        with self.lock:
+            self.agent_turns += 1
+            self.agent_seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            avg_agent = self.agent_seconds / self.agent_turns if self.agent_turns else None
+            avg_fast = self.fast_seconds / hits if hits else None
+            saved = (avg_agent - avg_fast) * hits if avg_agent is not None and hits else 0.0
+            return {
+                "enabled": FAST_PATH_ENABLED,
+                "requests": total,
+                "hits": hits,
+                "hits_by_intent": dict(self.hits),
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "avg_fast_path_ms": round(avg_fast * 1000, 2) if avg_fast is not None else None,
+                "avg_agent_ms": round(avg_agent * 1000, 2) if avg_agent is not None else None,
+                "estimated_seconds_saved": round(max(saved, 0.0), 2),
+            }
+
+
+stats = RouterStats()
+
+
+def _normalize(message: str) -> str:
+    text = " ".join(message.lower().replace("’", "'").split())
+    text = text.rstrip("?!. ")
+    return _FILLER.sub("", text).strip()
+
+
+def _valid_slot(slot: str) -> bool:
+    words = slot.split()
+    return 0 < len(words) <= MAX_SLOT_WORDS and not (set(words) & _SLOT_STOPWORDS)
+
+
+def classify(message: str):
+    """Returns (intent, slot) for a confidently matched simple request, else (None, None)."""
+    text = _normalize(message or "")
+    for intent, pattern in RULES:
+        m = pattern.match(text)
+        if not m:
+            continue
+        slot = (m.groupdict().get("med") or m.groupdict().get("patient") or "").strip()
+        if intent == "history" and (slot in _SELF or not _valid_slot(slot)):
+            # "What did I buy" needs the patient's identity, which only the conversation has
+            return None, None
+        if intent == "stock" and not _valid_slot(slot):
+            return None, None
+        return intent, slot
+    return None, None
+
+
+def _label(med) -> str:
+    if not med.dosage or med.dosage == "N/A" or med.dosage.lower() in med.name.lower():
+        return med.name
+    return f"{med.name} ({med.dosage})"
+
+
+def _answer_stock(db, query: str):
+    matches = [(m, s) for m, s in resolve_medicines(db, query, limit=3) if s >= MIN_MATCH_SCORE]
+    if not matches:
+        return None
+    # An exact name match answers for that product only
+    if matches[0][1] >= 2:
+        matches = matches[:1]
+
+    def describe(med):
+        rx = " A prescription is required." if med.prescription_required else ""
+        return f"{_label(med)}: {med.stock} {med.unit} available at ${med.price}.{rx}"
+
+    if len(matches) == 1:
+        med = matches[0][0]
+        if med.stock <= 0:
+            return f"Sorry, {_label(med)} is currently out of stock."
+        return f"Yes, we have it in stock. {describe(med)}"
+    lines = [f"- {describe(med)}" if med.stock > 0 else f"- {_label(med)}: out of stock" for med, _ in matches]
+    return f"Here's what we have for '{query}':\n" + "\n".join(lines)
+
+
+def _answer_history(db, query: str):
+    # resolve_patient only accepts exact ids / names or a unique name prefix - a fuzzy guess here would show someone else's orders
+    patient, _ = resolve_patient(db, query)
+    if patient:
+        label, key = patient.name, query
+    else:
+        row = db.query(OrderHistory.patient_id).filter(func.lower(OrderHistory.patient_id) == query).first()
+        if not row:
+            return None
+        label = key = row[0]
+    history = get_patient_history(key)
+    if history.startswith("No history"):
+        return f"I couldn't find any past purchases for {label}."
+    return f"Here are the recent purchases for {label}:\n{history}"
+
+
+def _answer_low_stock(db, _):
+    alerts = check_low_stock_alerts()
+    if alerts.startswith("ALERTS:"):
+        return "These medicines are running low:\n" + alerts[len("ALERTS:"):].strip()
+    return alerts
+
+
+ANSWERS = {"stock": _answer_stock, "history": _answer_history, "low_stock": _answer_low_stock}
+
+
+def route(message: str):
+    """
+    Tries to answer a chat message without the agent.
+    Returns (intent, response) on a fast-path hit, or (None, None) to fall through.
+    """
+    if not FAST_PATH_ENABLED:
+        return None, None
+    start = time.perf_counter()
+    intent, slot = classify(message)
+    response = None
+    if intent:
+        db = SessionLocal()
+        try:
+            response = ANSWERS[intent](db, slot)
+        except Exception as e:
+            print(f"Fast path failed for intent {intent}: {e}")
+            response = None
+        finally:
+            db.close()
+    if response is None:
+        stats.record_miss()
+        return None, None
+    stats.record_hit(intent, time.perf_counter() - start)
+    return intent, response
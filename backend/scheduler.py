@@ -0,0 +1,360 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+from .metrics import register, GaugeMetric, llm_queue_wait_seconds, llm_shed_total
+
+# Admission control for Ollama model calls.
+# One local Ollama serves llama3.1 (chat) and llama3.2-vision (prescriptions); unbounded concurrent calls make
+# it swap models back and forth and slow every request down. Every chat, vision and embedding call takes a slot here:
+#   - per-model concurrency limits plus a total limit for the Ollama host
+#   - strict priority classes: interactive chat, then interactive vision uploads, batch vision, background warmup
+#   - round-robin across conversation threads (thread_id) within a class, so one busy thread can't starve the rest
+#   - a model that is already loaded keeps its slot for waiters of the same class for up to
+#     MODEL_SWITCH_GRACE_SECONDS before another model is swapped in
+#   - chat and uploads are shed when their queue is full (429) or after waiting LLM_QUEUE_TIMEOUT_SECONDS (503),
+#     with a Retry-After estimated from queue depth and recent call times; batch and background calls just wait.
+# Callers tag work with llm_request(priority, key); the tag follows the call into LangGraph's worker threads.
+
+PRIORITIES = ("interactive", "vision", "batch", "background")
+SHEDDABLE = {"interactive", "vision"}
+
+LLM_TOTAL_CONCURRENCY = int(os.getenv("LLM_TOTAL_CONCURRENCY", "2"))
+LLM_CONCURRENCY = os.getenv("LLM_CONCURRENCY", "llama3.1=2,llama3.2-vision=1,nomic-embed-text=2")
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+MODEL_SWITCH_GRACE_SECONDS = float(os.getenv("MODEL_SWITCH_GRACE_SECONDS", "2"))
+DEFAULT_CALL_SECONDS = 5.0
+
+
+def parse_limits(spec: str) -> dict:
+    """'llama3.1=2,llama3.2-vision=1' -> {'llama3.1': 2, 'llama3.2-vision': 1}"""
+    limits = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().rpartition("=")
+        if name:
+            limits[name] = int(value)
+    return limits
+
+
+class Overloaded(Exception):
+    """A model call was shed. status is 429 (queue full) or 503 (waited too long); retry_after is in seconds."""
+
+    def __init__(self, message: str, status: int, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+_request = contextvars.ContextVar("llm_request", default=("interactive", "default"))
+_holding = contextvars.ContextVar("llm_slot_held", default=False)
+
+
+@contextmanager
+def llm_request(priority: str, key):
+    """Tags model calls made inside the block with a priority class and a fairness key (e.g. thread_id)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'")
+    token = _request.set((priority, str(key)))
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+class _Waiter:
+    def __init__(self, model: str, priority: str, key: str, loop=None):
+        self.model = model
+        self.priority = priority
+        self.key = key
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class ModelScheduler:
+    def __init__(self, limits: dict = None, total: int = LLM_TOTAL_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS, switch_grace: float = MODEL_SWITCH_GRACE_SECONDS):
+        self.limits = parse_limits(LLM_CONCURRENCY) if limits is None else limits
+        self.total = total
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.switch_grace = switch_grace
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._queues = {p: OrderedDict() for p in PRIORITIES}  # priority -> key -> deque of waiters
+        self._last_model = None
+        self._call_seconds = {}  # model -> moving average of call time
+        self.admitted = 0
+        self.shed = 0
+
+    # -- bookkeeping (caller holds the lock)
+
+    def _limit(self, model: str) -> int:
+        return self.limits.get(model, 1)
+
+    def _has_capacity(self, model: str) -> bool:
+        return self._in_flight.get(model, 0) < self._limit(model) and sum(self._in_flight.values()) < self.total
+
+    def _depth(self, priority: str) -> int:
+        """Waiters that would be served before a new call of this class."""
+        rank = PRIORITIES.index(priority)
+        return sum(len(q) for p in PRIORITIES[:rank + 1] for q in self._queues[p].values())
+
+    def _retry_after(self, model: str, depth: int) -> int:
+        seconds = self._call_seconds.get(model, DEFAULT_CALL_SECONDS)
+        return max(1, math.ceil((depth + 1) * seconds / self._limit(model)))
+
+    def _start(self, waiter):
+        self._in_flight[waiter.model] = self._in_flight.get(waiter.model, 0) + 1
+        self._last_model = waiter.model
+        self.admitted += 1
+        llm_queue_wait_seconds.observe(time.monotonic() - waiter.enqueued, waiter.model, waiter.priority)
+
+    def _shed(self, waiter, reason: str, status: int, message: str):
+        self.shed += 1
+        llm_shed_total.inc(1, waiter.model, waiter.priority, reason)
+        return Overloaded(message, status, self._retry_after(waiter.model, self._depth(waiter.priority)))
+
+    def _blocked(self, waiter) -> bool:
+        """True if _next() would serve a queued waiter before this one (mirrors its ordering)."""
+        rank = PRIORITIES.index(waiter.priority)
+        # Strict priority: any waiter in a higher class goes first
+        if any(self._queues[p] for p in PRIORITIES[:rank]):
+            return True
+        queue = self._queues[waiter.priority]
+        # Same class: the thread's earlier calls go first, and so does any head that could start now;
+        # heads waiting on another (full) model don't hold this call back
+        return waiter.key in queue or any(self._has_capacity(w[0].model) for w in queue.values())
+
+    def _enqueue(self, waiter):
+        """Starts the call now if nothing is queued ahead of it, otherwise queues it (or sheds it)."""
+        if self._has_capacity(waiter.model) and not self._blocked(waiter):
+            self._start(waiter)
+            waiter.granted = True
+            return
+        if waiter.priority in SHEDDABLE and self._depth(waiter.priority) >= self.max_queue:
+            raise self._shed(waiter, "queue_full", 429, "The assistant is busy. Please try again shortly.")
+        self._queues[waiter.priority].setdefault(waiter.key, deque()).append(waiter)
+
+    def _remove(self, waiter):
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.key]
+
+    def _next(self):
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            # Head of each thread's queue, in round-robin order
+            runnable = [w for w in (waiters[0] for waiters in queue.values()) if self._has_capacity(w.model)]
+            if not runnable:
+                return None  # strict priority: lower classes wait behind a blocked higher class
+            loaded = {m for m, n in self._in_flight.items() if n} or {self._last_model}
+            overdue = [w for w in runnable if now - w.enqueued > self.switch_grace]
+            preferred = [w for w in runnable if w.model in loaded]
+            waiter = (overdue or preferred or runnable)[0]
+            waiters = queue[waiter.key]
+            waiters.popleft()
+            if waiters:
+                queue.move_to_end(waiter.key)
+            else:
+                del queue[waiter.key]
+            return waiter
+        return None
+
+    def _dispatch(self):
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                return
+            self._start(waiter)
+            waiter.grant()
+
+    def _release(self, model: str, seconds: float = None):
+        with self._lock:
+            self._in_flight[model] -= 1
+            if seconds is not None:
+                previous = self._call_seconds.get(model)
+                self._call_seconds[model] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+            self._dispatch()
+
+    def _timed_out(self, waiter) -> bool:
+        """After a wait timed out or was cancelled: True if the waiter is (still) queued and now removed."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._remove(waiter)
+            # The waiter may have been the head holding others back
+            self._dispatch()
+            return True
+
+    # -- public API
+
+    def _timeout_for(self, priority: str):
+        return self.queue_timeout if priority in SHEDDABLE else None
+
+    @contextmanager
+    def slot(self, model: str):
+        """Blocks until the call may run. Re-entrant within the same call."""
+        if _holding.get():
+            yield
+            return
+        priority, key = _request.get()
+        waiter = _Waiter(model, priority, key)
+        with self._lock:
+            self._enqueue(waiter)
+        if not waiter.granted:
+            waiter.event.wait(self._timeout_for(priority))
+            if self._timed_out(waiter):
+                with self._lock:
+                    raise self._shed(waiter, "timeout", 503, "The assistant is overloaded. Please try again shortly.")
+        token = _holding.set(True)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            _holding.reset(token)
+            self._release(model, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self, model: str):
+        """Async variant of slot(); waiting doesn't block the event loop."""
+        if _holding.get():
+            yield
+            return
+        priority, key = _request.get()
+        waiter = _Waiter(model, priority, key, loop=asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(waiter)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._timeout_for(priority))
+            except asyncio.TimeoutError:
+                if self._timed_out(waiter):
+                    with self._lock:
+                        raise self._shed(waiter, "timeout", 503, "The assistant is overloaded. Please try again shortly.")
+            except asyncio.CancelledError:
+                # Granted just as the client went away: hand the slot to the next waiter
+                if not self._timed_out(waiter):
+                    self._release(model)
+                raise
+        token = _holding.set(True)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            _holding.reset(token)
+            self._release(model, time.monotonic() - start)
+
+    def check_admission(self, model: str):
+        """Raises Overloaded if a call of the current class would be shed right now (pre-flight for streams)."""
+        priority, key = _request.get()
+        waiter = _Waiter(model, priority, key)
+        with self._lock:
+            if self._has_capacity(model) and not self._blocked(waiter):
+                return
+            if priority in SHEDDABLE and self._depth(priority) >= self.max_queue:
+                raise self._shed(waiter, "queue_full", 429,
+                                 "The assistant is busy. Please try again shortly.")
+
+    def in_flight(self) -> dict:
+        with self._lock:
+            return {model: n for model, n in self._in_flight.items()}
+
+    def queue_depths(self) -> dict:
+        with self._lock:
+            return {p: sum(len(q) for q in self._queues[p].values()) for p in PRIORITIES}
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = [w.enqueued for p in PRIORITIES for q in self._queues[p].values() for w in q]
+            return {
+                "limits": dict(self.limits),
+                "total_limit": self.total,
+                "in_flight": dict(self._in_flight),
+                "queued": {p: sum(len(q) for q in self._queues[p].values()) for p in PRIORITIES},
+                "oldest_wait_seconds": round(time.monotonic() - min(oldest), 3) if oldest else 0.0,
+                "avg_call_seconds": {m: round(s, 3) for m, s in self._call_seconds.items()},
+                "admitted": self.admitted,
+                "shed": self.shed,
+            }
+
+
+scheduler = ModelScheduler()
+
+register(GaugeMetric("pharmacy_llm_in_flight", "Model calls currently running.", ("model",),
+                     lambda: {(m,): n for m, n in scheduler.in_flight().items()}))
+register(GaugeMetric("pharmacy_llm_queue_depth", "Model calls waiting for a slot.", ("priority",),
+                     lambda: {(p,): n for p, n in scheduler.queue_depths().items()}))
+
+
+class AdmissionControlled:
+    """Chat model mixin: every generation (sync, async, streaming) runs inside a scheduler slot for self.model."""
+
+    def _generate(self, *args, **kwargs):
+        with scheduler.slot(self.model):
+            return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        async with scheduler.aslot(self.model):
+            return await super()._agenerate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with scheduler.slot(self.model):
+            yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with scheduler.aslot(self.model):
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+class AdmissionControlledEmbeddings:
+    """Embeddings mixin: every embedding request runs inside a scheduler slot for self.model."""
+
+    def embed_documents(self, texts):
+        with scheduler.slot(self.model):
+            return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        with scheduler.slot(self.model):
+            return super().embed_query(text)
+
+    async def aembed_documents(self, texts):
+        async with scheduler.aslot(self.model):
+            return await super().aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        async with scheduler.aslot(self.model):
+            return await super().aembed_query(text)
+
+
+@lru_cache(maxsize=None)
+def scheduled(model_class):
+    """ChatOllama / OllamaEmbeddings -> a subclass whose calls go through the scheduler."""
+    mixin = AdmissionControlledEmbeddings if hasattr(model_class, "embed_query") else AdmissionControlled
+    return type(f"Scheduled{model_class.__name__}", (mixin, model_class), {})
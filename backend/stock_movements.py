@@ -0,0 +1,301 @@
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal, run_with_retry, sqlite_cache_size
+from .models import Medicine, StockMovement, StockBatch
+from .name_resolver import normalize_name
+from .read_cache import bump_versions
+from .changes import record_change
+
+# Bulk stock movements: wholesaler receipts, stock adjustments and customer returns.
+# Lines are streamed from CSV or NDJSON and resolved against one name -> id map per batch (exact
+# normalized names only: a delivery is never booked onto a fuzzy-matched SKU). Each chunk is one
+# transaction: deltas are summed per medicine, applied with a single UPDATE ... FROM a temp table,
+# and every line is appended to the stock_movements ledger. A stock_batches row claims the batch id
+# and records the last committed line, so a failed batch can be re-sent and resumes there. Dashboards
+# get one "stock_batch" change event when the whole batch is done instead of one event per line.
+
+KINDS = ("receipt", "adjustment", "return")
+MOVEMENT_CHUNK_SIZE = int(os.getenv("MOVEMENT_CHUNK_SIZE", "50000"))
+MAX_REPORTED_ERRORS = 100
+LEDGER_CACHE_KB = 65536
+EVENT_STOCK_LIMIT = 1000  # bigger batches tell the dashboard to re-fetch inventory instead
+STALE_BATCH_SECONDS = 600  # an "applying" batch with no progress for this long was abandoned
+
+
+class DuplicateBatchError(ValueError):
+    """The batch id was already applied, or another request is applying it."""
+
+
+def detect_format(filename: str = "", content_type: str = "") -> str:
+    if "json" in (content_type or "") or (filename or "").lower().endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return "csv"
+
+
+def read_lines(f, fmt: str = "csv"):
+    """Yields (line_no, fields) from a text stream; CSV needs a header row (medicine or medicine_id, quantity, kind, reference)."""
+    if fmt == "ndjson":
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                fields = json.loads(line)
+            except json.JSONDecodeError as e:
+                fields = {"_error": f"invalid JSON: {e.msg}"}
+            yield line_no, fields if isinstance(fields, dict) else {"_error": "expected a JSON object"}
+    elif fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            yield line_no, row
+    else:
+        raise ValueError(f"Unsupported format '{fmt}' (use csv or ndjson)")
+
+
+def _load_medicines(db):
+    """Returns ({normalized name: id}, {ids}); names that normalize to the same key map to None (ambiguous)."""
+    names, ids = {}, set()
+    for med_id, name in db.query(Medicine.id, Medicine.name):
+        key = normalize_name(name)
+        names[key] = med_id if key not in names else None
+        ids.add(med_id)
+    return names, ids
+
+
+def _parse_line(fields: dict, names: dict, ids: set, keys: dict):
+    """Returns ((medicine_id, kind, quantity, reference), None) or (None, error). keys memoizes normalize_name."""
+    if "_error" in fields:
+        return None, fields["_error"]
+    kind = str(fields.get("kind") or "receipt").strip().lower()
+    if kind not in KINDS:
+        return None, f"unknown kind '{kind}' (use {', '.join(KINDS)})"
+    try:
+        quantity = int(fields.get("quantity"))
+    except (TypeError, ValueError):
+        return None, f"quantity must be an integer, got '{fields.get('quantity')}'"
+    if quantity == 0 or (kind != "adjustment" and quantity < 0):
+        return None, f"{kind} quantity must be {'non-zero' if kind == 'adjustment' else 'positive'}"
+
+    medicine_id = fields.get("medicine_id")
+    if medicine_id not in (None, ""):
+        try:
+            medicine_id = int(medicine_id)
+        except (TypeError, ValueError):
+            return None, f"medicine_id must be an integer, got '{medicine_id}'"
+        if medicine_id not in ids:
+            return None, f"unknown medicine_id {medicine_id}"
+    else:
+        name = str(fields.get("medicine") or "")
+        key = keys.get(name)
+        if key is None:
+            key = keys[name] = normalize_name(name)
+        if key not in names:
+            return None, f"unknown medicine '{name}'"
+        medicine_id = names[key]
+        if medicine_id is None:
+            return None, f"ambiguous medicine '{name}', use medicine_id"
+    return (medicine_id, kind, quantity, fields.get("reference") or None), None
+
+
+def _apply_chunk(db, batch_id: str, lines: list, now: str):
+    """
+    Applies [(line_no, medicine_id, kind, quantity, reference)] in the current transaction.
+    A medicine whose summed delta would take stock below zero is left untouched and all its lines in
+    the chunk are rejected. Returns (applied line count, rejected [(line_no, error)], {medicine_id: stock}).
+    """
+    deltas = defaultdict(int)
+    for _, medicine_id, _, quantity, _ in lines:
+        deltas[medicine_id] += quantity
+
+    # Driver-level SQL with plain tuples: per-row parameter and result processing in SQLAlchemy
+    # costs more than SQLite's own work at these volumes
+    connection = db.connection()
+    connection.exec_driver_sql("CREATE TEMP TABLE IF NOT EXISTS stock_deltas (medicine_id INTEGER PRIMARY KEY, delta INTEGER NOT NULL)")
+    connection.exec_driver_sql("DELETE FROM temp.stock_deltas")
+    connection.exec_driver_sql("INSERT INTO temp.stock_deltas (medicine_id, delta) VALUES (?, ?)", list(deltas.items()))
+    stock = dict(connection.exec_driver_sql(
+        "UPDATE medicines SET stock = coalesce(medicines.stock, 0) + d.delta "
+        "FROM temp.stock_deltas AS d "
+        "WHERE medicines.id = d.medicine_id AND coalesce(medicines.stock, 0) + d.delta >= 0 "
+        "RETURNING medicines.id, medicines.stock").fetchall())
+
+    # Per-line running balance, starting from the stock before this chunk
+    running = {m: stock[m] - deltas[m] for m in stock}
+    rows, rejected = [], []
+    for line_no, medicine_id, kind, quantity, reference in lines:
+        if medicine_id not in running:
+            rejected.append((line_no, "would take stock below zero"))
+            continue
+        running[medicine_id] += quantity
+        rows.append((batch_id, line_no, medicine_id, kind, quantity, running[medicine_id], reference, now))
+    if rows:
+        # The ledger's medicine_id index takes random inserts; with SQLite's default 2MB page cache
+        # throughput halves once the ledger outgrows it
+        with sqlite_cache_size(connection, LEDGER_CACHE_KB):
+            connection.exec_driver_sql(
+                "INSERT INTO stock_movements (batch_id, line_no, medicine_id, kind, quantity, stock_after, reference, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    # Raw SQL updates bypass the session's version tracking
+    bump_versions(connection, "inventory")
+    return len(rows), rejected, stock
+
+
+def _claim_batch(db, batch_id: str) -> int:
+    """
+    Claims batch_id for this run and returns the line it resumes after (0 for a new batch).
+    The stock_batches primary key makes concurrent submissions of one id race on an INSERT, so only
+    one of them applies it. A failed (or abandoned) batch can be claimed again and resumes where it stopped.
+    """
+    now = datetime.utcnow()
+    try:
+        # Batches applied before stock_batches existed are only in the ledger
+        if not db.get(StockBatch, batch_id) and db.query(StockMovement.id).filter(StockMovement.batch_id == batch_id).first():
+            raise DuplicateBatchError(f"Batch '{batch_id}' was already applied")
+        db.add(StockBatch(batch_id=batch_id, status="applying", applied_through_line=0, started_at=now, updated_at=now))
+        db.commit()
+        return 0
+    except IntegrityError:
+        db.rollback()
+    stale = now - timedelta(seconds=STALE_BATCH_SECONDS)
+    claimed = db.query(StockBatch).filter(
+        StockBatch.batch_id == batch_id,
+        or_(StockBatch.status == "failed", (StockBatch.status == "applying") & (StockBatch.updated_at < stale)),
+    ).update({StockBatch.status: "applying", StockBatch.error: None, StockBatch.updated_at: now}, synchronize_session=False)
+    db.commit()
+    batch = db.get(StockBatch, batch_id)
+    if claimed != 1:
+        state = "was already applied" if batch.status == "applied" else "is being applied"
+        raise DuplicateBatchError(f"Batch '{batch_id}' {state}")
+    return batch.applied_through_line
+
+
+def _finish_batch(db, batch_id: str, status: str, error: str = None):
+    db.query(StockBatch).filter(StockBatch.batch_id == batch_id).update(
+        {StockBatch.status: status, StockBatch.error: error, StockBatch.updated_at: datetime.utcnow()},
+        synchronize_session=False)
+    db.commit()
+
+
+def _apply_batch(db, f, fmt, batch_id, reference, chunk_size, resume_after, now):
+    """Parses and applies the lines after resume_after; returns (summary, {medicine_id: final stock})."""
+    names, ids = _load_medicines(db)
+    db.rollback()
+
+    total = applied = rejected_count = skipped = 0
+    errors = []
+    final_stock = {}
+    keys = {}
+
+    def report(line_no, error):
+        nonlocal rejected_count
+        rejected_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    def flush(chunk, through_line):
+        nonlocal applied
+
+        def work():
+            result = _apply_chunk(db, batch_id, chunk, now) if chunk else (0, [], {})
+            db.query(StockBatch).filter(StockBatch.batch_id == batch_id).update(
+                {StockBatch.applied_through_line: through_line, StockBatch.updated_at: datetime.utcnow()},
+                synchronize_session=False)
+            db.commit()
+            return result
+        count, rejected, stock = run_with_retry(db, work)
+        applied += count
+        final_stock.update(stock)
+        for line_no, error in rejected:
+            report(line_no, error)
+
+    chunk = []
+    line_no = resume_after
+    for line_no, fields in read_lines(f, fmt):
+        total += 1
+        if line_no <= resume_after:
+            # Committed by an earlier attempt of this batch
+            skipped += 1
+            continue
+        parsed, error = _parse_line(fields, names, ids, keys)
+        if error:
+            report(line_no, error)
+            continue
+        medicine_id, kind, quantity, line_reference = parsed
+        chunk.append((line_no, medicine_id, kind, quantity, line_reference or reference))
+        if len(chunk) >= chunk_size:
+            flush(chunk, line_no)
+            chunk = []
+    if chunk or line_no > resume_after:
+        flush(chunk, line_no)
+
+    summary = {"batch_id": batch_id, "lines": total, "applied": applied, "rejected": rejected_count,
+               "resumed_after_line": resume_after or None, "skipped": skipped,
+               "medicines": len(final_stock), "errors": sorted(errors, key=lambda e: e["line"])}
+    return summary, final_stock
+
+
+def apply_movements(f, fmt: str = "csv", batch_id: str = None, reference: str = None,
+                    chunk_size: int = MOVEMENT_CHUNK_SIZE) -> dict:
+    """
+    Streams movement lines from f and applies them chunk by chunk.
+    Chunks commit independently, each together with the batch's progress, so a batch that fails part-way
+    can be re-sent with the same batch_id and resumes after the last committed line. Re-sending a batch
+    that was applied (or is being applied) raises DuplicateBatchError.
+    """
+    start = time.perf_counter()
+    batch_id = batch_id or uuid.uuid4().hex
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")  # SQLAlchemy's SQLite DateTime format
+    db = SessionLocal()
+    try:
+        resume_after = run_with_retry(db, lambda: _claim_batch(db, batch_id))
+        try:
+            summary, final_stock = _apply_batch(db, f, fmt, batch_id, reference, chunk_size, resume_after, now)
+        except Exception as e:
+            db.rollback()
+            run_with_retry(db, lambda: _finish_batch(db, batch_id, "failed", f"{type(e).__name__}: {e}"[:500]))
+            raise
+        run_with_retry(db, lambda: _finish_batch(db, batch_id, "applied"))
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        summary["lines_per_second"] = round(summary["lines"] / summary["seconds"]) if summary["seconds"] else None
+
+        if summary["applied"]:
+            payload = {k: summary[k] for k in ("batch_id", "lines", "applied", "rejected", "medicines")}
+            if len(final_stock) <= EVENT_STOCK_LIMIT:
+                payload["stock"] = [{"id": m, "stock": s} for m, s in final_stock.items()]
+            else:
+                payload["truncated"] = True
+
+            def publish():
+                record_change(db, "stock_batch", payload)
+                db.commit()
+            run_with_retry(db, publish)
+        return summary
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply stock receipts, adjustments and returns from a CSV or NDJSON file.")
+    parser.add_argument("file", help="movement file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--batch-id", help="idempotency key, e.g. the delivery note number")
+    parser.add_argument("--reference", help="reference stored on lines that have none")
+    parser.add_argument("--chunk-size", type=int, default=MOVEMENT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.file)
+    f = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8-sig")
+    try:
+        result = apply_movements(f, fmt, args.batch_id, args.reference, args.chunk_size)
+    except DuplicateBatchError as e:
+        sys.exit(str(e))
+    finally:
+        f.close()
+    print(json.dumps(result, indent=2))
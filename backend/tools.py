@@ -1,7 +1,19 @@
-from datetime import datetime
+import uuid
+from datetime import date, datetime
+from typing import List
+from typing_extensions import TypedDict
 from sqlalchemy.orm import Session
 from .models import Medicine, OrderHistory
-from .database import SessionLocal
+from .database import SessionLocal, run_with_retry
+from .interactions import screen_pairs
+from .refills import record_purchase
+from .name_resolver import resolve_medicines, resolve_medicine, resolve_patient, describe_candidates, normalize_name
+from .read_cache import read_cache
+from .changes import record_change
+from .outbox import enqueue
+from .forecast import LOW_STOCK_THRESHOLD, forecasts_available, reorder_alerts, alert_threshold
+from .allergens import allergy_conflicts
+from .metrics import timed_tool
 
 def get_db():
     db = SessionLocal()
@@ -10,91 +22,266 @@ def get_db():
     finally:
         db.close()
 
+@timed_tool
 def check_medicine_stock(medicine_name: str) -> str:
     """Check if a medicine is in stock and return details."""
-    db = SessionLocal()
-    try:
-        # Use partial matching (searching for "Amoxicillin" finds "Amoxicillin 500mg")
-        meds = db.query(Medicine).filter(Medicine.name.ilike(f"%{medicine_name}%")).all()
+    def load(db):
+        # Ranked fuzzy matching (searching for "Amoxicilin" finds "Amoxicillin 500mg")
+        matches = resolve_medicines(db, medicine_name)
         
-        if not meds:
+        if not matches:
             return f"Medicine '{medicine_name}' not found in inventory."
-        
-        if len(meds) == 0:
-             return f"Medicine '{medicine_name}' not found."
              
         results = []
-        for med in meds:
+        for med, _ in matches:
              results.append(f"{med.name}: {med.stock} {med.unit} available. Dosage: {med.dosage}. Prescription Required: {med.prescription_required}. Price: ${med.price}")
         
         return "\n".join(results)
-    finally:
-        db.close()
 
+    # Served from cache until the next inventory write
+    result, _ = read_cache.get_or_load(("stock", normalize_name(medicine_name)), ("inventory",), load)
+    return result
+
+@timed_tool
 def place_order(patient_id: str, medicine_name: str, quantity: int) -> str:
     """Place an order for a medicine. deducts stock if available."""
+    if quantity <= 0:
+        return "Error: Quantity must be at least 1."
+
     db = SessionLocal()
     try:
         # 1. Validate Medicine
-        med = db.query(Medicine).filter(Medicine.name.ilike(f"%{medicine_name}%")).first()
+        med, candidates = resolve_medicine(db, medicine_name)
         if not med:
+            if candidates:
+                options = ", ".join(m.name for m, _ in candidates)
+                return f"Error: '{medicine_name}' does not name a single medicine. Did you mean one of: {options}?"
             return f"Error: Medicine '{medicine_name}' not found. Please check exact name."
         
         # 2. Get Patient Info for Safety Checks
-        # For this demo, we assume patient_id maps to 'id' or we search by name if string.
-        # But to be robust, let's try to match by name if not integer
-        from .models import Patient
-        patient = None
-        if patient_id.isdigit():
-             patient = db.query(Patient).filter(Patient.id == int(patient_id)).first()
-        else:
-             patient = db.query(Patient).filter(Patient.name.ilike(f"%{patient_id}%")).first()
+        # patient_id may be the numeric id or the patient's name
+        patient, candidates = resolve_patient(db, patient_id)
+        if not patient and candidates:
+            return f"Error: '{patient_id}' does not identify a single patient. Please specify one of: {describe_candidates(candidates)}."
              
         # If no specific patient found, fallback or warn (For demo purposes we might skip checks if patient unknown)
         if patient:
-             # ALLERGY CHECK
-             allergies = [a.strip().lower() for a in patient.allergies.split(",")] if patient.allergies else []
-             med_name = med.name.lower()
-             med_cat = med.category.lower() if med.category else ""
-             
-             for allergy in allergies:
-                 if allergy in med_name or allergy in med_cat:
-                     return f"🚨 SAFETY ALERT: Order BLOCKED. Patient {patient.name} is allergic to {allergy} ({med.name} is a {med.category}). Please ask user for authorization/confirmation before overriding (Functionality to override not implemented yet)."
+             # ALLERGY CHECK (ingredient and drug class aware: a Penicillin allergy blocks Amoxicillin)
+             conflicts = allergy_conflicts(db, patient.id, [med.id])
+             if conflicts:
+                 return allergy_alert(patient, {med.id: med}, conflicts)
 
-        if med.stock < quantity:
+        # Reserve stock and record history in one short transaction.
+        # The conditional UPDATE only succeeds if enough stock remains, so concurrent orders can't oversell.
+        def reserve():
+            reserved = db.query(Medicine).filter(
+                Medicine.id == med.id, Medicine.stock >= quantity
+            ).update({Medicine.stock: Medicine.stock - quantity}, synchronize_session=False)
+            if reserved != 1:
+                db.rollback()
+                return False
+            today = date.today()
+            order = OrderHistory(
+                patient_id=patient_id,
+                medicine=med.name,
+                dosage=med.dosage,
+                quantity=quantity,
+                date_purchased=today
+            )
+            db.add(order)
+            record_purchase(db, patient_id, med.name, med.dosage, quantity, today)
+            publish_order_changes(db, order, med)
+            queue_fulfillment(db, patient_id, [(order, med)])
+            db.commit()
+            return True
+
+        if not run_with_retry(db, reserve):
+            db.refresh(med)
             return f"Error: Insufficient stock. Only {med.stock} {med.unit} remaining."
         
-        # Deduct stock
-        med.stock -= quantity
-        
-        # Record history
-        history = OrderHistory(
-            patient_id=patient_id,
-            medicine=med.name,
-            dosage=med.dosage,
-            quantity=quantity,
-            date_purchased=datetime.now().strftime("%Y-%m-%d")
-        )
-        db.add(history)
-        db.commit()
-        
-        return f"Order success! {quantity} {med.unit} of {med.name} ordered for {patient_id}. Webhook triggered for warehouse fulfillment."
+        return f"Order success! {quantity} {med.unit} of {med.name} ordered for {patient_id}. Queued for warehouse fulfillment."
     finally:
         db.close()
 
-def check_drug_interaction(medicine_one: str, medicine_two: str) -> str:
+class CartItem(TypedDict):
+    medicine_name: str
+    quantity: int
+
+def submit_cart(patient_id: str, items: list, confirm_interactions: bool = False) -> dict:
     """
-    Check for harmful interactions between two medicines.
-    Uses the RAG knowledge base to find safety information.
+    Places a multi-item order in one transaction: every line is reserved or none is.
+    Returns {"status": "placed" | "rejected", "reason", "message", "lines"}.
+    reason is one of: invalid, unresolved, allergy, interaction, insufficient_stock.
     """
-    query = f"Is there a drug interaction between {medicine_one} and {medicine_two}?"
-    return search_knowledge_base(query)
+    def rejected(reason, message, lines=None):
+        return {"status": "rejected", "reason": reason, "message": message, "lines": lines or []}
+
+    if not items:
+        return rejected("invalid", "Error: The order has no items.")
 
+    db = SessionLocal()
+    try:
+        # 1. Resolve every line first so all problems are reported together
+        lines = {}  # medicine id -> line (repeated medicines are merged)
+        problems = []
+        for item in items:
+            name = str(item.get("medicine_name") or item.get("medicine") or "").strip()
+            quantity = int(item.get("quantity") or 0)
+            if not name or quantity <= 0:
+                problems.append(f"'{name or '?'}': quantity must be at least 1")
+                continue
+            med, candidates = resolve_medicine(db, name)
+            if not med:
+                if candidates:
+                    problems.append(f"'{name}' does not name a single medicine (did you mean one of: {', '.join(m.name for m, _ in candidates)}?)")
+                else:
+                    problems.append(f"'{name}' was not found")
+                continue
+            line = lines.setdefault(med.id, {"medicine": med, "quantity": 0})
+            line["quantity"] += quantity
+        if problems:
+            return rejected("unresolved", "Error: Order not placed. " + "; ".join(problems) + ".")
+
+        meds = {med_id: line["medicine"] for med_id, line in lines.items()}
+
+        # 2. Safety screening across the whole basket
+        patient, candidates = resolve_patient(db, patient_id)
+        if not patient and candidates:
+            return rejected("unresolved", f"Error: Order not placed. '{patient_id}' does not identify a single patient "
+                                          f"(one of: {describe_candidates(candidates)}).")
+        if patient:
+            conflicts = allergy_conflicts(db, patient.id, meds)
+            if conflicts:
+                return rejected("allergy", allergy_alert(patient, meds, conflicts))
+        # Only the precomputed index is consulted here; unknown pairs are left to check_drug_interaction
+        hits, _ = screen_pairs([m.name for m in meds.values()])
+        if hits and not confirm_interactions:
+            warnings = [f"{a} + {b}: {found[0][1]}" for a, b, found in hits]
+            return rejected("interaction", "⚠️ INTERACTION WARNING: Order not placed. " + " | ".join(warnings)
+                            + " Confirm with the user and resubmit with confirm_interactions=true to proceed.")
+
+        # 3. Reserve every line atomically
+        def reserve():
+            today = date.today()
+            for med_id, line in lines.items():
+                reserved = db.query(Medicine).filter(
+                    Medicine.id == med_id, Medicine.stock >= line["quantity"]
+                ).update({Medicine.stock: Medicine.stock - line["quantity"]}, synchronize_session=False)
+                if reserved != 1:
+                    db.rollback()
+                    return line["medicine"]
+            for line in lines.values():
+                med = line["medicine"]
+                order = OrderHistory(patient_id=patient_id, medicine=med.name, dosage=med.dosage,
+                                     quantity=line["quantity"], date_purchased=today)
+                db.add(order)
+                record_purchase(db, patient_id, med.name, med.dosage, line["quantity"], today)
+                publish_order_changes(db, order, med)
+                line["order_id"] = order.id
+                line["order"] = order
+            queue_fulfillment(db, patient_id, [(line["order"], line["medicine"]) for line in lines.values()])
+            db.commit()
+            return None
+
+        short = run_with_retry(db, reserve)
+        if short is not None:
+            db.refresh(short)
+            return rejected("insufficient_stock", f"Error: Order not placed. Insufficient stock for {short.name}: only {short.stock} {short.unit} remaining (requested {lines[short.id]['quantity']}).")
+
+        placed = [{"order_id": line["order_id"], "medicine": line["medicine"].name, "quantity": line["quantity"],
+                   "unit": line["medicine"].unit, "price": line["medicine"].price,
+                   "prescription_required": line["medicine"].prescription_required} for line in lines.values()]
+        summary = ", ".join(f"{l['quantity']} {l['unit']} of {l['medicine']}" for l in placed)
+        total = sum(l["quantity"] * (l["price"] or 0) for l in placed)
+        return {"status": "placed", "reason": None, "lines": placed, "total": round(total, 2),
+                "message": f"Order success! {summary} ordered for {patient_id} (total ${total:.2f}). Queued for warehouse fulfillment."}
+    finally:
+        db.close()
+
+@timed_tool
+def place_cart_order(patient_id: str, items: List[CartItem], confirm_interactions: bool = False) -> str:
+    """
+    Place ONE order for several medicines at once, e.g. items=[{"medicine_name": "Paracetamol", "quantity": 2}, {"medicine_name": "Cetirizine", "quantity": 1}].
+    Checks allergies and interactions across the basket; either every item is ordered or none is.
+    Set confirm_interactions=true only after the user has acknowledged an interaction warning.
+    """
+    return submit_cart(patient_id, items, confirm_interactions)["message"]
+
+def allergy_alert(patient, medicines: dict, conflicts) -> str:
+    """Safety message for allergy_conflicts() rows; medicines maps id -> Medicine."""
+    reasons = []
+    for medicine_id, allergen, ingredient in conflicts:
+        name = medicines[medicine_id].name
+        via = f"contains {ingredient}" + (f", {allergen} class" if allergen != ingredient else "")
+        reasons.append(f"{allergen} ({name} {via})")
+    return f"🚨 SAFETY ALERT: Order BLOCKED. Patient {patient.name} is allergic to {'; '.join(reasons)}. Please ask user for authorization/confirmation before overriding (Functionality to override not implemented yet)."
+
+def queue_fulfillment(db, patient_id, orders):
+    """Adds one warehouse fulfillment event for [(OrderHistory, Medicine)] to the order's transaction (sent by outbox.py)."""
+    lines = [{"order_id": order.id, "medicine_id": med.id, "medicine": med.name, "dosage": med.dosage,
+              "quantity": order.quantity, "unit": med.unit} for order, med in orders]
+    # Order ids alone aren't unique over time (SQLite reuses rowids after a history replace or delete),
+    # so the key gets a fresh uuid; it is generated once here and stays fixed across delivery retries.
+    enqueue(db, "order.placed", {"patient_id": patient_id, "lines": lines, "placed_at": datetime.utcnow()},
+            key=f"order.placed:{lines[0]['order_id']}:{uuid.uuid4().hex}")
+
+def publish_order_changes(db, order, med):
+    """Adds the change-feed events for an order (new order, stock level, low-stock crossing) to the transaction."""
+    db.flush()
+    stock = db.query(Medicine.stock).filter(Medicine.id == med.id).scalar()
+    record_change(db, "order", {"id": order.id, "patient": order.patient_id, "medicine": order.medicine,
+                                "qty": order.quantity, "date": order.date_purchased})
+    record_change(db, "stock", {"id": med.id, "name": med.name, "stock": stock})
+    if stock < alert_threshold(db, med.id) <= stock + order.quantity:
+        record_change(db, "alert", {"message": f"{med.name} is low ({stock} left)", "medicine_id": med.id})
+
+@timed_tool
+def check_drug_interaction(medicines: List[str]) -> str:
+    """
+    Check for harmful interactions between two or more medicines (e.g. ["Ibuprofen", "Aspirin"]).
+    Pass the whole basket to screen every pair in one call.
+    """
+    if len(medicines) < 2:
+        return "Please provide at least two medicines to check for interactions."
+
+    # Resolve misspellings against the catalog ("Ibuprofin" -> "Ibuprofen 400mg")
+    db = SessionLocal()
+    try:
+        resolved = []
+        for name in medicines:
+            matches = resolve_medicines(db, name, limit=1)
+            resolved.append(matches[0][0].name if matches else name)
+    finally:
+        db.close()
+    medicines = resolved
+
+    # Known pairs come from the precomputed index; only pairs it can't cover go through RAG
+    hits, unknown = screen_pairs(medicines)
+
+    results = []
+    for med_a, med_b, found in hits:
+        for source, text in found:
+            results.append(f"⚠️ {med_a} + {med_b}: {text} (from {source} monograph)")
+
+    for med_a, med_b in unknown:
+        query = f"Is there a drug interaction between {med_a} and {med_b}?"
+        results.append(f"{med_a} + {med_b} (knowledge base search):\n{search_knowledge_base(query)}")
+
+    if not results:
+        return f"No known interactions between {', '.join(medicines)}."
+    return "\n".join(results)
+
+@timed_tool
 def get_patient_history(patient_id: str) -> str:
     """Get recent purchase history for a patient."""
     db = SessionLocal()
     try:
-        history = db.query(OrderHistory).filter(OrderHistory.patient_id == patient_id).all()
+        # History rows are keyed by whatever identifier was used at order time (id or name)
+        keys = {patient_id}
+        patient, _ = resolve_patient(db, patient_id)
+        if patient:
+            keys |= {str(patient.id), patient.name}
+        history = db.query(OrderHistory).filter(OrderHistory.patient_id.in_(keys)).all()
         
         if not history:
             return f"No history found for patient {patient_id}."
@@ -107,25 +294,43 @@ def get_patient_history(patient_id: str) -> str:
     finally:
         db.close()
 
+LOW_STOCK_ALERT_LIMIT = 50
+
+def format_reorder_alert(a: dict) -> str:
+    if a["stock"] <= 0:
+        return f"{a['name']} is out of stock (reorder point {a['reorder_point']})"
+    if a["days_of_cover"] is None:
+        return f"{a['name']} is low ({a['stock']} left, no recent sales, reorder point {a['reorder_point']})"
+    return (f"{a['name']} is low ({a['stock']} left, ~{a['days_of_cover']} days of cover at {a['daily_mean']}/day, "
+            f"reorder point {a['reorder_point']})")
+
+@timed_tool
 def check_low_stock_alerts() -> str:
-    """Check for medicines with low stock (< 20)."""
-    db = SessionLocal()
-    try:
-        low_stock = db.query(Medicine).filter(Medicine.stock < 20).all()
-        
-        if not low_stock:
+    """Check for medicines that will run out soon (stock below the reorder point from their sales velocity)."""
+    def load(db):
+        if forecasts_available(db):
+            low_stock = reorder_alerts(db)
+            alerts = [format_reorder_alert(a) for a in low_stock[:LOW_STOCK_ALERT_LIMIT]]
+            if len(low_stock) > LOW_STOCK_ALERT_LIMIT:
+                alerts.append(f"...and {len(low_stock) - LOW_STOCK_ALERT_LIMIT} more")
+        else:
+            # Forecasts not computed yet (see forecast.py): fall back to the fixed threshold
+            low_stock = db.query(Medicine).filter(Medicine.stock < LOW_STOCK_THRESHOLD).all()
+            alerts = [f"{m.name} is low ({m.stock} left)" for m in low_stock]
+
+        if not alerts:
             return "All stock levels are healthy."
-            
-        alerts = [f"{m.name} is low ({m.stock} left)" for m in low_stock]
         return "ALERTS:\n" + "\n".join(alerts)
-    finally:
-        db.close()
 
-from .rag import query_knowledge_base
+    result, _ = read_cache.get_or_load(("low_stock",), ("inventory", "forecast"), load)
+    return result
 
+@timed_tool
 def search_knowledge_base(query: str) -> str:
     """
     Search the medical knowledge base for drug interactions, side effects, and safety guidelines.
     Use this strictly for medical questions (e.g. "Can I take X with Y?", "Side effects of Z").
     """
+    # Imported on first use: chromadb is heavy and only needed for knowledge questions
+    from .rag import query_knowledge_base
     return query_knowledge_base(query)
@@ -1,27 +1,35 @@
-from langchain_ollama import ChatOllama
-from langchain_core.messages import HumanMessage
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+import asyncio
 import base64
+import contextvars
+import hashlib
+import io
+import json
+import os
+import re
+import threading
 
-def analyze_prescription_image(image_bytes: bytes) -> str:
-    """
-    Analyzes a prescription image using Llama 3.2 Vision.
-    Returns JSON string with medicine details.
-    """
-    # Initialize Vision Model
-    llm = ChatOllama(model="llama3.2-vision", temperature=0)
-    
-    # Convert bytes to base64
-    img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-    
-    prompt = """
+# Image normalization budget: prescriptions stay legible well below camera resolution
+VISION_MAX_DIM = int(os.getenv("VISION_MAX_DIM", "1600"))
+VISION_MAX_BYTES = int(os.getenv("VISION_MAX_BYTES", str(400 * 1024)))
+# Vision inference runs on a small bounded pool so it never blocks the event loop
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", "2"))
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "256"))
+VISION_CACHE_DIR = os.getenv("VISION_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../data/vision_cache"))
+# Results kept on disk; the least recently used files are pruned past this count (0 for no limit)
+VISION_DISK_CACHE_MAX_FILES = int(os.getenv("VISION_DISK_CACHE_MAX_FILES", "5000"))
+
+PROMPT = """
     You are an expert medical AI assistant specialized in reading doctor's handwriting.
-    
+
     CRITICAL TASK:
     1. Scan the image for any handwritten text (cursive or print).
     2. Decipher the medicine name, dosage (mg/ml), and quantity/frequency.
     3. Ignore pre-printed template text (like "Dr." or "Clinic").Focus on the pen-written parts.
     4. Infer common medical abbreviations (e.g., 'QD' = once daily, 'BID' = twice daily) if useful for 'instructions'.
-    
+
     Output Result:
     Return a SINGLE VALID JSON object containing:
     {
@@ -30,23 +38,159 @@ def analyze_prescription_image(image_bytes: bytes) -> str:
       "quantity": "integer (or null if not found)",
       "instructions": "string (deciphered directions)"
     }
-    
+
     If you are unsure about a specific word, provide your best guess based on medical context.
-    
-    IMPORTANT: Output NOTHING else but the JSON. 
-    Do not print "Here is the JSON", "Explanation:", or markdown formatting. 
+
+    IMPORTANT: Output NOTHING else but the JSON.
+    Do not print "Here is the JSON", "Explanation:", or markdown formatting.
     Just start with { and end with }.
     """
-    
+
+_llm = None
+_llm_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="vision")
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_vision_llm():
+    """Shared vision model client (created once)."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from langchain_ollama import ChatOllama
+                from .llm_metrics import LLMMetricsCallback
+                from .scheduler import scheduled
+                _llm = scheduled(ChatOllama)(model="llama3.2-vision", temperature=0,
+                                             callbacks=[LLMMetricsCallback("llama3.2-vision")])
+    return _llm
+
+
+def normalize_image(image_bytes: bytes) -> bytes:
+    """
+    EXIF-rotates, downscales to VISION_MAX_DIM and re-encodes as JPEG within VISION_MAX_BYTES.
+    Returns the original bytes if the upload can't be decoded as an image.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        return image_bytes
+    img = img.convert("RGB")
+    img.thumbnail((VISION_MAX_DIM, VISION_MAX_DIM))
+
+    quality = 90
+    while True:
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        data = buf.getvalue()
+        if len(data) <= VISION_MAX_BYTES or quality <= 40:
+            return data
+        quality -= 10
+
+
+def image_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _cache_get(key: str):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    path = os.path.join(VISION_CACHE_DIR, f"{key}.txt")
+    try:
+        with open(path, "r") as f:
+            result = f.read()
+        os.utime(path)  # mtime doubles as last use for pruning
+    except FileNotFoundError:
+        return None
+    _cache_put(key, result, persist=False)
+    return result
+
+
+def _cache_put(key: str, result: str, persist: bool = True):
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > VISION_CACHE_SIZE:
+            _cache.popitem(last=False)
+    if persist:
+        os.makedirs(VISION_CACHE_DIR, exist_ok=True)
+        tmp = os.path.join(VISION_CACHE_DIR, f"{key}.tmp")
+        with open(tmp, "w") as f:
+            f.write(result)
+        os.replace(tmp, os.path.join(VISION_CACHE_DIR, f"{key}.txt"))
+        _prune_disk_cache()
+
+
+def _prune_disk_cache():
+    """Deletes the least recently used result files beyond VISION_DISK_CACHE_MAX_FILES."""
+    if VISION_DISK_CACHE_MAX_FILES <= 0:
+        return
+    with os.scandir(VISION_CACHE_DIR) as it:
+        files = [e for e in it if e.name.endswith(".txt")]
+    if len(files) <= VISION_DISK_CACHE_MAX_FILES:
+        return
+    files.sort(key=lambda e: e.stat().st_mtime)
+    for entry in files[:len(files) - VISION_DISK_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # pruned concurrently
+
+
+def analyze_prescription_image(image_bytes: bytes) -> str:
+    """
+    Analyzes a prescription image using Llama 3.2 Vision.
+    Returns JSON string with medicine details.
+    Results are cached by content hash, so re-uploading the same image is instant.
+    """
+    key = image_hash(image_bytes)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    # Convert normalized bytes to base64
+    img_b64 = base64.b64encode(normalize_image(image_bytes)).decode("utf-8")
+
+    from langchain_core.messages import HumanMessage
     msg = HumanMessage(
         content=[
-            {"type": "text", "text": prompt},
+            {"type": "text", "text": PROMPT},
             {"type": "image_url", "image_url": f"data:image/jpeg;base64,{img_b64}"},
         ]
     )
-    
+
+    from .scheduler import Overloaded
     try:
-        response = llm.invoke([msg])
-        return response.content
+        response = get_vision_llm().invoke([msg])
+    except Overloaded:
+        raise
     except Exception as e:
         return f'{{"error": "Vision analysis failed: {str(e)}"}}'
+
+    _cache_put(key, response.content)
+    return response.content
+
+
+async def analyze_prescription_image_async(image_bytes: bytes) -> str:
+    """Runs analyze_prescription_image on the bounded vision pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carries the caller's llm_request() priority into the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, context.run, analyze_prescription_image, image_bytes)
+
+
+def parse_prescription_json(result_json_str: str) -> dict:
+    """Robust JSON extraction from the model output using regex."""
+    match = re.search(r'\{.*\}', result_json_str, re.DOTALL)
+    if match:
+        json_str = match.group(0)
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            return {"raw_text": result_json_str, "error": "Found JSON-like block but failed to parse."}
+    # Fallback if no JSON found
+    return {"raw_text": result_json_str, "error": "No JSON object found in response."}
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+
+# Background warmup and readiness.
+# The API process imports only what routing needs, so the port opens quickly; the heavy subsystems
+# (LangGraph agent, Chroma collection, Ollama models, in-memory name/interaction indexes) are loaded by a
+# warmup thread right after startup. /health is liveness (the process answers); /ready turns 200 once every
+# warmup step has run and the required ones succeeded, so load balancers only route to warm workers.
+# Anything that needs a subsystem before warmup reaches it still loads it on demand.
+
+WARMUP_PRIME_MODELS = os.getenv("WARMUP_PRIME_MODELS", "1") != "0"
+
+
+def _load_agent():
+    from .agents import get_pharmacy_graph
+    get_pharmacy_graph()
+
+
+def _load_indexes():
+    from .database import SessionLocal
+    from .name_resolver import medicine_index, patient_index
+    from .interactions import get_interaction_index
+    db = SessionLocal()
+    try:
+        medicine_index.get(db)
+        patient_index.get(db)
+    finally:
+        db.close()
+    get_interaction_index()
+
+
+def _load_knowledge_base():
+    # Opens the Chroma collection and embeds only new or changed knowledge base sections
+    from .rag import initialize_vector_store
+    from .scheduler import llm_request
+    with llm_request("background", "warmup"):
+        initialize_vector_store()
+
+
+def _prime_models():
+    # Loads the chat and embedding models into Ollama so the first user doesn't pay for it.
+    # The vision model is left cold on purpose: loading it would evict llama3.1 on small GPUs.
+    if not WARMUP_PRIME_MODELS:
+        return
+    from .agents import get_llm
+    from .rag import get_embeddings
+    from .scheduler import llm_request
+    with llm_request("background", "warmup"):
+        get_embeddings().base.embed_query("warmup")
+        get_llm().invoke("Reply with OK.")
+
+
+# (name, loader, required for readiness)
+STEPS = [
+    ("agent", _load_agent, True),
+    ("indexes", _load_indexes, True),
+    ("knowledge_base", _load_knowledge_base, False),
+    ("models", _prime_models, False),
+]
+
+
+class Readiness:
+    """Status of each warmup step: pending -> running -> ready | failed."""
+
+    def __init__(self, steps=STEPS):
+        self.steps = steps
+        self._lock = threading.Lock()
+        self._status = {name: {"status": "pending", "required": required} for name, _, required in steps}
+        self.started_at = time.time()
+        self.ready_at = None
+
+    def run(self):
+        for name, loader, _ in self.steps:
+            self._update(name, status="running")
+            start = time.perf_counter()
+            try:
+                loader()
+                self._update(name, status="ready", seconds=round(time.perf_counter() - start, 3))
+            except Exception as e:
+                print(f"Warmup step '{name}' failed: {e}")
+                self._update(name, status="failed", seconds=round(time.perf_counter() - start, 3), error=str(e))
+        if self.is_ready():
+            self.ready_at = time.time()
+            print(f"Warmup complete in {self.ready_at - self.started_at:.2f}s.")
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            steps = list(self._status.values())
+        return all(s["status"] in ("ready", "failed") for s in steps) and \
+            all(s["status"] == "ready" for s in steps if s["required"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            steps = {name: dict(s) for name, s in self._status.items()}
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "time_to_ready_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": steps,
+        }
+
+
+readiness = Readiness()
+
+
+def start_warmup():
+    threading.Thread(target=readiness.run, name="warmup", daemon=True).start()
@@ -0,0 +1,79 @@
+"""
+Benchmark: refill alerts over a large order history.
+
+Loads N synthetic OrderHistory rows into a scratch SQLite database, then compares the
+old /alerts logic (load every row, strptime, rebuild the last-purchase dict) with the
+indexed last_purchases range query.
+
+Usage: python bench_alerts.py [history_rows] [patients]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.append(os.getcwd())
+
+from backend.database import engine, Base, SessionLocal
+from backend.models import OrderHistory
+from backend.refills import rebuild_last_purchases, due_refills, record_purchase
+
+MEDICINES = ["Paracetamol", "Ibuprofen", "Amoxicillin", "Metformin", "Atorvastatin", "Cetirizine",
+             "Omeprazole", "Losartan", "Aspirin", "Sertraline", "Levothyroxine", "Amlodipine"]
+
+
+def seed(rows, patients, batch=50000):
+    Base.metadata.create_all(bind=engine)
+    today = date.today()
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(OrderHistory.__table__.insert(), [{
+                "patient_id": f"User{rng.randrange(patients)}",
+                "medicine": rng.choice(MEDICINES),
+                "dosage": "500mg",
+                "quantity": rng.choice([10, 20, 30, 60]),
+                "date_purchased": today - timedelta(days=rng.randrange(365)),
+            } for _ in range(min(batch, rows - start))])
+
+
+def old_predictive_check(db):
+    # Previous implementation: O(history) on every call
+    orders = db.query(OrderHistory).all()
+    today = datetime.now()
+    last = {}
+    for order in orders:
+        key = f"{order.patient_id}|{order.medicine}"
+        p_date = datetime.strptime(str(order.date_purchased), "%Y-%m-%d")
+        if key not in last or p_date > last[key]:
+            last[key] = p_date
+    return [k for k, d in last.items() if 25 <= (today - d).days <= 35]
+
+
+def timed(label, fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<34} {elapsed * 1000:10.2f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    patients = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    print(f"Seeding {rows} history rows for {patients} patients...")
+    timed("seed", lambda: seed(rows, patients))
+    db = SessionLocal()
+
+    timed("backfill last_purchases", lambda: rebuild_last_purchases(db))
+    old = timed("old /alerts (full scan)", lambda: old_predictive_check(db))
+    new = timed("new /alerts (indexed range)", lambda: due_refills(db), repeat=20)
+    timed("incremental update (1 order)", lambda: (record_purchase(db, "User1", "Metformin", "500mg", 60, date.today()), db.commit()), repeat=100)
+    print(f"old alerts={len(old)} new alerts={len(new)}")
+    db.close()
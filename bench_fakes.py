@@ -0,0 +1,136 @@
+"""
+Deterministic stand-ins for ChatOllama / OllamaEmbeddings so the agent can run without Ollama.
+
+install() must be called before anything from backend is imported:
+
+    import bench_fakes
+    bench_fakes.install(llm_latency_ms=300, embed_latency_ms=20)
+    from backend.main import app
+
+The fake chat model follows a small script keyed on the last user message (stock checks, orders,
+interaction checks, knowledge questions) so the full ReAct loop (model -> tool -> model) is exercised.
+"""
+import re
+import json
+import time
+import uuid
+import hashlib
+import random
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+CHARS_PER_TOKEN = 4
+
+# (pattern on the last user message, tool name, args builder)
+SCRIPT = [
+    (re.compile(r"interactions? between (.+?) and (.+?)\??$", re.I), "check_drug_interaction",
+     lambda m: {"medicines": [m.group(1), m.group(2)]}),
+    (re.compile(r"order (\d+) (.+?) for (\S+?)\.?$", re.I), "place_order",
+     lambda m: {"patient_id": m.group(3), "medicine_name": m.group(2), "quantity": int(m.group(1))}),
+    (re.compile(r"side effects? of (.+?)\??$", re.I), "search_knowledge_base",
+     lambda m: {"query": f"side effects of {m.group(1)}"}),
+    (re.compile(r"(?:stock of|price of|have) (.+?)(?: in stock)?\??$", re.I), "check_medicine_stock",
+     lambda m: {"medicine_name": m.group(1)}),
+    (re.compile(r"what did (\S+) buy", re.I), "get_patient_history",
+     lambda m: {"patient_id": m.group(1)}),
+]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class FakeChatOllama(BaseChatModel):
+    """Scripted tool-calling chat model with configurable latency (base + per completion token)."""
+
+    model: str = "fake"
+    temperature: float = 0
+    latency_ms: float = 300.0
+    ms_per_token: float = 0.0
+    jitter: float = 0.1
+    seed: int = 7
+
+    def __init__(self, **kwargs: Any):
+        kwargs = {k: v for k, v in kwargs.items() if k in type(self).model_fields}
+        super().__init__(**{**_llm_defaults, **kwargs})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-ollama"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages) -> AIMessage:
+        last = messages[-1] if messages else None
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Here is what I found: {str(last.content)[:300]}")
+        text = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        for pattern, tool, build in SCRIPT:
+            match = pattern.search(text.strip())
+            if match:
+                call = {"name": tool, "args": build(match), "id": f"call_{uuid.uuid4().hex[:12]}"}
+                return AIMessage(content="", tool_calls=[call])
+        return AIMessage(content="I'm the pharmacy assistant. How can I help you with your medicines today?")
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages)
+        prompt_tokens = sum(_tokens(str(m.content)) for m in messages)
+        completion_tokens = _tokens(message.content or str(message.tool_calls))
+        # Seeded per prompt so runs are repeatable
+        rng = random.Random(f"{self.seed}:{prompt_tokens}:{completion_tokens}")
+        delay = (self.latency_ms + self.ms_per_token * completion_tokens) * (1 + rng.uniform(-self.jitter, self.jitter))
+        time.sleep(max(delay, 0) / 1000)
+        message = message.model_copy(update={
+            "id": f"run-{uuid.uuid4()}",
+            "usage_metadata": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                               "total_tokens": prompt_tokens + completion_tokens},
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        # The whole reply as a single chunk
+        message = self._generate(messages, stop, run_manager, **kwargs).generations[0].message
+        tool_call_chunks = [{"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                            for i, c in enumerate(message.tool_calls)]
+        yield ChatGenerationChunk(message=AIMessageChunk(content=message.content, id=message.id,
+                                                         usage_metadata=message.usage_metadata,
+                                                         tool_call_chunks=tool_call_chunks))
+
+
+class FakeOllamaEmbeddings(Embeddings):
+    """Hash-seeded vectors (same text -> same vector) with a fixed latency per request."""
+
+    def __init__(self, model: str = "fake", size: int = 768, latency_ms: float = None, **kwargs: Any):
+        self.model = model
+        self.size = size
+        self.latency_ms = _embed_defaults["latency_ms"] if latency_ms is None else latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        return [rng.gauss(0, 1) for _ in range(self.size)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_ms / 1000)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_ms / 1000)
+        return self._vector(text)
+
+
+_llm_defaults = {}
+_embed_defaults = {"latency_ms": 20.0}
+
+
+def install(llm_latency_ms: float = 300.0, ms_per_token: float = 0.0, embed_latency_ms: float = 20.0, seed: int = 7):
+    """Replaces the Ollama classes the backend imports. Call before importing backend modules."""
+    import langchain_ollama
+    _llm_defaults.update(latency_ms=llm_latency_ms, ms_per_token=ms_per_token, seed=seed)
+    _embed_defaults.update(latency_ms=embed_latency_ms)
+    langchain_ollama.ChatOllama = FakeChatOllama
+    langchain_ollama.OllamaEmbeddings = FakeOllamaEmbeddings
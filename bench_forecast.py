@@ -0,0 +1,118 @@
+"""
+Benchmark: demand forecasting over a large order history.
+
+Builds a scratch SQLite database with synthetic SKUs and order history (generate_data.py), then times:
+  full         - roll up the whole history into daily demand and compute every SKU's forecast
+  incremental  - roll up a day of new orders and recompute
+  recompute    - no new orders, recompute only
+  baseline     - the same statistics with per-row Python loops (no pandas/NumPy), for comparison
+and checks the baseline's reorder points match the vectorized ones.
+
+Usage: python bench_forecast.py [--history 5000000] [--medicines 50000] [--new-orders 100000] [--no-baseline]
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+from collections import defaultdict
+from datetime import date, timedelta
+from statistics import NormalDist
+
+# Point the backend at a throwaway database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.append(os.getcwd())
+
+import numpy as np
+from backend.database import engine, Base, SessionLocal
+from backend.models import Medicine, DemandForecast
+from backend import forecast
+from generate_data import generate_medicines, generate_history
+
+
+def seed(medicines, history, days):
+    Base.metadata.create_all(bind=engine)
+    df = generate_medicines(medicines)
+    with engine.begin() as conn:
+        conn.execute(Medicine.__table__.insert(), [
+            {"name": name, "dosage": dosage, "stock": int(stock), "unit": unit, "price": 1.0}
+            for name, dosage, stock, unit in zip(df["Medicine Name"], df["Dosage"], df["Stock"], df["Unit"])])
+    users = [f"User{i}" for i in range(1, 5001)]
+    for chunk in generate_history(history, users, df, days=days):
+        insert_history(chunk)
+    return df
+
+
+def insert_history(chunk):
+    rows = list(zip(chunk["Patient ID"], chunk["Medicine"], chunk["Dosage"],
+                    chunk["Quantity"].astype(int).tolist(), chunk["Date"]))
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO order_history (patient_id, medicine, dosage, quantity, date_purchased) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def baseline(window_days):
+    """Per-row Python: accumulate (medicine, day) totals from a cursor, then per-SKU mean/std in loops."""
+    conn = engine.raw_connection()
+    try:
+        ids = {name: med_id for med_id, name in conn.execute("SELECT id, name FROM medicines")}
+        totals = defaultdict(int)
+        for medicine, quantity, day in conn.execute("SELECT medicine, quantity, date_purchased FROM order_history"):
+            med_id = ids.get(medicine)
+            if med_id is not None:
+                totals[(med_id, day)] += quantity or 0
+        as_of = date.today()
+        window = [(as_of - timedelta(days=i)).isoformat() for i in range(window_days)]
+        z = NormalDist().inv_cdf(forecast.FORECAST_SERVICE_LEVEL)
+        result = {}
+        for med_id in ids.values():
+            series = [totals.get((med_id, day), 0) for day in window]
+            mean = sum(series) / window_days
+            std = math.sqrt(sum((x - mean) ** 2 for x in series) / (window_days - 1))
+            result[med_id] = mean * forecast.FORECAST_LEAD_TIME_DAYS + z * std * math.sqrt(forecast.FORECAST_LEAD_TIME_DAYS)
+        return result
+    finally:
+        conn.close()
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:12s} {elapsed:7.2f}s  {result if isinstance(result, dict) and 'seconds' in result else ''}")
+    return result, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time full, incremental and recompute-only forecast runs.")
+    parser.add_argument("--history", type=int, default=5_000_000)
+    parser.add_argument("--medicines", type=int, default=50_000)
+    parser.add_argument("--days", type=int, default=60, help="days of history to generate")
+    parser.add_argument("--new-orders", type=int, default=100_000)
+    parser.add_argument("--no-baseline", action="store_true")
+    args = parser.parse_args()
+
+    print(f"Seeding {args.medicines} medicines and {args.history} orders over {args.days} days...")
+    start = time.perf_counter()
+    df = seed(args.medicines, args.history, args.days)
+    print(f"seeded in {time.perf_counter() - start:.1f}s")
+
+    full, full_s = timed("full", lambda: forecast.run_forecast(full=True))
+    print(f"             {args.history / full_s:,.0f} order rows/s")
+    # A day of new orders (generate_history dates them 1 day back; move them to today)
+    new = next(generate_history(args.new_orders, ["UserNew"], df, days=1))
+    new["Date"] = date.today().isoformat()
+    insert_history(new)
+    timed("incremental", forecast.run_forecast)
+    timed("recompute", forecast.run_forecast)
+
+    if not args.no_baseline:
+        expected, _ = timed("baseline", lambda: baseline(forecast.FORECAST_WINDOW_DAYS))
+        db = SessionLocal()
+        stored = dict(db.query(DemandForecast.medicine_id, DemandForecast.reorder_point).all())
+        db.close()
+        diffs = np.array([abs(stored[m] - expected[m]) for m in expected])
+        print(f"baseline max |reorder point diff| = {diffs.max():.3f} over {len(diffs)} SKUs "
+              f"(matches={bool((diffs <= 0.01).all())})")
@@ -0,0 +1,72 @@
+"""
+Benchmark: CSV ingestion into a scratch SQLite database.
+
+Generates a scaled fixture with generate_data.py, then measures the chunked bulk
+import (backend/init_db.py) against the previous row-by-row ORM import on a sample,
+and re-runs the medicine upsert to show it is idempotent.
+
+Usage: python bench_ingest.py [history_rows] [medicines] [legacy_sample_rows]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.append(os.getcwd())
+
+import pandas as pd
+from backend.database import engine, Base, SessionLocal
+from backend.models import Medicine, OrderHistory
+from backend.init_db import load_medicines, load_history
+
+
+def legacy_history_import(path, rows):
+    # Previous init_db: iterrows() + one ORM object per row
+    session = SessionLocal()
+    df_hist = pd.read_csv(path, nrows=rows)
+    start = time.perf_counter()
+    for _, row in df_hist.iterrows():
+        session.add(OrderHistory(
+            patient_id=row["Patient ID"], medicine=row["Medicine"], dosage=row["Dosage"],
+            quantity=int(row["Quantity"]), date_purchased=pd.Timestamp(row["Date"]).date(),
+        ))
+    session.commit()
+    session.close()
+    return rows / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    history_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    medicine_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    legacy_rows = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+
+    fixture_dir = os.path.join(_tmp_dir, "fixture")
+    print(f"Generating fixture: {medicine_rows} medicines, {history_rows} history rows...")
+    subprocess.run([sys.executable, "generate_data.py", "--medicines", str(medicine_rows),
+                    "--history", str(history_rows), "--patients", "20000", "--days", "365",
+                    "--out-dir", fixture_dir], check=True, stdout=subprocess.DEVNULL)
+    med_csv = os.path.join(fixture_dir, "medicine_data.csv")
+    hist_csv = os.path.join(fixture_dir, "order_history.csv")
+    Base.metadata.create_all(bind=engine)
+
+    print(f"Legacy row-by-row import ({legacy_rows} rows)...")
+    legacy_rate = legacy_history_import(hist_csv, legacy_rows)
+
+    print("Chunked bulk import...")
+    med = load_medicines(med_csv)
+    hist = load_history(hist_csv, mode="replace")
+    print("Re-running medicine upsert (idempotency)...")
+    again = load_medicines(med_csv)
+
+    db = SessionLocal()
+    med_count = db.query(Medicine).count()
+    hist_count = db.query(OrderHistory).count()
+    db.close()
+
+    print(f"\nlegacy history import: {legacy_rate:,.0f} rows/sec")
+    print(f"bulk history import:   {hist.rate():,.0f} rows/sec ({hist_count:,} rows)")
+    print(f"bulk medicine upsert:  {med.rate():,.0f} rows/sec, re-run {again.rate():,.0f} rows/sec")
+    print(f"medicines after two upserts: {med_count:,} (expected {medicine_rows:,})")
@@ -0,0 +1,300 @@
+"""
+Load test: concurrent synthetic users against the full API, offline.
+
+Ollama is replaced by the scripted fakes in bench_fakes.py (configurable latency), the database is a
+scratch SQLite file filled from generate_data.py at the requested scale, and the app is served by
+uvicorn in-process. Each user runs a seeded mix of /chat (fast-path, cached and agent questions),
+/inventory, /history, /alerts and direct place_order calls.
+
+Results (p50/p95/p99/mean/max latency in ms, throughput and error counts per scenario) are printed
+and written as JSON, so runs can be compared between commits:
+
+    python bench_load.py --users 16 --duration 30 --medicines 5000 --history 200000 --out before.json
+    git checkout my-branch
+    python bench_load.py --users 16 --duration 30 --medicines 5000 --history 200000 --out after.json
+    python bench_load.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+sys.path.append(os.getcwd())
+
+DEFAULT_MIX = "chat_fast=3,chat_cached=2,chat_agent=2,inventory=2,history=2,alerts=1,place_order=1"
+
+COMMON = ["Paracetamol", "Ibuprofen", "Amoxicillin", "Cetirizine", "Metformin", "Aspirin", "Omeprazole"]
+INTERACTION_PAIRS = [("Ibuprofen", "Aspirin"), ("Metformin", "Atorvastatin"), ("Aspirin", "Omeprazole")]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load test with fake Ollama models.")
+    parser.add_argument("--users", type=int, default=8, help="concurrent synthetic users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests per user")
+    parser.add_argument("--medicines", type=int, default=1000, help="SKUs to generate")
+    parser.add_argument("--history", type=int, default=50000, help="order history rows to generate")
+    parser.add_argument("--patients", type=int, default=500, help="distinct history patient ids")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--ms-per-token", type=float, default=0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. 'chat_agent=1,inventory=3'")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two results files and exit")
+    return parser.parse_args()
+
+
+# ---------------------------------------------------------------- setup
+
+def prepare(args, tmp_dir):
+    """Scratch database + fake models. Must run before anything from backend is imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ["CHECKPOINT_DB"] = os.path.join(tmp_dir, "checkpoints.sqlite")
+    os.environ.setdefault("FAST_PATH_ROUTER", "1")
+
+    import bench_fakes
+    bench_fakes.install(llm_latency_ms=args.llm_latency_ms, ms_per_token=args.ms_per_token,
+                        embed_latency_ms=args.embed_latency_ms, seed=args.seed)
+
+    from generate_data import generate_medicines, generate_history
+    med_csv = os.path.join(tmp_dir, "medicine_data.csv")
+    hist_csv = os.path.join(tmp_dir, "order_history.csv")
+    df_medicines = generate_medicines(args.medicines)
+    df_medicines.to_csv(med_csv, index=False)
+    users = [f"User{i + 1}" for i in range(args.patients)]
+    for i, chunk in enumerate(generate_history(args.history, users, df_medicines)):
+        chunk.to_csv(hist_csv, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+
+    from backend import rag
+    rag.DB_DIR = os.path.join(tmp_dir, "chroma_db")
+    from backend.init_db import init_db
+    init_db(med_csv, hist_csv)
+    return df_medicines["Medicine Name"].tolist(), users
+
+
+def start_server():
+    import uvicorn
+    from backend.main import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    # Wait for the background warmup (agent, indexes, knowledge base) so timings are steady-state
+    from backend.warmup import readiness
+    while any(s["status"] in ("pending", "running") for s in readiness.snapshot()["steps"].values()):
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+# ---------------------------------------------------------------- scenarios
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def chat(client, user, message):
+    r = await client.post("/chat", json={"message": message, "thread_id": f"bench-{user['id']}"})
+    r.raise_for_status()
+
+
+async def chat_fast(client, user, rng):
+    await chat(client, user, f"Do you have {rng.choice(user['medicines'])} in stock?")
+
+
+async def chat_cached(client, user, rng):
+    # General knowledge: the first ask of each question runs the agent, repeats hit the answer cache
+    if rng.random() < 0.5:
+        await chat(client, user, f"What are the side effects of {rng.choice(COMMON)}?")
+    else:
+        a, b = rng.choice(INTERACTION_PAIRS)
+        await chat(client, user, f"Are there interactions between {a} and {b}?")
+
+
+async def chat_agent(client, user, rng):
+    # Transactional, so always a full model -> place_order -> model loop
+    await chat(client, user, f"Please order 1 {rng.choice(COMMON)} for {rng.randint(1, 3)}.")
+
+
+async def inventory(client, user, rng):
+    headers = {"If-None-Match": user["etag"]} if user.get("etag") else {}
+    r = await client.get("/inventory", headers=headers)
+    if r.status_code != 304:
+        r.raise_for_status()
+        user["etag"] = r.headers.get("etag")
+
+
+async def history(client, user, rng):
+    r = await client.get("/history", params={"limit": 100})
+    r.raise_for_status()
+
+
+async def alerts(client, user, rng):
+    r = await client.get("/alerts")
+    r.raise_for_status()
+
+
+async def place_order(client, user, rng):
+    from backend.tools import place_order as place
+    result = await asyncio.to_thread(place, str(rng.randint(1, 3)), rng.choice(COMMON), 1)
+    if result.startswith("Error"):
+        raise RuntimeError(result)
+
+
+SCENARIOS = {f.__name__: f for f in (chat_fast, chat_cached, chat_agent, inventory, history, alerts, place_order)}
+
+
+async def run_user(client, user_id, args, weights, medicines, deadline, samples):
+    import httpx
+    rng = random.Random(f"{args.seed}:{user_id}")
+    user = {"id": user_id, "medicines": medicines[:50]}
+    names, scenario_weights = list(weights), list(weights.values())
+    done = 0
+    while (done < args.requests) if args.requests else (time.perf_counter() < deadline):
+        name = rng.choices(names, weights=scenario_weights)[0]
+        start = time.perf_counter()
+        error = None
+        try:
+            await SCENARIOS[name](client, user, rng)
+        except (httpx.HTTPError, RuntimeError) as e:
+            error = str(e)[:200]
+        samples.append((name, (time.perf_counter() - start) * 1000, error))
+        done += 1
+
+
+async def drive(base_url, args, medicines):
+    import httpx
+    weights = parse_mix(args.mix)
+    samples = []
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(run_user(client, i, args, weights, medicines, deadline, samples)
+                               for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+# ---------------------------------------------------------------- reporting
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(samples, elapsed, args):
+    by_scenario = {}
+    for name, ms, error in samples:
+        by_scenario.setdefault(name, ([], []))
+        by_scenario[name][0].append(ms)
+        if error:
+            by_scenario[name][1].append(error)
+    scenarios = {name: summarize(ms, len(errs), elapsed) for name, (ms, errs) in sorted(by_scenario.items())}
+    sample_errors = {name: errs[:3] for name, (_, errs) in by_scenario.items() if errs}
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "elapsed_s": round(elapsed, 2),
+        "overall": summarize([ms for _, ms, _ in samples], sum(1 for *_, e in samples if e), elapsed),
+        "scenarios": scenarios,
+        "sample_errors": sample_errors,
+    }
+
+
+def print_table(results):
+    print(f"\n{'scenario':<14}{'count':>8}{'errors':>8}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = list(results["scenarios"].items()) + [("overall", results["overall"])]
+    for name, s in rows:
+        print(f"{name:<14}{s['count']:>8}{s['errors']:>8}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{base_path} ({base.get('commit')}) -> {new_path} ({new.get('commit')})")
+    print(f"\n{'scenario':<14}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    names = sorted(set(base["scenarios"]) & set(new["scenarios"])) + ["overall"]
+    for name in names:
+        old_s = base["overall"] if name == "overall" else base["scenarios"][name]
+        new_s = new["overall"] if name == "overall" else new["scenarios"][name]
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "errors"):
+            a, b = old_s[metric], new_s[metric]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"{name:<14}{metric:<16}{a:>12}{b:>12}{change:>10}")
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="pharmacy_load_")
+    print(f"Preparing {args.medicines} medicines / {args.history} history rows in {tmp_dir}...")
+    medicines, _ = prepare(args, tmp_dir)
+    server, base_url = start_server()
+    print(f"Driving {args.users} users against {base_url} "
+          f"({'%d requests each' % args.requests if args.requests else '%ss' % args.duration})...")
+    samples, elapsed = asyncio.run(drive(base_url, args, medicines))
+    server.should_exit = True
+
+    results = report(samples, elapsed, args)
+    print_table(results)
+    if results["sample_errors"]:
+        print("\nSample errors:", json.dumps(results["sample_errors"], indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: concurrent orders against a single SKU.
+
+Fires many parallel place_order calls at one medicine in a scratch SQLite database
+and checks that stock never goes negative and every deducted unit has a history row.
+
+Usage: python bench_orders.py [orders] [workers] [initial_stock]
+"""
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Point the backend at a throwaway database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.append(os.getcwd())
+
+from sqlalchemy import func
+from backend.database import engine, Base, SessionLocal
+from backend.models import Medicine, OrderHistory
+from backend.tools import place_order
+
+SKU = "Benchmarkol 500mg"
+
+
+def seed(initial_stock):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(Medicine(name=SKU, dosage="500mg", stock=initial_stock, unit="tablets", price=1.0))
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    initial_stock = int(sys.argv[3]) if len(sys.argv) > 3 else orders // 2
+
+    seed(initial_stock)
+    print(f"Placing {orders} orders of 1 unit with {workers} workers against stock={initial_stock}...")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda i: place_order(f"User{i % 50}", SKU, 1), range(orders)))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(r.startswith("Order success") for r in results)
+    rejected = sum(r.startswith("Error: Insufficient stock") for r in results)
+    errors = orders - succeeded - rejected
+
+    db = SessionLocal()
+    final_stock = db.query(Medicine.stock).filter(Medicine.name == SKU).scalar()
+    history_qty = db.query(func.coalesce(func.sum(OrderHistory.quantity), 0)).filter(OrderHistory.medicine == SKU).scalar()
+    db.close()
+
+    oversold = max(0, succeeded - initial_stock) + max(0, -final_stock)
+    print(f"succeeded={succeeded} rejected={rejected} errors={errors}")
+    print(f"final_stock={final_stock} history_units={history_qty} expected_stock={initial_stock - history_qty}")
+    print(f"oversells={oversold} consistent={final_stock == initial_stock - history_qty}")
+    print(f"throughput={orders / elapsed:.0f} orders/sec ({elapsed:.2f}s)")
+    if errors:
+        print("Sample error:", next(r for r in results if not r.startswith(("Order success", "Error: Insufficient"))))
@@ -0,0 +1,106 @@
+"""
+Benchmark: order latency vs. warehouse availability (transactional outbox).
+
+Runs the fulfillment stub in-process, then places orders while the warehouse is healthy, slow and down.
+Order latency should be the same in every phase. Afterwards the warehouse recovers and the run waits
+for the outbox to drain, then checks every order was delivered exactly once (or dead-lettered when
+--reject-rate is set).
+
+Usage: python bench_outbox.py [--orders 300] [--slow-ms 2000] [--reject-rate 0] [--hold 3]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+
+# Scratch database and fast retry settings, before the backend is imported
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+with socket.socket() as _s:
+    _s.bind(("127.0.0.1", 0))
+    PORT = _s.getsockname()[1]
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ["FULFILLMENT_WEBHOOK_URL"] = f"http://127.0.0.1:{PORT}/fulfillment/events"
+os.environ.setdefault("OUTBOX_BACKOFF_SECONDS", "0.05")
+os.environ.setdefault("OUTBOX_MAX_BACKOFF_SECONDS", "1")
+os.environ.setdefault("OUTBOX_TIMEOUT_SECONDS", "5")
+os.environ.setdefault("OUTBOX_MAX_ATTEMPTS", "1000")
+sys.path.append(os.getcwd())
+
+import uvicorn
+from backend.database import engine, Base, SessionLocal
+from backend.models import Medicine
+from backend.tools import place_order
+from backend.outbox import start_outbox_dispatcher, outbox_stats
+from backend import fulfillment_stub
+
+SKU = "Benchmarkol 500mg"
+
+
+def seed(orders):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(Medicine(name=SKU, dosage="500mg", stock=orders * 10, unit="tablets", price=1.0))
+    db.commit()
+    db.close()
+
+
+def serve_stub():
+    server = uvicorn.Server(uvicorn.Config(fulfillment_stub.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+
+def place(count, offset):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        result = place_order(f"User{(offset + i) % 50}", SKU, 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert result.startswith("Order success"), result
+    latencies.sort()
+    return {"p50_ms": round(statistics.median(latencies), 2),
+            "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+            "max_ms": round(latencies[-1], 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure order latency while the fulfillment endpoint is slow or down.")
+    parser.add_argument("--orders", type=int, default=300, help="orders per phase")
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--reject-rate", type=float, default=0.0)
+    parser.add_argument("--hold", type=float, default=3.0, help="seconds each phase lasts after its orders")
+    args = parser.parse_args()
+
+    seed(args.orders * 3 + 1)
+    serve_stub()
+    start_outbox_dispatcher()
+    place(1, 0)  # builds the name indexes outside the timed phases
+
+    phases = [("healthy", {"latency_ms": 0, "failure_rate": 0}),
+              ("slow", {"latency_ms": args.slow_ms, "failure_rate": 0}),
+              ("down", {"latency_ms": 0, "failure_rate": 1.0})]
+    fulfillment_stub.mode["reject_rate"] = args.reject_rate
+    for i, (name, mode) in enumerate(phases):
+        fulfillment_stub.mode.update(mode)
+        latency = place(args.orders, i * args.orders)
+        time.sleep(args.hold)
+        print(f"{name:8s} order latency {latency}  outbox {outbox_stats()['pending']} pending "
+              f"(stub requests {fulfillment_stub.stats['requests']}, failed {fulfillment_stub.stats['failed_requests']})")
+
+    fulfillment_stub.mode.update(latency_ms=0, failure_rate=0)
+    start = time.perf_counter()
+    while outbox_stats()["pending"] and time.perf_counter() - start < 120:
+        time.sleep(0.05)
+    drained = time.perf_counter() - start
+    stats = outbox_stats()
+    received = len(fulfillment_stub._received)
+    total = args.orders * len(phases) + 1
+    print(f"drained in {drained:.2f}s: delivered={stats['delivered']} dead={stats['dead']} pending={stats['pending']}")
+    print(f"stub: received={received} duplicates={fulfillment_stub.stats['duplicates']} "
+          f"failed_requests={fulfillment_stub.stats['failed_requests']} requests={fulfillment_stub.stats['requests']}")
+    print(f"consistent={stats['delivered'] + stats['dead'] == total and received == stats['delivered']}")
@@ -0,0 +1,53 @@
+"""
+Benchmark: per-call latency of the knowledge base lookup.
+
+Compares the old behaviour (new Chroma client + new OllamaEmbeddings on every call)
+against the process-wide store with the query-embedding cache.
+Requires a running Ollama with 'nomic-embed-text' and an initialized data/chroma_db.
+
+Usage: python bench_rag.py [iterations]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.getcwd())
+
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+from backend import rag
+
+QUERIES = [
+    "Is there a drug interaction between Ibuprofen and Aspirin?",
+    "Is there a drug interaction between Warfarin and Paracetamol?",
+    "Side effects of Metformin",
+    "Is there a drug interaction between Atorvastatin and Azithromycin?",
+]
+
+
+def uncached_query(query):
+    # Mirrors the previous get_retriever(): everything rebuilt per call
+    store = Chroma(persist_directory=rag.DB_DIR, embedding_function=OllamaEmbeddings(model="nomic-embed-text"))
+    docs = store.as_retriever(search_kwargs={"k": 2}).invoke(query)
+    return "\n\n".join(d.page_content for d in docs)
+
+
+def measure(label, fn, iterations):
+    timings = []
+    for i in range(iterations):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<28} mean={statistics.mean(timings):8.2f}ms  "
+          f"p50={timings[len(timings) // 2]:8.2f}ms  max={timings[-1]:8.2f}ms")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    print(f"Running {iterations} lookups per mode ({len(QUERIES)} distinct queries)...")
+    measure("before (per-call client)", uncached_query, iterations)
+    measure("after (shared store)", rag.query_knowledge_base, iterations)
+    print(f"Embedding cache: {rag.get_embeddings().stats()}")
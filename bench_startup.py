@@ -0,0 +1,166 @@
+"""
+Benchmark: API cold start.
+
+Each run starts a fresh process and measures:
+  import_s - time to import backend.main (no Ollama client or graph is built at import)
+  listen_s - process start until the port answers /health
+  ready_s  - process start until /ready returns 200 (agent, indexes, knowledge base, model priming)
+
+Servers use the fake Ollama models from bench_fakes.py and a scratch database built from data/*.csv.
+The first run also embeds the knowledge base into an empty Chroma directory; later runs reuse it,
+like a rolling restart.
+
+Usage: python bench_startup.py [--runs 5] [--llm-latency-ms 300] [--out startup.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import backend.main
+print(time.perf_counter() - start)
+"""
+
+SERVER_CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+import bench_fakes
+bench_fakes.install(llm_latency_ms={llm_latency_ms}, embed_latency_ms={embed_latency_ms})
+print(time.time(), flush=True)
+import backend.main
+from backend import rag
+rag.DB_DIR = {chroma_dir!r}
+import uvicorn
+uvicorn.run(backend.main.app, host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def status_of(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def get_json(url: str) -> dict:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as r:
+            return json.load(r)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+
+def prepare(tmp_dir) -> dict:
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+               CHECKPOINT_DB=os.path.join(tmp_dir, "checkpoints.sqlite"),
+               PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, os.path.join(ROOT, "backend", "init_db.py"),
+                    "--medicines", os.path.join(ROOT, "data", "medicine_data.csv"),
+                    "--history", os.path.join(ROOT, "data", "order_history.csv")],
+                   env=env, cwd=tmp_dir, check=True, capture_output=True)
+    return env
+
+
+def measure_import(env, cwd) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_CHILD.format(root=ROOT)],
+                         env=env, cwd=cwd, check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def measure_server(env, cwd, args, chroma_dir, timeout=120) -> dict:
+    port = free_port()
+    code = SERVER_CHILD.format(root=ROOT, port=port, chroma_dir=chroma_dir,
+                               llm_latency_ms=args.llm_latency_ms, embed_latency_ms=args.embed_latency_ms)
+    proc = subprocess.Popen([sys.executable, "-c", code], env=env, cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        # Timed from when the fakes are installed, so the fake setup isn't counted
+        started = float(proc.stdout.readline())
+        base = f"http://127.0.0.1:{port}"
+        listen = ready = None
+        deadline = time.time() + timeout
+        while ready is None and time.time() < deadline:
+            if listen is None and status_of(base + "/health") == 200:
+                listen = time.time() - started
+            if listen is not None and status_of(base + "/ready") == 200:
+                ready = time.time() - started
+            time.sleep(0.01)
+        steps = get_json(base + "/ready")["steps"] if listen else {}
+        return {"listen_s": round(listen, 3) if listen else None, "ready_s": round(ready, 3) if ready else None,
+                "steps": {name: s.get("seconds") for name, s in steps.items()}}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time, time-to-listen and time-to-ready.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="pharmacy_startup_")
+    chroma_dir = os.path.join(tmp_dir, "chroma_db")
+    env = prepare(tmp_dir)
+
+    runs = []
+    for i in range(args.runs):
+        run = {"import_s": round(measure_import(env, tmp_dir), 3), **measure_server(env, tmp_dir, args, chroma_dir)}
+        runs.append(run)
+        print(f"run {i + 1}: import {run['import_s']}s  listen {run['listen_s']}s  ready {run['ready_s']}s  "
+              f"steps {run['steps']}")
+
+    def median(key):
+        values = [r[key] for r in runs if r[key] is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "median": {key: median(key) for key in ("import_s", "listen_s", "ready_s")},
+        "runs": runs,
+    }
+    print(f"\nmedian: {results['median']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: bulk stock movements.
+
+Seeds a scratch SQLite database with synthetic SKUs, then applies a generated file of receipts,
+adjustments and returns (by name) through backend.stock_movements and reports line items/second.
+Checks that every SKU's stock equals its starting stock plus its ledger rows.
+
+Usage: python bench_stock_movements.py [lines] [skus] [csv|ndjson] [chunk_size]
+"""
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+
+# Point the backend at a throwaway database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix="pharmacy_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.append(os.getcwd())
+
+import numpy as np
+from sqlalchemy import func
+from backend.database import engine, Base, SessionLocal
+from backend.models import Medicine, StockMovement
+from backend.stock_movements import apply_movements, MOVEMENT_CHUNK_SIZE
+from generate_data import generate_medicines
+
+
+def seed(skus):
+    Base.metadata.create_all(bind=engine)
+    df = generate_medicines(skus)
+    with engine.begin() as conn:
+        conn.execute(Medicine.__table__.insert(), [
+            {"name": name, "dosage": dosage, "stock": int(stock), "unit": unit, "price": 1.0}
+            for name, dosage, stock, unit in zip(df["Medicine Name"], df["Dosage"], df["Stock"], df["Unit"])])
+    return list(df["Medicine Name"])
+
+
+def movements(names, count, fmt):
+    """70% receipts, 20% adjustments (either sign), 10% returns, plus a few unknown names."""
+    rng = np.random.default_rng(11)
+    picks = rng.integers(0, len(names), count)
+    kinds = rng.choice(["receipt", "adjustment", "return"], count, p=[0.7, 0.2, 0.1])
+    quantities = rng.integers(1, 100, count)
+    signs = np.where((kinds == "adjustment") & (rng.random(count) < 0.5), -1, 1)
+    out = io.StringIO()
+    if fmt == "csv":
+        out.write("medicine,quantity,kind,reference\n")
+    for i in range(count):
+        name = names[picks[i]] if i % 1000 else "Unknownol 5mg"
+        ref = f"DN-{i // 5000}"
+        if fmt == "csv":
+            out.write(f"{name},{int(quantities[i] * signs[i])},{kinds[i]},{ref}\n")
+        else:
+            out.write(json.dumps({"medicine": name, "quantity": int(quantities[i] * signs[i]),
+                                  "kind": str(kinds[i]), "reference": ref}) + "\n")
+    out.seek(0)
+    return out
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    skus = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    fmt = sys.argv[3] if len(sys.argv) > 3 else "csv"
+    chunk_size = int(sys.argv[4]) if len(sys.argv) > 4 else MOVEMENT_CHUNK_SIZE
+
+    names = seed(skus)
+    db = SessionLocal()
+    before = dict(db.query(Medicine.id, Medicine.stock).all())
+    db.close()
+    data = movements(names, lines, fmt)
+    print(f"Applying {lines} {fmt} movement lines across {skus} SKUs (chunks of {chunk_size})...")
+
+    start = time.perf_counter()
+    result = apply_movements(data, fmt, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    after = dict(db.query(Medicine.id, Medicine.stock).all())
+    ledger = dict(db.query(StockMovement.medicine_id, func.sum(StockMovement.quantity))
+                  .group_by(StockMovement.medicine_id).all())
+    db.close()
+    mismatched = sum(after[m] != before[m] + ledger.get(m, 0) for m in after)
+
+    print(f"applied={result['applied']} rejected={result['rejected']} medicines={result['medicines']}")
+    print(f"ledger_consistent={mismatched == 0} negative_stock={sum(s < 0 for s in after.values())}")
+    print(f"throughput={lines / elapsed:.0f} lines/sec ({elapsed:.2f}s)")
+    if result["errors"]:
+        print("Sample error:", result["errors"][0])
@@ -24,14 +24,114 @@ export const chatWithAgent = async (message, threadId = "default") => {
     }
 };
 
+// Streams agent events from /chat/stream (SSE over POST).
+// onToken is called with each text chunk; resolves with the final response text.
+export const streamChatWithAgent = async (message, threadId = "default", onToken = () => {}) => {
+    try {
+        const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                "ngrok-skip-browser-warning": "true"
+            },
+            body: JSON.stringify({ message, thread_id: threadId })
+        });
+        if (!response.ok || !response.body) {
+            return await chatWithAgent(message, threadId);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamed = '';
+        let final = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                if (!raw.startsWith('data: ')) continue;
+                const event = JSON.parse(raw.slice(6));
+                if (event.type === 'token') {
+                    streamed += event.content;
+                    onToken(event.content);
+                } else if (event.type === 'done') {
+                    final = event.response;
+                } else if (event.type === 'error') {
+                    return "Error communicating with the pharmacy agent.";
+                }
+            }
+        }
+        return final ?? streamed;
+    } catch (error) {
+        console.error("Chat stream error", error);
+        return "Error communicating with the pharmacy agent.";
+    }
+};
+
 export const getInventory = async () => {
     const response = await api.get(`/inventory`);
     return response.data;
 };
 
-export const getOrderHistory = async () => {
-    const response = await api.get(`/history`);
-    return response.data;
+// One page of order history (newest first). Pass the previous page's next_cursor for older rows.
+export const getOrderHistory = async (cursor = null, limit = 100) => {
+    const params = { limit };
+    if (cursor !== null) params.cursor = cursor;
+    const response = await api.get(`/history`, { params });
+    return response.data; // { items, has_more, next_cursor, latest_id }
+};
+
+// Subscribes to the admin change feed (/changes/stream, SSE).
+// onEvent receives { id, type: 'order' | 'stock' | 'alert', data }; onConnect runs on every (re)connect,
+// so callers can refresh snapshots. Reconnects from the last seen event id. Returns an unsubscribe function.
+export const subscribeToChanges = (onEvent, onConnect = () => {}) => {
+    const controller = new AbortController();
+    let lastId = null;
+
+    const connect = async () => {
+        while (!controller.signal.aborted) {
+            try {
+                const query = lastId !== null ? `?since_id=${lastId}` : '';
+                const response = await fetch(`${API_BASE_URL}/changes/stream${query}`, {
+                    headers: { "ngrok-skip-browser-warning": "true" },
+                    signal: controller.signal
+                });
+                if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+                onConnect();
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    for (const raw of events) {
+                        const data = raw.split('\n').find((line) => line.startsWith('data: '));
+                        if (!data) continue; // comments / keepalives
+                        const event = JSON.parse(data.slice(6));
+                        lastId = event.id;
+                        onEvent(event);
+                    }
+                }
+            } catch (error) {
+                if (controller.signal.aborted) return;
+                console.error("Change feed error", error);
+            }
+            await new Promise((resolve) => setTimeout(resolve, 3000));
+        }
+    };
+
+    connect();
+    return () => controller.abort();
 };
 
 export const getAlerts = async () => {
@@ -1,31 +1,80 @@
 import React, { useEffect, useState } from 'react';
-import { getInventory, getAlerts, getOrderHistory, getPatients } from '../api';
+import { getInventory, getAlerts, getOrderHistory, getPatients, subscribeToChanges } from '../api';
 import { AlertTriangle, Package, History, DollarSign, Activity, TrendingUp } from 'lucide-react';
 
 import { Users } from 'lucide-react'; // Import Users icon
 
+const ALERT_REFRESH_MS = 5 * 60 * 1000; // refill alerts also change with the date
+
+const inventoryValue = (items) => items.reduce((acc, item) => acc + (item.stock * (item.price || 0)), 0);
+
 const AdminDashboard = () => {
   const [inventory, setInventory] = useState([]);
   const [alerts, setAlerts] = useState([]);
   const [activeTab, setActiveTab] = useState('inventory');
-  const [totalValue, setTotalValue] = useState(0);
+  const [history, setHistory] = useState([]);
+  const [historyCursor, setHistoryCursor] = useState(null);
+  const [hasMoreHistory, setHasMoreHistory] = useState(false);
 
-  const fetchData = async () => {
+  const fetchInventory = async () => {
     const invData = await getInventory();
     setInventory(invData);
-    
-    // Calculate total inventory value
-    const val = invData.reduce((acc, item) => acc + (item.stock * (item.price || 0)), 0);
-    setTotalValue(val);
+  };
 
+  const fetchAlerts = async () => {
     const alertData = await getAlerts();
     setAlerts(alertData);
   };
 
+  const fetchHistory = async () => {
+    const page = await getOrderHistory();
+    setHistory(page.items);
+    setHistoryCursor(page.next_cursor);
+    setHasMoreHistory(page.has_more);
+  };
+
+  const loadMoreHistory = async () => {
+    const page = await getOrderHistory(historyCursor);
+    setHistory((prev) => [...prev, ...page.items]);
+    setHistoryCursor(page.next_cursor);
+    setHasMoreHistory(page.has_more);
+  };
+
+  // Calculate total inventory value
+  const totalValue = inventoryValue(inventory);
+
+  // Apply pushed changes instead of re-fetching whole tables
+  const handleChange = (event) => {
+    if (event.type === 'order') {
+      setHistory((prev) => (prev.some((h) => h.id === event.data.id) ? prev : [event.data, ...prev]));
+      fetchAlerts();
+    } else if (event.type === 'stock') {
+      setInventory((prev) => prev.map((item) => (item.id === event.data.id ? { ...item, stock: event.data.stock } : item)));
+    } else if (event.type === 'stock_batch') {
+      if (event.data.truncated) {
+        fetchInventory();
+      } else {
+        const stock = new Map(event.data.stock.map((s) => [s.id, s.stock]));
+        setInventory((prev) => prev.map((item) => (stock.has(item.id) ? { ...item, stock: stock.get(item.id) } : item)));
+      }
+      fetchAlerts();
+    } else if (event.type === 'alert') {
+      fetchAlerts();
+    }
+  };
+
   useEffect(() => {
-    fetchData();
-    const interval = setInterval(fetchData, 10000); // 10s refresh
-    return () => clearInterval(interval);
+    // Snapshots are (re)loaded whenever the feed connects, so nothing is missed while disconnected
+    const unsubscribe = subscribeToChanges(handleChange, () => {
+      fetchInventory();
+      fetchAlerts();
+      fetchHistory();
+    });
+    const interval = setInterval(fetchAlerts, ALERT_REFRESH_MS);
+    return () => {
+      unsubscribe();
+      clearInterval(interval);
+    };
   }, []);
 
   return (
@@ -97,7 +146,7 @@ const AdminDashboard = () => {
       <div className="flex-1 overflow-y-auto p-6 bg-black/20 backdrop-blur-sm">
         {activeTab === 'inventory' && <InventoryTable data={inventory} />}
         {activeTab === 'patients' && <PatientsPanel />}
-        {activeTab === 'history' && <HistoryPanel />}
+        {activeTab === 'history' && <HistoryPanel history={history} hasMore={hasMoreHistory} onLoadMore={loadMoreHistory} />}
         {activeTab === 'alerts' && <AlertsPanel alerts={alerts} />}
       </div>
     </div>
@@ -165,19 +214,7 @@ const InventoryTable = ({ data }) => (
   </div>
 );
 
-const HistoryPanel = () => {
-    const [history, setHistory] = useState([]);
-    
-    useEffect(() => {
-        const fetchHistory = async () => {
-             const data = await getOrderHistory();
-             setHistory(data);
-        };
-        fetchHistory();
-        const interval = setInterval(fetchHistory, 10000);
-        return () => clearInterval(interval);
-    }, []);
-
+const HistoryPanel = ({ history, hasMore, onLoadMore }) => {
     if (history.length === 0) return <div className="text-center text-gray-500 mt-10">No records found.</div>;
 
     return (
@@ -199,6 +236,14 @@ const HistoryPanel = () => {
                     </div>
                 </div>
             ))}
+            {hasMore && (
+                <button
+                    onClick={onLoadMore}
+                    className="w-full p-3 rounded-lg border border-white/10 text-gray-300 hover:bg-white/5 transition-all"
+                >
+                    Load older orders
+                </button>
+            )}
         </div>
     );
 };
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Send, Mic, MicOff, Bot, User, Camera, Paperclip, Loader2, Volume2 } from 'lucide-react';
-import { chatWithAgent, uploadPrescription } from '../api';
+import { streamChatWithAgent, uploadPrescription } from '../api';
 
 const ChatComponent = () => {
   const [messages, setMessages] = useState([
@@ -28,10 +28,27 @@ const ChatComponent = () => {
     setInput('');
     setLoading(true);
 
-    const aiResponse = await chatWithAgent(input);
-    const aiMsg = { role: 'ai', content: aiResponse };
-    
-    setMessages(prev => [...prev, aiMsg]);
+    // Show tokens as they arrive; replace with the final answer once the agent finishes
+    let started = false;
+    const updateLast = (content) => setMessages(prev => [...prev.slice(0, -1), { role: 'ai', content }]);
+    let streamed = '';
+
+    const aiResponse = await streamChatWithAgent(input, "default", (token) => {
+      streamed += token;
+      if (!started) {
+        started = true;
+        setLoading(false);
+        setMessages(prev => [...prev, { role: 'ai', content: streamed }]);
+      } else {
+        updateLast(streamed);
+      }
+    });
+
+    if (started) {
+      updateLast(aiResponse);
+    } else {
+      setMessages(prev => [...prev, { role: 'ai', content: aiResponse }]);
+    }
     setLoading(false);
   };
 
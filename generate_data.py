@@ -1,13 +1,10 @@
 import pandas as pd
-import random
-from datetime import datetime, timedelta
+import numpy as np
+import argparse
+from datetime import datetime
 import os
 
-# Create data directory
-os.makedirs("data", exist_ok=True)
-
 # 1. Medicine Master Data
-print("Generating Medicine Master Data...")
 medicines = [
     {"Medicine Name": "Paracetamol", "Dosage": "500mg", "Stock": 100, "Unit": "Tablets", "Prescription Required": "No"},
     {"Medicine Name": "Azithromycin", "Dosage": "500mg", "Stock": 50, "Unit": "Tablets", "Prescription Required": "Yes"},
@@ -21,34 +18,76 @@ medicines = [
     {"Medicine Name": "Losartan", "Dosage": "50mg", "Stock": 40, "Unit": "Tablets", "Prescription Required": "Yes"},
 ]
 
-df_medicines = pd.DataFrame(medicines)
-df_medicines.to_csv("data/medicine_data.csv", index=False)
-print("Saved data/medicine_data.csv")
-
-# 2. Consumer Order History
-print("Generating Consumer Order History...")
-users = ["User1", "User2", "User3", "User4", "User5"]
-history_data = []
-
-# Generate some history over the last 30 days
-for _ in range(50):
-    user = random.choice(users)
-    med = random.choice(medicines)
-    
-    # Random date in last 30 days
-    days_ago = random.randint(1, 30)
-    date_purchased = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
-    
-    qty = random.randint(1, 3) * 10 # Buying strips of 10
-    
-    history_data.append({
-        "Patient ID": user,
-        "Medicine": med["Medicine Name"],
-        "Dosage": med["Dosage"],
-        "Quantity": qty,
-        "Date": date_purchased
-    })
-
-df_history = pd.DataFrame(history_data)
-df_history.to_csv("data/order_history.csv", index=False)
-print("Saved data/order_history.csv")
+STRENGTHS = ["5mg", "10mg", "20mg", "25mg", "50mg", "100mg", "250mg", "500mg"]
+
+
+def generate_medicines(count):
+    """The base list, plus synthetic SKUs (base name + strength + variant) when count is larger."""
+    rows = list(medicines[:count])
+    if count > len(rows):
+        rng = np.random.default_rng(7)
+        n = count - len(rows)
+        idx = np.arange(n)
+        base = np.array([m["Medicine Name"] for m in medicines])[idx % len(medicines)]
+        strength = np.array(STRENGTHS)[(idx // len(medicines)) % len(STRENGTHS)]
+        variant = idx // (len(medicines) * len(STRENGTHS))
+        extra = pd.DataFrame({
+            "Medicine Name": pd.Series(base) + " " + pd.Series(strength) + " V" + pd.Series(variant).astype(str),
+            "Dosage": strength,
+            "Stock": rng.integers(0, 1000, n),
+            "Unit": np.where(idx % 3 == 0, "Capsules", "Tablets"),
+            "Prescription Required": np.where(rng.random(n) < 0.4, "Yes", "No"),
+        })
+        return pd.concat([pd.DataFrame(rows), extra], ignore_index=True)
+    return pd.DataFrame(rows)
+
+
+def generate_history(count, users, df_medicines, days=30, chunk_size=500000):
+    """Yields history DataFrames in chunks so millions of rows don't have to fit in memory at once."""
+    rng = np.random.default_rng(42)
+    today = np.datetime64(datetime.now().date())
+    names = df_medicines["Medicine Name"].to_numpy()
+    dosages = df_medicines["Dosage"].to_numpy()
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        med_idx = rng.integers(0, len(names), n)
+        # Random date in last `days` days
+        dates = today - rng.integers(1, days + 1, n).astype("timedelta64[D]")
+        yield pd.DataFrame({
+            "Patient ID": np.array(users)[rng.integers(0, len(users), n)],
+            "Medicine": names[med_idx],
+            "Dosage": dosages[med_idx],
+            "Quantity": rng.integers(1, 4, n) * 10,  # Buying strips of 10
+            "Date": pd.to_datetime(dates).strftime("%Y-%m-%d"),
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate mock pharmacy data (scale up for load fixtures).")
+    parser.add_argument("--medicines", type=int, default=len(medicines), help="number of SKUs")
+    parser.add_argument("--history", type=int, default=50, help="number of order history rows")
+    parser.add_argument("--patients", type=int, default=5, help="number of distinct patient ids")
+    parser.add_argument("--days", type=int, default=30, help="history spans the last N days")
+    parser.add_argument("--out-dir", default="data")
+    args = parser.parse_args()
+
+    # Create data directory
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    print("Generating Medicine Master Data...")
+    df_medicines = generate_medicines(args.medicines)
+    med_path = os.path.join(args.out_dir, "medicine_data.csv")
+    df_medicines.to_csv(med_path, index=False)
+    print(f"Saved {med_path} ({len(df_medicines)} rows)")
+
+    # 2. Consumer Order History
+    print("Generating Consumer Order History...")
+    users = [f"User{i + 1}" for i in range(args.patients)]
+    hist_path = os.path.join(args.out_dir, "order_history.csv")
+    for i, chunk in enumerate(generate_history(args.history, users, df_medicines, args.days)):
+        chunk.to_csv(hist_path, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+    print(f"Saved {hist_path} ({args.history} rows)")
+
+
+if __name__ == "__main__":
+    main()
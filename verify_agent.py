@@ -7,30 +7,31 @@ sys.path.append(os.getcwd())
 
 load_dotenv()
 
-# Verify GOOGLE_API_KEY is present
-if not os.getenv("GOOGLE_API_KEY"):
-    print("Error: GOOGLE_API_KEY not found in environment variables.")
-    # For testing purposes, we might want to fail gracefully or prompt
-    # But strictly for this verification, we need it.
+# --fake runs the agent against the scripted models in bench_fakes.py (no Ollama needed)
+if "--fake" in sys.argv:
+    import bench_fakes
+    bench_fakes.install(llm_latency_ms=0, embed_latency_ms=0)
+    print("Using fake Ollama models.")
 else:
-    print(f"GOOGLE_API_KEY found: {os.getenv('GOOGLE_API_KEY')[:5]}...")
+    print("Using local Ollama (ollama serve must be running).")
 
 try:
-    from backend.agents import pharmacy_graph
-    
+    from backend.agents import get_pharmacy_graph
+    pharmacy_graph = get_pharmacy_graph()
+
     print("Agent loaded successfully.")
-    
+
     # Test message
     config = {"configurable": {"thread_id": "test_thread"}}
     input_message = {"messages": [("user", "Hello, do you have Paracetamol in stock?")]}
-    
+
     print("Sending query to agent...")
     result = pharmacy_graph.invoke(input_message, config=config)
-    
+
     print("\nResponse:")
     for m in result['messages']:
         print(f"{m.type}: {m.content}")
-        
+
 except Exception as e:
     print(f"Error running agent: {e}")
     import traceback